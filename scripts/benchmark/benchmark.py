@@ -0,0 +1,737 @@
+#!/usr/bin/env python3
+'''
+Benchmarks of the document generation path, on synthetic but realistically shaped
+documents. The ingest-api and entity-api endpoints the portal transformation calls
+are answered by a local stand-in after a configurable latency, so the benchmarks
+can run anywhere and measure the cost of the calls as well as of the CPU work.
+
+This is a development tool, kept out of the hubmap_translation package so it is neither
+installed nor imported by search-api. Run it from the root of the repository with the src
+directory on the path, e.g.
+
+    PYTHONPATH=src python scripts/benchmark/benchmark.py public-derivation --entities 20 --descendants 100
+    PYTHONPATH=src python scripts/benchmark/benchmark.py --latency-ms 0 doc-path --profile memory
+    PYTHONPATH=src python scripts/benchmark/benchmark.py --latency-ms 0 codec --descendants 2000 --files 5000
+    PYTHONPATH=src python scripts/benchmark/benchmark.py exclusions
+    PYTHONPATH=src python scripts/benchmark/benchmark.py --latency-ms 0 transform-stages
+    PYTHONPATH=src python scripts/benchmark/benchmark.py soft-assay --datasets 20 --descendants 10
+    PYTHONPATH=src python scripts/benchmark/benchmark.py --latency-ms 0 shared-relatives
+    PYTHONPATH=src python scripts/benchmark/benchmark.py transform-batch --batch-size 50
+    PYTHONPATH=src python scripts/benchmark/benchmark.py transform-processes --processes 0 2 4 8
+'''
+
+import argparse
+import cProfile
+import hashlib
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from hubmap_translation.addl_index_transformations.portal import (
+    transform, transform_batch, refresh_relative_fields, get_transform_context, get_soft_assay_cache,
+    prefetch_assay_details, get_fragment_cache, set_transform_processes
+)
+from hubmap_translation import json_codec
+from hubmap_translation.bulk_writer import serialize_document
+from hubmap_translation.public_exclusions import ExclusionPlan, remove_fields
+
+ORGAN_MAP = {
+    'LY': {'term': 'Lymph Node', 'organ_uberon': 'UBERON:0000029'},
+    'RK': {'term': 'Kidney (Right)', 'organ_uberon': 'UBERON:0004539'},
+}
+
+SOFT_ASSAY_RESPONSE = {
+    'assaytype': 'salmon_rnaseq_10x',
+    'description': 'scRNA-seq (10x Genomics) [Salmon]',
+    'dataset-type': 'RNAseq',
+    'pipeline-shorthand': 'Salmon',
+    'vitessce-hints': ['is_sc', 'rna'],
+    'contains-pii': False,
+    'primary': False,
+}
+
+# The response for a raw dataset, which is not visualizable itself, so its descendants are checked
+RAW_SOFT_ASSAY_RESPONSE = {
+    'assaytype': 'sciRNAseq',
+    'description': 'sciRNA-seq',
+    'dir-schema': 'scrnaseq-v0',
+    'vitessce-hints': [],
+    'contains-pii': True,
+    'primary': True,
+}
+
+# Public document exclusion rules of the shape of those of the entity-api provenance_schema.yaml,
+# as supplemented by Translator.supplement_public_doc_exclusion_dict()
+_DONOR_EXCLUSIONS = ['lab_donor_id', 'label', {'metadata': [{'organ_donor_data': ['grouping_code']}, 'lab_id']}]
+_SAMPLE_EXCLUSIONS = ['lab_tissue_sample_id', {'metadata': ['lab_id', 'slide_id']}]
+DATASET_EXCLUSIONS = [
+    'lab_dataset_id',
+    {'metadata': ['field_0', 'field_4', 'field_8']},
+    {'ingest_metadata': {'metadata': ['lab_id', 'slide_id']}},
+    {'donor': _DONOR_EXCLUSIONS},
+    {'donors': _DONOR_EXCLUSIONS},
+    {'origin_samples': _SAMPLE_EXCLUSIONS},
+    {'source_samples': _SAMPLE_EXCLUSIONS},
+    {'ancestors': _SAMPLE_EXCLUSIONS + _DONOR_EXCLUSIONS},
+]
+
+
+class _StandInAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.count_request()
+        time.sleep(self.server.latency_seconds)
+        uuid = self.path.rsplit('/', 1)[-1]
+        if self.path.startswith('/assaytype/'):
+            body = self.server.soft_assay_responses.get(uuid, SOFT_ASSAY_RESPONSE)
+        elif self.path.startswith('/descendants/'):
+            body = self.server.descendants.get(uuid, [])
+        else:
+            # parents
+            body = []
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInAPI(ThreadingHTTPServer):
+    '''
+    A local stand-in for the ingest-api soft assay endpoint and the entity-api
+    descendants and parents endpoints, which answers every call after latency_seconds.
+    The soft assay responses and descendants of particular uuids can be set in
+    soft_assay_responses and descendants.
+    '''
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, latency_seconds):
+        super().__init__(('127.0.0.1', 0), _StandInAPIHandler)
+        self.latency_seconds = latency_seconds
+        self.request_count = 0
+        self.soft_assay_responses = {}
+        self.descendants = {}
+        self._count_lock = threading.Lock()
+
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def transformation_resources(self):
+        base_url = f'http://127.0.0.1:{self.server_address[1]}'
+        return {
+            'ingest_api_soft_assay_url': f'{base_url}/assaytype',
+            'descendants_url': f'{base_url}/descendants',
+            'parents_url': f'{base_url}/parents',
+            'token': 'benchmark',
+            'organ_map': ORGAN_MAP,
+        }
+
+
+def _uuid(rng):
+    return '%032x' % rng.getrandbits(128)
+
+
+def _metadata(rng, field_count):
+    metadata = {}
+    for i in range(field_count):
+        kind = i % 4
+        if kind == 0:
+            metadata[f'field_{i}'] = str(rng.randint(0, 1000))
+        elif kind == 1:
+            metadata[f'field_{i}_value'] = f'{rng.random() * 100:.3f}'
+        elif kind == 2:
+            metadata[f'is_field_{i}'] = rng.choice(['true', 'false'])
+        else:
+            metadata[f'field_{i}'] = rng.choice(['Not applicable', 'V11L05-326', 'snap-frozen'])
+    return metadata
+
+
+def _donor(rng):
+    return {
+        'uuid': _uuid(rng),
+        'entity_type': 'Donor',
+        'hubmap_id': f'HBM{rng.randint(100, 999)}.ABCD.{rng.randint(100, 999)}',
+        'data_access_level': 'public',
+        'metadata': {
+            'organ_donor_data': [
+                {'data_type': 'Nominal', 'grouping_concept_preferred_term': 'Sex',
+                 'preferred_term': rng.choice(['Male', 'Female'])},
+                {'data_type': 'Numeric', 'grouping_concept_preferred_term': 'Age',
+                 'data_value': str(rng.randint(20, 80)), 'units': 'years'},
+                {'data_type': 'Nominal', 'grouping_concept_preferred_term': 'Race',
+                 'preferred_term': 'White'},
+            ]
+        },
+    }
+
+
+def _relative(rng, entity_type, published):
+    relative = {
+        'uuid': _uuid(rng),
+        'entity_type': entity_type,
+        'hubmap_id': f'HBM{rng.randint(100, 999)}.ABCD.{rng.randint(100, 999)}',
+        'created_by_user_displayname': 'Jane Doe',
+        'created_by_user_email': 'jane.doe@example.com',
+        'created_timestamp': 1575489509656,
+        'last_modified_timestamp': 1575489509656 + rng.randint(0, 10**9),
+        'group_name': 'University of Somewhere TMC',
+        'data_access_level': 'public' if published else 'consortium',
+        'status': 'Published' if published else 'QA',
+    }
+    if entity_type == 'Dataset':
+        relative['dataset_type'] = rng.choice(['RNAseq', 'CODEX', 'ATACseq'])
+        relative['creation_action'] = 'Central Process'
+    else:
+        relative['sample_category'] = rng.choice(['block', 'section'])
+    return relative
+
+
+def synthetic_dataset(rng, descendant_count, published_fraction=0.5, metadata_fields=40, file_count=200):
+    '''
+    Return the private document of a published Dataset as _generate_doc() would hand it to the
+    portal transformation, with its Donor, origin Sample, ancestors and descendant_count
+    descendants, of which about published_fraction are published.
+    '''
+    donor = _donor(rng)
+    organ = {**_relative(rng, 'Sample', True), 'sample_category': 'organ', 'organ': 'LY'}
+    ancestors = [donor, organ] + [_relative(rng, 'Sample', True) for _ in range(2)]
+    descendants = [_relative(rng, rng.choice(['Dataset', 'Sample']), rng.random() < published_fraction)
+                   for _ in range(descendant_count)]
+    files = [{
+        'rel_path': f'ometiff-pyramids/stitched/expressions/reg{i}_stitched_expressions.ome.tif',
+        'size': rng.randint(1000, 10**9),
+        'description': 'OME-TIFF pyramid file',
+        'edam_term': 'EDAM_1.24.format_3727',
+        'is_qa_qc': False,
+        'type': 'unknown',
+    } for i in range(file_count)]
+    return {
+        'uuid': _uuid(rng),
+        'entity_type': 'Dataset',
+        'hubmap_id': f'HBM{rng.randint(100, 999)}.ABCD.{rng.randint(100, 999)}',
+        'status': 'Published',
+        'data_access_level': 'public',
+        'creation_action': 'Central Process',
+        'dataset_type': 'RNAseq [Salmon]',
+        'group_name': 'University of Somewhere TMC',
+        'created_timestamp': 1575489509656,
+        'last_modified_timestamp': 1575489509656,
+        'published_timestamp': 1575489509656,
+        'metadata': _metadata(rng, metadata_fields),
+        'files': files,
+        'donor': deepcopy(donor),
+        'donors': [deepcopy(donor)],
+        'origin_samples': [deepcopy(organ)],
+        'ancestors': ancestors,
+        'ancestor_ids': [a['uuid'] for a in ancestors],
+        'immediate_ancestors': [deepcopy(ancestors[-1])],
+        'descendants': descendants,
+        'descendant_ids': [d['uuid'] for d in descendants],
+        'immediate_descendants': deepcopy(descendants[:3]),
+    }
+
+
+def _published(relatives):
+    return [r for r in relatives if r['status'] == 'Published']
+
+
+def _public_input(private_doc):
+    # What _generate_public_doc() hands the transformation: the unpublished descendants removed
+    public_doc = deepcopy(private_doc)
+    public_doc['descendants'] = _published(public_doc['descendants'])
+    public_doc['immediate_descendants'] = _published(public_doc['immediate_descendants'])
+    return public_doc
+
+
+def _derive_public(transformed_doc, private_doc):
+    # What Translator._derive_public_transformed_doc() does with the transformed private document
+    public_uuids = {d['uuid'] for d in _published(private_doc['descendants'])}
+    public_doc = deepcopy(transformed_doc)
+    for field in ['descendants', 'immediate_descendants']:
+        public_doc[field] = [d for d in public_doc[field] if d['uuid'] in public_uuids]
+    refresh_relative_fields(public_doc)
+    return public_doc
+
+
+def _time_per_entity(docs, make_docs, api):
+    api.request_count = 0
+    seconds = []
+    for doc in docs:
+        start = time.perf_counter()
+        make_docs(doc)
+        seconds.append(time.perf_counter() - start)
+    return seconds, api.request_count / len(docs)
+
+
+def _report(name, seconds, calls_per_entity):
+    print(f'{name:<28} mean {1000 * statistics.mean(seconds):8.2f} ms'
+          f'   median {1000 * statistics.median(seconds):8.2f} ms'
+          f'   {calls_per_entity:5.1f} API calls per entity')
+
+
+def public_derivation(args):
+    rng = random.Random(args.seed)
+    docs = [synthetic_dataset(rng, args.descendants) for _ in range(args.entities)]
+    with StandInAPI(args.latency_ms / 1000) as api:
+        resources = api.transformation_resources()
+        # Warm up the connection pools and imports before timing
+        transform(docs[0], resources)
+
+        def transform_twice(doc):
+            return transform(doc, resources), transform(_public_input(doc), resources)
+
+        def transform_once(doc):
+            private_transformed = transform(doc, resources)
+            return private_transformed, _derive_public(private_transformed, doc)
+
+        before, before_calls = _time_per_entity(docs, transform_twice, api)
+        after, after_calls = _time_per_entity(docs, transform_once, api)
+
+    print(f'{args.entities} public Datasets with {args.descendants} descendants each,'
+          f' {args.latency_ms} ms API latency')
+    _report('transform private + public', before, before_calls)
+    _report('transform private, derive', after, after_calls)
+    saved = statistics.mean(before) - statistics.mean(after)
+    print(f'Saved {1000 * saved:.2f} ms per entity ({100 * saved / statistics.mean(before):.1f}%)')
+
+
+def _legacy_serialize(document):
+    # How documents were hashed and serialized before serialize_document()
+    hashed = {k: v for k, v in document.items() if k != 'content_hash'}
+    hashed['mapper_metadata'] = {k: v for k, v in hashed['mapper_metadata'].items() if k != 'datetime'}
+    document_hash = hashlib.sha256(json.dumps(hashed, sort_keys=True, separators=(',', ':'),
+                                              default=str).encode('utf-8')).hexdigest()
+    return json.dumps({**document, 'content_hash': document_hash}).encode('utf-8')
+
+
+def _legacy_doc_path(doc, resources):
+    # Copy the entity to enrich it, copy it again to project it, and round-trip it through JSON to
+    # hand it to the transformation, which copies it and serializes it for its size. Then copy the
+    # result to derive the public document, and serialize both once more to write them.
+    enriched = deepcopy(doc)
+    private_doc = json.loads(json.dumps(deepcopy(enriched)))
+    private_transformed = transform(private_doc, resources)
+    public_doc = _derive_public(private_transformed, enriched)
+    return _legacy_serialize(private_transformed), _legacy_serialize(public_doc)
+
+
+def _owned_doc_path(doc, resources):
+    # Enrich and project without copying, let the transformation make the one copy it modifies,
+    # serialize the private document once, then derive the public one from it in place.
+    private_doc = dict(doc)
+    private_transformed = transform(private_doc, resources, add_size=False)
+    private_serialized, _ = serialize_document(private_transformed)
+    public_uuids = {d['uuid'] for d in _published(doc['descendants'])}
+    for field in ['descendants', 'immediate_descendants']:
+        private_transformed[field] = [d for d in private_transformed[field] if d['uuid'] in public_uuids]
+    refresh_relative_fields(private_transformed)
+    public_serialized, _ = serialize_document(private_transformed)
+    return private_serialized, public_serialized
+
+
+def _profile(name, docs, doc_path, resources, kind):
+    if kind == 'cpu':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        for doc in docs:
+            doc_path(doc, resources)
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('tottime').print_stats(12)
+        print(f'--- {name}: CPU profile, by time spent in each function')
+        print(out.getvalue())
+    else:
+        tracemalloc.start()
+        peak = 0
+        for doc in docs:
+            tracemalloc.reset_peak()
+            doc_path(doc, resources)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        print(f'--- {name}: peak traced memory {peak / 2**20:.1f} MiB per entity')
+
+
+def doc_path(args):
+    rng = random.Random(args.seed)
+    docs = [synthetic_dataset(rng, args.descendants, file_count=args.files) for _ in range(args.entities)]
+    with StandInAPI(args.latency_ms / 1000) as api:
+        resources = api.transformation_resources()
+        transform(docs[0], resources)
+
+        before, _ = _time_per_entity(docs, lambda doc: _legacy_doc_path(doc, resources), api)
+        after, _ = _time_per_entity(docs, lambda doc: _owned_doc_path(doc, resources), api)
+        print(f'{args.entities} public Datasets with {args.descendants} descendants and {args.files} files each,'
+              f' about {len(json.dumps(docs[0])) / 2**20:.2f} MB of JSON each, {args.latency_ms} ms API latency')
+        _report('copies and JSON round-trips', before, 0)
+        _report('ownership passing', after, 0)
+        saved = statistics.mean(before) - statistics.mean(after)
+        print(f'Saved {1000 * saved:.2f} ms per entity ({100 * saved / statistics.mean(before):.1f}%)')
+
+        if args.profile:
+            _profile('copies and JSON round-trips', docs, _legacy_doc_path, resources, args.profile)
+            _profile('ownership passing', docs, _owned_doc_path, resources, args.profile)
+
+
+def _time_codec(name, function, inputs, repeat, mb):
+    seconds = []
+    for _ in range(repeat):
+        for data in inputs:
+            start = time.perf_counter()
+            function(data)
+            seconds.append(time.perf_counter() - start)
+    print(f'{name:<36} mean {1000 * statistics.mean(seconds):8.2f} ms'
+          f'   {mb / statistics.mean(seconds):7.1f} MB/s')
+
+
+def codec(args):
+    rng = random.Random(args.seed)
+    with StandInAPI(args.latency_ms / 1000) as api:
+        resources = api.transformation_resources()
+        docs = [transform(synthetic_dataset(rng, args.descendants, file_count=args.files), resources)
+                for _ in range(args.entities)]
+    encoded = [json.dumps(doc).encode('utf-8') for doc in docs]
+    mb = statistics.mean(len(e) for e in encoded) / 10**6
+    print(f'{args.entities} transformed portal documents of {mb:.2f} MB on average')
+    _time_codec('json.dumps() then encode', lambda doc: json.dumps(doc).encode('utf-8'), docs, args.repeat, mb)
+    _time_codec('json_codec.dumps()', json_codec.dumps, docs, args.repeat, mb)
+    _time_codec('json.loads()', json.loads, encoded, args.repeat, mb)
+    _time_codec('json_codec.loads()', json_codec.loads, encoded, args.repeat, mb)
+    _time_codec('serialize_document()', serialize_document, docs, args.repeat, mb)
+
+
+def _time_exclusions(name, remove, docs, repeat):
+    seconds = []
+    for _ in range(repeat):
+        # Documents for removing in place are copied before the clock starts
+        inputs = [deepcopy(doc) for doc in docs] if name.endswith('in place') else docs
+        start = time.perf_counter()
+        for doc in inputs:
+            remove(doc)
+        seconds.append((time.perf_counter() - start) / len(docs))
+    print(f'{name:<36} mean {1000 * statistics.mean(seconds):8.3f} ms'
+          f'   {1 / statistics.mean(seconds):9.0f} documents/s')
+    return statistics.mean(seconds)
+
+
+def exclusions(args):
+    rng = random.Random(args.seed)
+    docs = [synthetic_dataset(rng, args.descendants) for _ in range(args.entities)]
+    plan = ExclusionPlan(DATASET_EXCLUSIONS)
+    for doc in docs:
+        assert plan.without(doc) == remove_fields(deepcopy(doc), DATASET_EXCLUSIONS)
+    print(f'{args.entities} public Datasets with {args.descendants} descendants each')
+    legacy = _time_exclusions('remove_fields() in place',
+                              lambda doc: remove_fields(doc, DATASET_EXCLUSIONS), docs, args.repeat)
+    compiled = _time_exclusions('ExclusionPlan.apply() in place', plan.apply, docs, args.repeat)
+    _time_exclusions('ExclusionPlan.without()', plan.without, docs, args.repeat)
+    print(f'The compiled plan removes the same fields {legacy / compiled:.1f} times as fast')
+
+
+def transform_stages(args):
+    rng = random.Random(args.seed)
+    docs = [synthetic_dataset(rng, args.descendants) for _ in range(args.entities)]
+    with StandInAPI(args.latency_ms / 1000) as api:
+        resources = api.transformation_resources()
+        transform(docs[0], resources)
+        context = get_transform_context()
+        with context.run('benchmark'):
+            seconds, calls_per_entity = _time_per_entity(docs, lambda doc: transform(doc, resources), api)
+            timings = context.stage_timings()
+    print(f'{args.entities} public Datasets with {args.descendants} descendants each,'
+          f' {args.latency_ms} ms API latency')
+    _report('transform()', seconds, calls_per_entity)
+    for name, timing in sorted(timings.items(), key=lambda item: item[1]['seconds'], reverse=True):
+        print(f'    {name:<32} {1000 * timing["seconds"] / len(docs):8.3f} ms per document')
+
+
+def _raw_donor_tree(rng, dataset_count, descendant_count):
+    # dataset_count raw sibling Datasets, which all have the same descendant_count published
+    # descendants, none of them visualizable, so every descendant is checked for each sibling.
+    descendants = [_relative(rng, 'Dataset', True) for _ in range(descendant_count)]
+    datasets = []
+    for _ in range(dataset_count):
+        dataset = synthetic_dataset(rng, 0, file_count=10)
+        dataset.update({
+            'dataset_type': 'RNAseq',
+            'creation_action': 'Create Dataset Activity',
+            'descendants': deepcopy(descendants),
+            'descendant_ids': [d['uuid'] for d in descendants],
+        })
+        datasets.append(dataset)
+    return datasets, descendants
+
+
+def soft_assay(args):
+    rng = random.Random(args.seed)
+    datasets, descendants = _raw_donor_tree(rng, args.datasets, args.descendants)
+    cache = get_soft_assay_cache()
+    with StandInAPI(args.latency_ms / 1000) as api:
+        resources = api.transformation_resources()
+        for entity in datasets + descendants:
+            api.soft_assay_responses[entity['uuid']] = RAW_SOFT_ASSAY_RESPONSE
+        for dataset in datasets:
+            api.descendants[dataset['uuid']] = descendants
+        transform(deepcopy(datasets[0]), resources)
+
+        def transform_tree(clear_between_documents, prefetch):
+            cache.clear()
+            api.request_count = 0
+            start = time.perf_counter()
+            if prefetch:
+                prefetch_assay_details([e['uuid'] for e in datasets + descendants], resources)
+            for dataset in datasets:
+                if clear_between_documents:
+                    cache.clear()
+                transform(deepcopy(dataset), resources)
+            return time.perf_counter() - start, api.request_count
+
+        results = [
+            ('no reuse across documents', transform_tree(True, False)),
+            ('shared cache', transform_tree(False, False)),
+            ('shared cache, prefetched', transform_tree(False, True)),
+        ]
+
+    print(f'{args.datasets} raw sibling Datasets with {args.descendants} shared descendants,'
+          f' {args.latency_ms} ms API latency')
+    for name, (seconds, calls) in results:
+        print(f'{name:<28} {1000 * seconds:9.1f} ms   {calls:5d} API calls')
+
+
+def _shared_relative_datasets(rng, dataset_count, ancestor_count):
+    # Datasets of one Donor, which all have the same Donor, organ and other ancestor Samples
+    template = synthetic_dataset(rng, 0, file_count=10)
+    samples = [{**_relative(rng, 'Sample', True), 'metadata': _metadata(rng, 20)} for _ in range(ancestor_count)]
+    template['ancestors'] += samples
+    template['ancestor_ids'] = [a['uuid'] for a in template['ancestors']]
+    template['source_samples'] = deepcopy(samples[-1:])
+    datasets = []
+    for _ in range(dataset_count):
+        dataset = deepcopy(template)
+        dataset['uuid'] = _uuid(rng)
+        datasets.append(dataset)
+    return datasets
+
+
+def shared_relatives(args):
+    rng = random.Random(args.seed)
+    docs = _shared_relative_datasets(rng, args.entities, args.ancestors)
+    cache = get_fragment_cache()
+    with StandInAPI(args.latency_ms / 1000) as api:
+        resources = api.transformation_resources()
+        # Fetch the soft assay details of every Dataset before timing
+        for doc in docs:
+            transform(doc, resources)
+        context = get_transform_context()
+        results = []
+        for name, clear_between_documents in [('translated per document', True),
+                                              ('reused', False)]:
+            with context.run('benchmark'):
+                cache.clear()
+
+                def transform_doc(doc):
+                    if clear_between_documents:
+                        cache.clear()
+                    return transform(doc, resources)
+                seconds, calls_per_entity = _time_per_entity(docs, transform_doc, api)
+                translate_seconds = context.stage_timings()['translate']['seconds']
+            results.append((name, seconds, calls_per_entity, translate_seconds))
+    print(f'{args.entities} Datasets of one Donor with {args.ancestors} shared ancestor Samples,'
+          f' {args.latency_ms} ms API latency')
+    for name, seconds, calls_per_entity, translate_seconds in results:
+        _report(f'relatives {name}', seconds, calls_per_entity)
+        print(f'    translate() {1000 * translate_seconds / len(docs):8.3f} ms per document')
+
+
+def batch(args):
+    rng = random.Random(args.seed)
+    docs = [synthetic_dataset(rng, args.descendants) for _ in range(args.entities)]
+    with StandInAPI(args.latency_ms / 1000) as api:
+        resources = api.transformation_resources()
+        transform(deepcopy(docs[0]), resources)
+
+        def transform_docs(transform_all):
+            get_soft_assay_cache().clear()
+            get_fragment_cache().clear()
+            api.request_count = 0
+            start = time.perf_counter()
+            transform_all()
+            return time.perf_counter() - start, api.request_count
+
+        def transform_batches():
+            for batch_start in range(0, len(docs), args.batch_size):
+                transform_batch(docs[batch_start:batch_start + args.batch_size], resources)
+
+        results = [
+            ('transform()', transform_docs(lambda: [transform(doc, resources) for doc in docs])),
+            (f'transform_batch() of {args.batch_size}', transform_docs(transform_batches)),
+        ]
+    print(f'{args.entities} public Datasets with {args.descendants} descendants each,'
+          f' {args.latency_ms} ms API latency')
+    for name, (seconds, calls) in results:
+        print(f'{name:<28} {len(docs) / seconds:9.1f} documents per second   {calls:5d} API calls')
+
+
+def transform_processes(args):
+    rng = random.Random(args.seed)
+    docs = [synthetic_dataset(rng, args.descendants) for _ in range(args.entities)]
+    with StandInAPI(args.latency_ms / 1000) as api:
+        resources = api.transformation_resources()
+        # Fetch the soft assay details of every Dataset before timing
+        prefetch_assay_details([doc['uuid'] for doc in docs], resources)
+
+        def fetch_doc(doc):
+            # Stands in for the entity-api calls which make the document
+            time.sleep(args.latency_ms / 1000)
+            return doc
+
+        def reindex():
+            # As in Translator.translate_donor_tree(): threads make the documents, which are
+            # transformed in batches as they are ready, and serialized by the bulk writer.
+            def transform_and_serialize(batch_docs):
+                for transformed in transform_batch(batch_docs, resources, add_size=False):
+                    serialize_document(transformed)
+            with ThreadPoolExecutor(max_workers=args.threads) as executor:
+                pending = []
+                for doc in executor.map(fetch_doc, docs):
+                    pending.append(doc)
+                    if len(pending) >= args.batch_size:
+                        transform_and_serialize(pending)
+                        pending = []
+                if pending:
+                    transform_and_serialize(pending)
+
+        results = []
+        for processes in args.processes:
+            set_transform_processes(processes)
+            # Start the workers, which load the partonomy and the rest once, before timing
+            transform_batch(docs[:2 * max(processes, 1)], resources)
+            start = time.perf_counter()
+            reindex()
+            results.append((processes, time.perf_counter() - start))
+        set_transform_processes(0)
+    print(f'{args.entities} public Datasets with {args.descendants} descendants each, in batches of'
+          f' {args.batch_size} made by {args.threads} threads, {args.latency_ms} ms API latency,'
+          f' {os.cpu_count()} CPUs')
+    baseline_seconds = results[0][1]
+    for processes, seconds in results:
+        name = f'{processes} worker processes' if processes else 'in the calling thread'
+        print(f'{name:<28} {len(docs) / seconds:9.1f} documents per second'
+              f'   {baseline_seconds / seconds:5.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=20,
+                        help='Latency of each call to the stand-in APIs')
+    subparsers = parser.add_subparsers(required=True)
+
+    public_derivation_parser = subparsers.add_parser(
+        'public-derivation',
+        help='Transform the private and public portal documents of an entity,'
+             ' against transforming the private one and deriving the public one')
+    public_derivation_parser.add_argument('--entities', type=int, default=20)
+    public_derivation_parser.add_argument('--descendants', type=int, default=100)
+    public_derivation_parser.set_defaults(run=public_derivation)
+
+    doc_path_parser = subparsers.add_parser(
+        'doc-path',
+        help='Make, transform and serialize the private and public portal documents of an entity,'
+             ' with copies and JSON round-trips at each step against passing ownership of one copy')
+    doc_path_parser.add_argument('--entities', type=int, default=20)
+    doc_path_parser.add_argument('--descendants', type=int, default=100)
+    doc_path_parser.add_argument('--files', type=int, default=2000)
+    doc_path_parser.add_argument('--profile', choices=['cpu', 'memory'],
+                                 help='Also profile each path, with cProfile or tracemalloc')
+    doc_path_parser.set_defaults(run=doc_path)
+
+    codec_parser = subparsers.add_parser(
+        'codec',
+        help='Encode and decode transformed portal documents with the json module and with json_codec')
+    codec_parser.add_argument('--entities', type=int, default=5)
+    codec_parser.add_argument('--descendants', type=int, default=2000)
+    codec_parser.add_argument('--files', type=int, default=5000)
+    codec_parser.add_argument('--repeat', type=int, default=5)
+    codec_parser.set_defaults(run=codec)
+
+    exclusions_parser = subparsers.add_parser(
+        'exclusions',
+        help='Remove the public document exclusions with remove_fields() and with a compiled ExclusionPlan')
+    exclusions_parser.add_argument('--entities', type=int, default=50)
+    exclusions_parser.add_argument('--descendants', type=int, default=100)
+    exclusions_parser.add_argument('--repeat', type=int, default=20)
+    exclusions_parser.set_defaults(run=exclusions)
+
+    transform_stages_parser = subparsers.add_parser(
+        'transform-stages',
+        help='Transform portal documents and break down the time spent in each stage of transform()')
+    transform_stages_parser.add_argument('--entities', type=int, default=200)
+    transform_stages_parser.add_argument('--descendants', type=int, default=20)
+    transform_stages_parser.set_defaults(run=transform_stages)
+
+    soft_assay_parser = subparsers.add_parser(
+        'soft-assay',
+        help='Transform the raw Datasets of a donor tree, with and without the soft assay cache and prefetching')
+    soft_assay_parser.add_argument('--datasets', type=int, default=20)
+    soft_assay_parser.add_argument('--descendants', type=int, default=10)
+    soft_assay_parser.set_defaults(run=soft_assay)
+
+    shared_relatives_parser = subparsers.add_parser(
+        'shared-relatives',
+        help='Transform the Datasets of one Donor, translating their shared relatives for each or once')
+    shared_relatives_parser.add_argument('--entities', type=int, default=200)
+    shared_relatives_parser.add_argument('--ancestors', type=int, default=10)
+    shared_relatives_parser.set_defaults(run=shared_relatives)
+
+    batch_parser = subparsers.add_parser(
+        'transform-batch',
+        help='Transform portal documents one at a time with transform() and in batches with transform_batch()')
+    batch_parser.add_argument('--entities', type=int, default=200)
+    batch_parser.add_argument('--descendants', type=int, default=20)
+    batch_parser.add_argument('--batch-size', type=int, default=50)
+    batch_parser.set_defaults(run=batch)
+
+    processes_parser = subparsers.add_parser(
+        'transform-processes',
+        help='Reindex portal documents with their transformations in the calling thread and in worker processes')
+    processes_parser.add_argument('--entities', type=int, default=400)
+    processes_parser.add_argument('--descendants', type=int, default=100)
+    processes_parser.add_argument('--batch-size', type=int, default=50)
+    processes_parser.add_argument('--threads', type=int, default=16,
+                                  help='Threads making the documents, as the Translator does')
+    processes_parser.add_argument('--processes', type=int, nargs='+', default=[0, 1, 2, 4],
+                                  help='Numbers of worker processes to compare, the first being the baseline')
+    processes_parser.set_defaults(run=transform_processes)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
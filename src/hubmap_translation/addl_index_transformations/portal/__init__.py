@@ -4,9 +4,10 @@ from copy import deepcopy
 import logging
 from json import dumps
 import datetime
+import threading
+from concurrent.futures.process import BrokenProcessPool
 
 from yaml import safe_load as load_yaml
-import jsonschema
 
 from hubmap_translation.addl_index_transformations.portal.add_is_integrated import add_is_integrated
 from hubmap_translation.addl_index_transformations.portal.translate import (
@@ -16,7 +17,7 @@ from hubmap_translation.addl_index_transformations.portal.add_counts import (
     add_counts
 )
 from hubmap_translation.addl_index_transformations.portal.add_donor_demographics import (
-    add_donor_demographics
+    add_donor_demographics, _aggregate_donor_demographics
 )
 from hubmap_translation.addl_index_transformations.portal.add_partonomy import (
     add_partonomy
@@ -28,16 +29,43 @@ from hubmap_translation.addl_index_transformations.portal.reset_entity_type impo
     reset_entity_type
 )
 
-from hubmap_translation.addl_index_transformations.portal.add_assay_details import (
-    add_assay_details
+# prefetch_assay_details is used by the Translator for donor trees
+from hubmap_translation.addl_index_transformations.portal.add_assay_details import (  # noqa: F401
+    add_assay_details,
+    prefetch_assay_details,
+    resolve_resources
 )
 
 from hubmap_translation.addl_index_transformations.portal.lift_dataset_metadata_fields import (
     lift_dataset_metadata_fields
 )
 
+from hubmap_translation.addl_index_transformations.portal.transform_context import (
+    TransformContext
+)
 
-def _get_version():
+from hubmap_translation.addl_index_transformations.portal.soft_assay_cache import (
+    get_soft_assay_cache
+)
+
+from hubmap_translation.addl_index_transformations.portal.visualization_memo import (
+    get_visualization_memo
+)
+
+from hubmap_translation.addl_index_transformations.portal.fragment_cache import (
+    get_fragment_cache
+)
+
+from hubmap_translation.addl_index_transformations.portal.metadata_normalization import (
+    get_metadata_normalizer
+)
+
+from hubmap_translation.addl_index_transformations.portal.transform_pool import (
+    TransformPool, running_under_uwsgi
+)
+
+
+def _read_version():
     # Use the generated BUILD (under project root directory) version (git branch name:short commit hash)
     # as Elasticsearch mapper_metadata.version
     build_path = Path(__file__).absolute(
@@ -51,6 +79,33 @@ def _get_version():
     return 'no-build-file'
 
 
+_transform_context = None
+_transform_context_lock = threading.Lock()
+
+
+def get_transform_context():
+    '''
+    Return the TransformContext of this process, which reads the BUILD file
+    and builds the schema validator the first time it is called.
+
+    >>> get_transform_context() is get_transform_context()
+    True
+    '''
+    global _transform_context
+    if _transform_context is None:
+        with _transform_context_lock:
+            if _transform_context is None:
+                _transform_context = TransformContext(
+                    version=_read_version(),
+                    validation_schema=_get_schema(None),
+                    caches=[get_soft_assay_cache(), get_visualization_memo(), get_fragment_cache()])
+    return _transform_context
+
+
+def _get_version():
+    return get_transform_context().version
+
+
 def get_config():
     '''
     >>> es_config = get_config()
@@ -61,123 +116,230 @@ def get_config():
     return load_yaml((Path(__file__).parent / 'config.yaml').read_text())
 
 
-def transform(doc, transformation_resources, batch_id='unspecified'):
+def transform(doc, transformation_resources, batch_id='unspecified', add_size=True, resolved=None):
+    # With add_size=False, mapper_metadata.size is left for the caller to fill
+    # in when it serializes the document, rather than serializing it here.
+    # With resolved, the ResolvedResources of resolve_resources(), what the
+    # document needs from ingest-api and entity-api is looked up there, and
+    # no calls are made. Without it, add_assay_details() makes the calls as it
+    # needs them.
     id_for_log = f'Batch {batch_id}; UUID {doc["uuid"] if "uuid" in doc else "missing"}'
     logging.info(f'Begin: {id_for_log}')
-    doc_copy = deepcopy(doc)
-    # We will modify in place below,
-    # so make a deep copy so we don't surprise the caller.
-    _add_validation_errors(doc_copy)
-    _clean(doc_copy)
+    context = get_transform_context()
+    context.count_document()
+    with context.stage('copy'):
+        # We will modify in place below,
+        # so make a deep copy so we don't surprise the caller.
+        doc_copy = deepcopy(doc)
+    with context.stage('validate'):
+        _add_validation_errors(doc_copy)
+    with context.stage('clean'):
+        _clean(doc_copy)
     doc_copy['transformation_errors'] = []
     organ_map = transformation_resources.get('organ_map', {})
     try:
-        add_assay_details(doc_copy, transformation_resources)
-        lift_dataset_metadata_fields(doc_copy)
-        translate(doc_copy, organ_map)
+        with context.stage('add_assay_details'):
+            add_assay_details(doc_copy, transformation_resources, resolved)
+        with context.stage('lift_dataset_metadata_fields'):
+            lift_dataset_metadata_fields(doc_copy)
+        with context.stage('translate'):
+            translate(doc_copy, organ_map)
     except TranslationException as e:
         logging.error(f'Error: {id_for_log}: {e}')
         return None
-    sort_files(doc_copy)
-    add_counts(doc_copy)
+    with context.stage('sort_files'):
+        sort_files(doc_copy)
+    with context.stage('add_counts'):
+        add_counts(doc_copy)
     # Depends on donor mapped_metadata produced by translate().
-    add_donor_demographics(doc_copy)
-    add_is_integrated(doc_copy)
-    add_partonomy(doc_copy, organ_map)
-    reset_entity_type(doc_copy)
+    with context.stage('add_donor_demographics'):
+        add_donor_demographics(doc_copy)
+    with context.stage('add_is_integrated'):
+        add_is_integrated(doc_copy)
+    with context.stage('add_partonomy'):
+        add_partonomy(doc_copy, organ_map)
+    with context.stage('reset_entity_type'):
+        reset_entity_type(doc_copy)
     if len(doc_copy['transformation_errors']) == 0:
         del doc_copy['transformation_errors']
     doc_copy['mapper_metadata'].update({
-        'version': _get_version(),
-        'datetime': str(datetime.datetime.now()),
-        'size': len(dumps(doc_copy))
+        'version': context.version,
+        'datetime': str(datetime.datetime.now())
     })
+    if add_size:
+        with context.stage('size'):
+            doc_copy['mapper_metadata']['size'] = len(dumps(doc_copy))
     logging.info(f'End: {id_for_log}')
     return doc_copy
 
 
+def transform_batch(docs, transformation_resources, batch_id='unspecified', add_size=True):
+    '''
+    Transform each of docs like transform(), and return the results in the
+    same order. What the documents have in common is looked up once for the
+    batch: what its Datasets need from ingest-api and entity-api is resolved
+    for all of them, concurrently, before any of them is transformed, and the
+    relatives the documents share are translated once.
+
+    After set_transform_processes(), the resolved documents are transformed
+    in worker processes.
+
+    A document transform() raises an exception for is logged, and None is
+    returned for it, so that it does not lose the rest of the batch.
+    '''
+    context = get_transform_context()
+    with context.run(f'batch {batch_id}'):
+        with context.stage('resolve'):
+            resolved = resolve_resources(docs, transformation_resources)
+        transform_pool = _transform_pool
+        if transform_pool is not None and len(docs) > 1:
+            try:
+                transformed_docs = []
+                for chunk_docs, stage_timings, documents in transform_pool.map_chunks(
+                        _transform_chunk, docs, transformation_resources, resolved, batch_id, add_size):
+                    context.add_stage_timings(stage_timings, documents)
+                    transformed_docs.extend(chunk_docs)
+                return transformed_docs
+            except BrokenProcessPool:
+                logging.exception(f'Error: Batch {batch_id}: transforming it in this process instead')
+        return [_transform_or_none(doc, transformation_resources, batch_id, add_size, resolved) for doc in docs]
+
+
+def _transform_or_none(doc, transformation_resources, batch_id, add_size, resolved):
+    try:
+        return transform(doc, transformation_resources, batch_id, add_size, resolved)
+    except Exception:
+        logging.exception(f'Error: Batch {batch_id}; UUID {doc.get("uuid", "missing")}')
+        return None
+
+
+def _transform_chunk(docs, transformation_resources, resolved, batch_id, add_size):
+    # Run in the worker processes of the TransformPool, which send back the
+    # stage timings of the chunk along with the transformed documents.
+    context = get_transform_context()
+    with context.run(f'batch {batch_id}'):
+        transformed_docs = [_transform_or_none(doc, transformation_resources, batch_id, add_size, resolved)
+                            for doc in docs]
+        return transformed_docs, context.stage_timings(), context.documents
+
+
+_transform_pool = None
+_transform_pool_lock = threading.Lock()
+
+
+def set_transform_processes(processes):
+    '''
+    Have transform_batch() transform documents in this many worker processes,
+    or, with 0, in the calling thread. Under uWSGI, documents are always
+    transformed in the calling thread, as the worker processes could not be
+    started: see TransformPool.
+
+    >>> set_transform_processes(0)
+    >>> _transform_pool is None
+    True
+    '''
+    global _transform_pool
+    if processes and running_under_uwsgi():
+        logging.warning(f'Not starting {processes} portal transform processes under uWSGI;'
+                        ' transforming documents in the calling threads.')
+        processes = 0
+    with _transform_pool_lock:
+        if _transform_pool is not None and _transform_pool.processes == processes:
+            return
+        if _transform_pool is not None:
+            _transform_pool.shutdown()
+        _transform_pool = TransformPool(processes) if processes else None
+
+
+def refresh_relative_fields(doc):
+    '''
+    Recompute the fields transform() derives from the relatives of a document,
+    on a document transform() already returned, after relatives or their
+    metadata were removed from it: for example, when the public document is
+    made from the transformed private one by dropping unpublished descendants.
+
+    >>> from pprint import pprint
+    >>> doc = {
+    ...     'entity_type': 'Dataset',
+    ...     'ancestors': [{'entity_type': 'Donor'}],
+    ...     'descendants': [{'entity_type': 'Dataset'}],
+    ...     'ancestor_counts': {'entity_type': {'Donor': 1}},
+    ...     'descendant_counts': {'entity_type': {'Dataset': 3}},
+    ...     'donors': [{'mapped_metadata': {'sex': ['Male']}}],
+    ...     'donor_demographics': {'sex': ['Female', 'Male']},
+    ...     'mapper_metadata': {'size': 1}
+    ... }
+    >>> refresh_relative_fields(doc)
+    >>> pprint(doc['descendant_counts'])
+    {'entity_type': {'Dataset': 1}}
+    >>> pprint(doc['donor_demographics'])
+    {'sex': ['Male']}
+    >>> doc['mapper_metadata']['size'] > 1
+    True
+
+    Entities with no donors left lose their demographics:
+
+    >>> doc = {'entity_type': 'Dataset', 'donor_demographics': {'sex': ['Male']}}
+    >>> refresh_relative_fields(doc)
+    >>> 'donor_demographics' in doc
+    False
+    '''
+    add_counts(doc)
+    # Check for the field rather than the entity_type, which reset_entity_type()
+    # may have changed since add_donor_demographics() ran.
+    if 'donor_demographics' in doc:
+        if doc.get('donors'):
+            doc['donor_demographics'] = _aggregate_donor_demographics(doc['donors'])
+        else:
+            del doc['donor_demographics']
+    add_is_integrated(doc)
+    if 'size' in doc.get('mapper_metadata', {}):
+        doc['mapper_metadata']['size'] = len(dumps(doc))
+
+
 def _clean(doc):
     _map(doc, _simple_clean)
 
 
+_SINGLE_VALUED_FIELDS = ('donor', 'rui_location')
+_MULTI_VALUED_FIELDS = ('ancestors', 'descendants',
+                        'immediate_ancestors', 'immediate_descendants')
+
+
 def _map(doc, clean):
     # The recursion is usually not needed...
     # but better to do it everywhere than to miss one case.
     clean(doc)
 
-    single_valued_fields = ['donor', 'rui_location']
-    multi_valued_fields = ['ancestors', 'descendants',
-                           'immediate_ancestors', 'immediate_descendants']
-
-    for single_doc_field in single_valued_fields:
+    for single_doc_field in _SINGLE_VALUED_FIELDS:
         if single_doc_field in doc:
             fragment = doc[single_doc_field]
             _map(fragment, clean)
-    for multi_doc_field in multi_valued_fields:
+    for multi_doc_field in _MULTI_VALUED_FIELDS:
         if multi_doc_field in doc:
             for fragment in doc[multi_doc_field]:
                 _map(fragment, clean)
 
 
+# Clean up names conservatively,
+# based only on the problems we actually see:
+_NAMES_TO_TITLE_CASE = frozenset([
+    'daniel cotter', 'amir bahmani', 'adam kagel', 'gloria pryhuber'])
+
+
 def _simple_clean(doc):
     # We shouldn't get messy data in the first place...
     # but it's just not feasible to make the fixes upstream.
     if not isinstance(doc, dict):
         return
 
-    # Clean up names conservatively,
-    # based only on the problems we actually see:
     name_field = 'created_by_user_displayname'
-    if doc.get(name_field, '').lower() in [
-            'daniel cotter', 'amir bahmani', 'adam kagel', 'gloria pryhuber']:
+    if doc.get(name_field, '').lower() in _NAMES_TO_TITLE_CASE:
         doc[name_field] = doc[name_field].title()
 
     # Clean up metadata:
     if doc.get('metadata') is not None:
-        metadata = doc['metadata']
-
-        bad_fields = [
-            'collectiontype', 'null',  # Inserted by IEC.
-            # Only meaningful at submission time.
-            'data_path', 'metadata_path', 'version',
-            'donor_id', 'tissue_id'  # For internal use only.
-        ]
-
-        # Ideally, we'd pull from https://github.com/hubmapconsortium/ingest-validation-tools/blob/main/docs/field-types.yaml
-        # here, or make the TSV parsing upstream schema aware,
-        # instead of trying to guess, but I think the number of special cases will be relatively small.
-        not_really_a_number = ['cell_barcode_size', 'cell_barcode_offset']
-
-        # Explicitly convert items to list,
-        # so we can remove keys from the metadata dict:
-        for k, v in list(metadata.items()):
-            if k in bad_fields or k.startswith('_'):
-                del metadata[k]
-                continue
-
-            # Normalize booleans to all-caps, the Excel default.
-            # (There is no guaratee that boolean fields with be prefixed this way,
-            # but at the moment it is the case.)
-            if k.startswith('is_'):
-                if v in ['0', 'false', 'False']:
-                    metadata[k] = 'FALSE'
-                if v in ['1', 'true', 'True']:
-                    metadata[k] = 'TRUE'
-                continue
-
-            # Convert numeric strings to numbers, but only if they look like numbers.
-            # Some organ metadata fields are lists, which raise TypeErrors when we try
-            # to convert them to numbers.
-            if k not in not_really_a_number and not isinstance(v, list):
-                try:
-                    as_number = int(v)
-                except ValueError:
-                    try:
-                        as_number = float(v)
-                    except ValueError:
-                        as_number = None
-                if as_number is not None:
-                    metadata[k] = as_number
+        get_metadata_normalizer().normalize(doc['metadata'])
 
 
 # TODO: Reenable this when we have time, and can make sure we don't need these fields.
@@ -243,8 +405,9 @@ def _add_validation_errors(doc):
     []
 
     '''
-    schema = _get_schema(doc)
-    validator = jsonschema.Draft7Validator(schema)
+    # The schema does not depend on the document,
+    # so the validator is built once, by get_transform_context().
+    validator = get_transform_context().validator
     errors = [
         {
             'message': e.message,
@@ -1,13 +1,23 @@
 import requests
 import logging
 import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
-from portal_visualization.builder_factory import has_visualization
-
 from hubmap_translation.addl_index_transformations.portal.utils import (
     _log_transformation_error
 )
+from hubmap_translation.addl_index_transformations.portal.soft_assay_cache import (
+    get_soft_assay_cache
+)
+from hubmap_translation.addl_index_transformations.portal.visualization_memo import (
+    has_visualization
+)
+from hubmap_translation.addl_index_transformations.portal.resolved_resources import (
+    ResolvedResources
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +31,23 @@ class CreationAction(str, Enum):
     EPIC = 'External Process'
 
 
+# The pipeline in the brackets of a dataset_type, e.g. "RNAseq [Salmon]"
+_PIPELINE_IN_BRACKETS = re.compile("(?<=\\[)[^][]*(?=])")
+# The brackets of a dataset_type, removed for raw_dataset_type
+_BRACKETS = re.compile("\\[(.*?)\\]")
+
+_VISIBLE_DESCENDANT_STATUSES = frozenset(['Published', 'QA', 'Approval', 'Retracted'])
+_VALID_CREATION_ACTIONS = frozenset(enum.value for enum in CreationAction)
+
+# The soft-assay details of the descendants of a dataset which is not visualizable itself are fetched
+# ahead of the check of each descendant, at most this many at a time for one dataset, on an executor
+# of this many threads shared by the transformations of the process.
+_DESCENDANT_PREFETCH_WINDOW = 8
+_DESCENDANT_FETCH_WORKERS = 32
+
+_descendant_executor = None
+_descendant_executor_lock = threading.Lock()
+
 processing_type_map = {
     CreationAction.CENTRAL_PROCESS: 'hubmap',
     CreationAction.LAB_PROCESS: 'lab',
@@ -28,40 +55,133 @@ processing_type_map = {
 }
 
 
-def _get_assay_details(doc, transformation_resources):
+def _request_assay_details(uuid, transformation_resources):
     soft_assay_url = transformation_resources.get('ingest_api_soft_assay_url')
     token = transformation_resources.get('token')
-    uuid = doc.get('uuid')
-    dataset_type = doc.get('dataset_type')
-
     try:
         response = requests.get(
             f'{soft_assay_url}/{uuid}', headers={'Authorization': f'Bearer {token}'})
         response.raise_for_status()
-        json = response.json()
-        if not json:
-            empty_error_msg = 'No soft assay information returned.'
-            return {'description': dataset_type, 'vitessce-hints': ['unknown-assay'], 'error': empty_error_msg}
-        return json
+        return response.json()
     except requests.exceptions.HTTPError as e:
         logger.error(e.response.text)
-        raise e
+        raise
 
 
 def _get_assay_details_by_uuid(uuid, transformation_resources):
-    soft_assay_url = transformation_resources.get('ingest_api_soft_assay_url')
+    return get_soft_assay_cache().get_or_load(
+        (transformation_resources.get('ingest_api_soft_assay_url'), uuid),
+        lambda: _request_assay_details(uuid, transformation_resources))
+
+
+def _request_relatives(url_key, uuid, transformation_resources):
+    relatives_url = transformation_resources.get(url_key)
     token = transformation_resources.get('token')
     try:
         response = requests.get(
-            f'{soft_assay_url}/{uuid}', headers={'Authorization': f'Bearer {token}'})
+            f'{relatives_url}/{uuid}', headers={'Authorization': f'Bearer {token}'})
         response.raise_for_status()
-        json = response.json()
-        return json
+        return response.json()
     except requests.exceptions.HTTPError as e:
         logger.error(e.response.text)
         raise
 
 
+class _FetchedResources:
+    """
+    Looks up what add_assay_details() needs from ingest-api and entity-api, like a
+    ResolvedResources, by calling them as it is needed. Given a ResolvedResources,
+    it records the responses and errors there, for resolve_resources().
+    """
+
+    def __init__(self, transformation_resources, resolved=None):
+        self.transformation_resources = transformation_resources
+        self.resolved = resolved
+
+    def _fetch(self, kind, uuid, fetch):
+        if self.resolved is None:
+            return fetch()
+        try:
+            response = fetch()
+        except requests.exceptions.RequestException as e:
+            self.resolved.add_error(kind, uuid, e)
+            raise
+        self.resolved.add(kind, uuid, response)
+        return response
+
+    def assay_details(self, uuid):
+        return self._fetch('assay_details', uuid,
+                           lambda: _get_assay_details_by_uuid(uuid, self.transformation_resources))
+
+    def descendants(self, uuid):
+        return self._fetch('descendants', uuid,
+                           lambda: _request_relatives('descendants_url', uuid, self.transformation_resources))
+
+    def parents(self, uuid):
+        return self._fetch('parents', uuid,
+                           lambda: _request_relatives('parents_url', uuid, self.transformation_resources))
+
+
+def _get_assay_details(doc, resources):
+    json = resources.assay_details(doc.get('uuid'))
+    if not json:
+        empty_error_msg = 'No soft assay information returned.'
+        return {'description': doc.get('dataset_type'), 'vitessce-hints': ['unknown-assay'], 'error': empty_error_msg}
+    return json
+
+
+def prefetch_assay_details(uuids, transformation_resources, max_workers=8):
+    """
+    Load the soft-assay details of the datasets with the given uuids into the
+    cache of the process concurrently, e.g. for all the datasets of a donor
+    tree before they are transformed. Failures are left for the
+    transformation of the dataset to report.
+    """
+    soft_assay_url = transformation_resources.get('ingest_api_soft_assay_url')
+    cache = get_soft_assay_cache()
+    uuids = [uuid for uuid in dict.fromkeys(uuids) if (soft_assay_url, uuid) not in cache]
+
+    def prefetch(uuid):
+        try:
+            cache.get_or_load(
+                (soft_assay_url, uuid),
+                lambda: _request_assay_details(uuid, transformation_resources),
+                prefetch=True)
+        except requests.exceptions.RequestException as e:
+            logger.debug(f'Unable to prefetch soft assay details of {uuid}: {e}')
+
+    if uuids:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(uuids))) as executor:
+            list(executor.map(prefetch, uuids))
+
+
+def resolve_resources(docs, transformation_resources, max_workers=8):
+    """
+    Fetch what add_assay_details() needs from ingest-api and entity-api for each of the
+    documents, concurrently, and return it as a ResolvedResources for transform(), which
+    then makes no calls. The calls are those add_assay_details() would make, e.g. only the
+    descendants checked until one with a visualization is found, as they are recorded from
+    a run of it on a shallow copy of each Dataset. Its results are discarded: an error is
+    raised again when the document is transformed.
+    """
+    resolved = ResolvedResources()
+    recorder = _FetchedResources(transformation_resources, resolved)
+
+    def resolve(doc):
+        try:
+            add_assay_details(dict(doc, transformation_errors=[]), transformation_resources, recorder)
+        except Exception as e:
+            logger.debug(f'Unable to resolve the resources of {doc.get("uuid")}: {e}')
+
+    datasets = [doc for doc in docs if 'dataset_type' in doc]
+    if len(datasets) == 1:
+        resolve(datasets[0])
+    elif datasets:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(datasets))) as executor:
+            list(executor.map(resolve, datasets))
+    return resolved
+
+
 def _add_dataset_processing_fields(doc):
     if processing_type := processing_type_map.get(doc['creation_action']):
         doc['processing'] = 'processed'
@@ -103,7 +223,7 @@ def _add_dataset_categories(doc, assay_details):
             _log_transformation_error(doc, error_msg)
             return
 
-        if creation_action not in {enum.value for enum in CreationAction}:
+        if creation_action not in _VALID_CREATION_ACTIONS:
             error_msg = f"Unrecognized creation action, {creation_action}."
             _log_transformation_error(doc, error_msg)
             return
@@ -112,45 +232,103 @@ def _add_dataset_categories(doc, assay_details):
         _add_multi_assay_fields(doc, assay_details)
 
 
-def _get_descendants(doc, transformation_resources):
-    descendants_url = transformation_resources.get(
-        'descendants_url')
-    token = transformation_resources.get('token')
-    uuid = doc.get('uuid')
+# The fields of the relatives of a dataset which the visualization checks below read. When every
+# relative in the document has them, e.g. as the Translator leaves them on the descendants and
+# immediate_ancestors of the documents it hands over, the relatives are read from the document;
+# otherwise they are fetched from entity-api.
+_DESCENDANT_FIELDS = frozenset(['uuid', 'entity_type', 'last_modified_timestamp'])
+# Datasets and Publications also have these, which Samples do not
+_DATASET_DESCENDANT_FIELDS = _DESCENDANT_FIELDS | {'status', 'creation_action'}
+_PARENT_FIELDS = frozenset(['uuid', 'entity_type'])
 
-    try:
-        response = requests.get(
-            f'{descendants_url}/{uuid}', headers={'Authorization': f'Bearer {token}'})
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as e:
-        logger.error(e.response.text)
-        raise
 
+def _has_descendant_fields(descendant):
+    if descendant.get('entity_type') in ['Dataset', 'Publication']:
+        return _DATASET_DESCENDANT_FIELDS.issubset(descendant)
+    return _DESCENDANT_FIELDS.issubset(descendant)
 
-def _get_parents(doc, transformation_resources):
-    parents_url = transformation_resources.get(
-        'parents_url')
-    token = transformation_resources.get('token')
-    uuid = doc.get('uuid')
 
-    try:
-        response = requests.get(
-            f'{parents_url}/{uuid}', headers={'Authorization': f'Bearer {token}'})
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as e:
-        logger.error(e.response.text)
-        raise
+def _relatives_in_doc(doc, field, has_fields):
+    relatives = doc.get(field)
+    if relatives is None or not all(isinstance(relative, dict) and has_fields(relative) for relative in relatives):
+        return None
+    # The checks below add the soft assay fields to the relatives they look at
+    return [dict(relative) for relative in relatives]
+
+
+def _get_descendants(doc, resources):
+    descendants = _relatives_in_doc(doc, 'descendants', _has_descendant_fields)
+    if descendants is not None:
+        return descendants
+    return resources.descendants(doc.get('uuid'))
+
+
+def _get_parents(doc, resources):
+    parents = _relatives_in_doc(doc, 'immediate_ancestors', _PARENT_FIELDS.issubset)
+    if parents is not None:
+        return parents
+    return resources.parents(doc.get('uuid'))
 
 
 # Returns an array of all parent datasets, or an empty array if there are no parent datasets or if the parents endpoint is unavailable.
-def _get_parent_datasets(doc, transformation_resources):
-    parents = _get_parents(doc, transformation_resources)
+def _get_parent_datasets(doc, resources):
+    parents = _get_parents(doc, resources)
     datasets = [parent for parent in parents if parent.get('entity_type') == 'Dataset']
     return datasets
 
 
+def _get_descendant_executor():
+    global _descendant_executor
+    if _descendant_executor is None:
+        with _descendant_executor_lock:
+            if _descendant_executor is None:
+                _descendant_executor = ThreadPoolExecutor(
+                    max_workers=_DESCENDANT_FETCH_WORKERS, thread_name_prefix='descendant-assay-details')
+    return _descendant_executor
+
+
+def _first_visualizable_descendant(descendants, get_assay_type, parent_uuid, prefetch=True):
+    """
+    Return the first of the descendants, in the order given, which has a visualization, or None.
+    The soft-assay details of the next descendants are fetched while each one is checked, and
+    the fetches not yet started are cancelled once one is found. As when checking them one at a
+    time, an error fetching the details of a descendant is only raised when it is reached.
+
+    With prefetch=False, e.g. when the details have been resolved already, each descendant is
+    checked in turn.
+    """
+    if not prefetch:
+        for descendant in descendants:
+            _set_soft_assaytype(descendant, get_assay_type(descendant))
+            if has_visualization(descendant, get_assay_type, parent_uuid):
+                return descendant
+        return None
+
+    executor = _get_descendant_executor()
+    remaining = iter(descendants)
+    pending = deque()
+
+    def fetch_next():
+        descendant = next(remaining, None)
+        if descendant is not None:
+            pending.append((descendant, executor.submit(get_assay_type, descendant)))
+
+    for _ in range(_DESCENDANT_PREFETCH_WINDOW):
+        fetch_next()
+    try:
+        while pending:
+            descendant, future = pending.popleft()
+            fetch_next()
+            # Even though the descendant doc gets dropped, the soft assay information is necessary for portal-visualization.
+            _set_soft_assaytype(descendant, future.result())
+            if has_visualization(descendant, get_assay_type, parent_uuid):
+                return descendant
+        return None
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
 def _add_pipeline(doc, assay_details):
     if pipeline := assay_details.get('pipeline-shorthand'):
         doc['pipeline'] = pipeline
@@ -161,7 +339,7 @@ def _add_pipeline(doc, assay_details):
     elif set(['pyramid', 'is_image']).issubset(set(assay_details.get('vitessce-hints'))):
         doc['pipeline'] = 'Image Pyramid'
     # Fallback to get pipeline in the dataset_type's brackets.
-    elif pipeline := re.search("(?<=\\[)[^][]*(?=])", doc.get('dataset_type', '')):
+    elif pipeline := _PIPELINE_IN_BRACKETS.search(doc.get('dataset_type', '')):
         doc['pipeline'] = pipeline.group()
 
 
@@ -174,7 +352,7 @@ def _set_soft_assaytype(doc, assay_details):
     doc['vitessce-hints'] = assay_details.get('vitessce-hints')
 
 
-def add_assay_details(doc, transformation_resources):
+def add_assay_details(doc, transformation_resources, resources=None):
     """
     For datasets, add assay details and derived fields to the document, including:
     - dataset categories (raw vs processed, single vs multi-assay)
@@ -186,12 +364,17 @@ def add_assay_details(doc, transformation_resources):
     Then, determine if the dataset is visualizable by portal-visualization based on its assay details and those of its descendants and parents.
 
     Non-dataset entities do not have assay details and are skipped.
+
+    The details of the dataset and its relatives are looked up in resources, e.g. the
+    ResolvedResources of resolve_resources(), or otherwise fetched as they are needed.
     """
+    if resources is None:
+        resources = _FetchedResources(transformation_resources)
     if 'dataset_type' in doc:
-        assay_details = _get_assay_details(doc, transformation_resources)
+        assay_details = _get_assay_details(doc, resources)
 
-        doc['raw_dataset_type'] = re.sub(
-            "\\[(.*?)\\]", '', doc.get('dataset_type', '')).rstrip()
+        doc['raw_dataset_type'] = _BRACKETS.sub(
+            '', doc.get('dataset_type', '')).rstrip()
 
         _add_dataset_categories(doc, assay_details)
         _add_pipeline(doc, assay_details)
@@ -219,7 +402,7 @@ def add_assay_details(doc, transformation_resources):
             # If an entity doesn't have a visualization,
             # check its descendants for a supporting image pyramid.
             parent_uuid = doc.get('uuid')
-            descendants = _get_descendants(doc, transformation_resources)
+            descendants = _get_descendants(doc, resources)
 
             # Define a function to get the assay details by UUID only to handle parent uuid case
             def get_assay_type_for_descendants(descendant):
@@ -227,28 +410,26 @@ def add_assay_details(doc, transformation_resources):
                     uuid = descendant.get('uuid')
                 except AttributeError:
                     uuid = descendant
-                return _get_assay_details_by_uuid(uuid, transformation_resources)
+                return resources.assay_details(uuid)
 
             # Filter any unpublished/non-QA descendants and multi-assay splits
-            descendants = [descendant for descendant in descendants if [
-                'Published', 'QA', 'Approval', 'Retracted'].count(descendant.get('status')) > 0 and descendant.get('creation_action') != CreationAction.MULTI_ASSAY_SPLIT]
+            descendants = [descendant for descendant in descendants if descendant.get(
+                'status') in _VISIBLE_DESCENDANT_STATUSES and descendant.get('creation_action') != CreationAction.MULTI_ASSAY_SPLIT]
             # Sort by the descendant's last modified timestamp, descending
             descendants.sort(
                 key=lambda x: x['last_modified_timestamp'],
                 reverse=True)
             # If any remaining descendants have visualization data, set the parent's visualization to True
-            for descendant in descendants:
-                # Even though the descendant doc gets dropped, the soft assay information is necessary for portal-visualization.
-                soft_assay_info = get_assay_type_for_descendants(descendant)
-                _set_soft_assaytype(descendant, soft_assay_info)
-                if has_visualization(descendant, get_assay_type_for_descendants, parent_uuid):
-                    doc['visualization'] = True
-                    return
+            prefetch = not isinstance(resources, ResolvedResources)
+            if _first_visualizable_descendant(descendants, get_assay_type_for_descendants, parent_uuid,
+                                              prefetch) is not None:
+                doc['visualization'] = True
+                return
 
         # If it's still not visualizable, check if it requires a parent dataset to be visualizable
         # (e.g. for image pyramids and segmentation masks)
         if not doc['visualization']:
-            parent_datasets = _get_parent_datasets(doc, transformation_resources)
+            parent_datasets = _get_parent_datasets(doc, resources)
             for parent in parent_datasets:
                 parent_assay_info = get_assay_type_for_viz(parent)
 
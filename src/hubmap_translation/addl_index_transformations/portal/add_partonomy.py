@@ -1,11 +1,17 @@
 import argparse
 from collections import defaultdict
+import logging
+import threading
 import requests
 from pathlib import Path
 from json import loads, dumps
 
 from hubmap_translation.addl_index_transformations.portal.translate import TranslationException
 
+logger = logging.getLogger(__name__)
+
+_PORTAL_PATH = Path(__file__).parent
+
 
 def _get_organ_iri(doc, organ_map):
     try:
@@ -86,36 +92,43 @@ def add_partonomy(doc, organ_map):
         rui_location = loads(doc['rui_location'])
         annotations += rui_location.get('ccf_annotations', [])
 
+    facets_index = get_facets_index()
     partonomy_sets_doc = defaultdict(set)
     for uri in annotations:
-        ancestor_list = _get_ancestors_of(uri, index)
-        ancestor_facets = _make_dict_from_ancestors(ancestor_list)
-        for facet, term_set in ancestor_facets.items():
-            partonomy_sets_doc[facet] |= term_set
+        for i, term in enumerate(facets_index.get(uri, [])):
+            partonomy_sets_doc[f'anatomy_{i}'].add(term)
 
     partonomy_lists_doc = {k: sorted(v) for k, v in partonomy_sets_doc.items()}
     doc.update(partonomy_lists_doc)
 
 
-def _get_ancestors_of(node_id, index):
-    if node_id not in index:
-        return []
-    node = index[node_id]
-    ancestors = _get_ancestors_of(
-        node['parent_id'], index) if node['parent_id'] else []
-    ancestors.append(node['value'])
-    return ancestors
+def _get_partonomy_version():
+    return (_PORTAL_PATH / 'partonomy-version.txt').read_text().strip()
 
 
-def _make_dict_from_ancestors(ancestors):
-    numbered = enumerate(ancestors)
-    return {
-        f'anatomy_{i}': set([term])
-        for i, term in numbered
-    }
+def _facets_index_path(version):
+    # Packaged with partonomy-version.txt, and written by --build-index
+    return _PORTAL_PATH / f'partonomy-facets-{version}.json'
 
 
-def _build_tree_index():
+def _partonomy_path(version):
+    return _PORTAL_PATH / f'cache/partonomy-{version}.jsonld'
+
+
+def _load_partonomy_ld(version, download=True):
+    partonomy_path = _partonomy_path(version)
+    if not partonomy_path.exists():
+        if not download:
+            return None
+        partonomy_url = f'https://cdn.jsdelivr.net/gh/hubmapconsortium/hubmap-ontology@{version}/ccf-partonomy.jsonld'
+        logger.warning(f'Downloading the partonomy from {partonomy_url}')
+        response = requests.get(partonomy_url, timeout=30)
+        response.raise_for_status()
+        partonomy_path.write_text(response.text)
+    return loads(partonomy_path.read_text())
+
+
+def _build_tree_index(partonomy_ld=None):
     '''
     Returns a tuple:
         - A tree, where each node has value, parent_id, and children.
@@ -148,14 +161,8 @@ def _build_tree_index():
      'parent_id': 'http://purl.obolibrary.org/obo/UBERON_0013702',
      'value': 'lymph node'}
     '''
-    parent_path = Path(__file__).parent
-    version = (parent_path / 'partonomy-version.txt').read_text().strip()
-    partonomy_path = parent_path / f'cache/partonomy-{version}.jsonld'
-    if not partonomy_path.exists():
-        partonomy_url = f'https://cdn.jsdelivr.net/gh/hubmapconsortium/hubmap-ontology@{version}/ccf-partonomy.jsonld'
-        partonomy_path.write_text(requests.get(partonomy_url).text)
-
-    partonomy_ld = loads(partonomy_path.read_text())
+    if partonomy_ld is None:
+        partonomy_ld = _load_partonomy_ld(_get_partonomy_version())
     simplified = {
         node['@id']:
         {
@@ -175,7 +182,83 @@ def _build_tree_index():
     return simplified[root_id], simplified
 
 
-tree, index = _build_tree_index()
+def _build_facets_index(index):
+    '''
+    Given the index of _build_tree_index(), return a dict from the id of
+    each node to the values of its ancestors and itself, from the root down:
+    The value at position i goes in the anatomy_i facet.
+
+    >>> index = {
+    ...     'body': {'value': 'body', 'parent_id': None},
+    ...     'kidney': {'value': 'kidney', 'parent_id': 'body'},
+    ...     'rk': {'value': 'right kidney', 'parent_id': 'kidney'},
+    ... }
+    >>> _build_facets_index(index)['rk']
+    ['body', 'kidney', 'right kidney']
+    '''
+    facets_index = {}
+    for node_id in index:
+        # Walk up to the nearest node already done, then fill in back down.
+        path = []
+        current_id = node_id
+        while current_id and current_id not in facets_index:
+            path.append(current_id)
+            current_id = index[current_id]['parent_id']
+        facets = facets_index[current_id] if current_id else []
+        for path_id in reversed(path):
+            facets = facets + [index[path_id]['value']]
+            facets_index[path_id] = facets
+    return facets_index
+
+
+_facets_index = None
+_facets_index_lock = threading.Lock()
+
+
+def get_facets_index():
+    '''
+    Return the dict from partonomy node id to anatomy facet values, loaded on
+    first use: Preferably from the precomputed file for the version in
+    partonomy-version.txt, which the image build writes when it can reach the
+    CDN, then from the partonomy in the cache directory, and only as a last
+    resort from the CDN. If none is available, the error is
+    raised, so documents fail to transform rather than lose their anatomy
+    facets, and loading is tried again on the next call.
+    '''
+    global _facets_index
+    if _facets_index is None:
+        with _facets_index_lock:
+            if _facets_index is None:
+                _facets_index = _load_facets_index()
+    return _facets_index
+
+
+def _load_facets_index():
+    version = _get_partonomy_version()
+    facets_index_path = _facets_index_path(version)
+    if facets_index_path.exists():
+        return loads(facets_index_path.read_text())
+    logger.warning(
+        f'No precomputed partonomy facets at {facets_index_path}; '
+        f'build them with "python -m {__name__} --build-index".')
+    try:
+        _, index = _build_tree_index(_load_partonomy_ld(version))
+    except (requests.exceptions.RequestException, OSError, ValueError) as e:
+        logger.error(f'Unable to load partonomy {version}, so anatomy facets cannot be added: {e}')
+        raise
+    return _build_facets_index(index)
+
+
+def build_facets_index_file():
+    '''
+    Write the precomputed facets file for the version in partonomy-version.txt,
+    downloading the partonomy into the cache directory if it is not there.
+    '''
+    version = _get_partonomy_version()
+    _, index = _build_tree_index(_load_partonomy_ld(version))
+    facets_index_path = _facets_index_path(version)
+    facets_index_path.write_text(dumps(_build_facets_index(index), sort_keys=True))
+    return facets_index_path
 
 
 if __name__ == "__main__":
@@ -183,9 +266,18 @@ if __name__ == "__main__":
         description='Given RUI-JSON, return the anatomy facets that will be generated.'
     )
 
-    parser.add_argument('rui_json', help='RUI-JSON as string.')
+    parser.add_argument('rui_json', nargs='?', help='RUI-JSON as string.')
+    parser.add_argument(
+        '--build-index', action='store_true',
+        help='Write the precomputed partonomy facets for partonomy-version.txt, '
+        'e.g. when building the image, so workers never need the CDN.')
     args = parser.parse_args()
-    doc = {'rui_location': args.rui_json}
-    add_partonomy(doc, {})
-    del doc['rui_location']
-    print(dumps(doc, sort_keys=True, indent=2))
+    if args.build_index:
+        print(f'Wrote {build_facets_index_file()}')
+    elif args.rui_json:
+        doc = {'rui_location': args.rui_json}
+        add_partonomy(doc, {})
+        del doc['rui_location']
+        print(dumps(doc, sort_keys=True, indent=2))
+    else:
+        parser.error('Either rui_json or --build-index is required.')
@@ -0,0 +1,111 @@
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class FragmentCache:
+    '''
+    A bounded LRU cache of what translate() maps from the relatives of
+    documents, e.g. the Donor and organ Sample shared by thousands of
+    Datasets, so each is translated about once per reindex run.
+
+    Keys are made by the caller, from the uuid and last_modified_timestamp
+    of the relative. Values are stored and returned as they are, so the
+    caller copies them as needed.
+
+    run() clears the cache when the first run starts and when the last one
+    in progress ends, so nested and overlapping runs share it, and logs its
+    hit rate.
+
+    >>> cache = FragmentCache(max_entries=1)
+    >>> cache.get('a') is None
+    True
+    >>> cache.put('a', {'mapped_status': 'Published'})
+    >>> cache.get('a')
+    {'mapped_status': 'Published'}
+    >>> cache.put('b', {})
+    >>> cache.get('a') is None
+    True
+    '''
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._run_depth = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(self._entries),
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    @contextmanager
+    def run(self, run_name):
+        with self._lock:
+            self._run_depth += 1
+            first = self._run_depth == 1
+        if first:
+            self.clear()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._run_depth -= 1
+                last = self._run_depth == 0
+            if last:
+                stats = self.stats()
+                if stats['hits'] or stats['misses']:
+                    logger.info(
+                        f"Translated relatives for {run_name}: {stats['hits']} reused, "
+                        f"{stats['misses']} translated ({100 * stats['hit_rate']:.1f}% reused).")
+                self.clear()
+
+
+_fragment_cache = None
+_fragment_cache_lock = threading.Lock()
+
+
+def get_fragment_cache():
+    '''
+    Return the FragmentCache of this process.
+
+    >>> get_fragment_cache() is get_fragment_cache()
+    True
+    '''
+    global _fragment_cache
+    if _fragment_cache is None:
+        with _fragment_cache_lock:
+            if _fragment_cache is None:
+                _fragment_cache = FragmentCache()
+    return _fragment_cache
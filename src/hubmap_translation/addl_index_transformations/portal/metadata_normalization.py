@@ -0,0 +1,178 @@
+import re
+import threading
+from pathlib import Path
+
+from yaml import safe_load as load_yaml
+
+# Fields inserted by IEC, only meaningful at submission time, or for internal use only.
+BAD_METADATA_FIELDS = frozenset([
+    'collectiontype', 'null',  # Inserted by IEC.
+    # Only meaningful at submission time.
+    'data_path', 'metadata_path', 'version',
+    'donor_id', 'tissue_id'  # For internal use only.
+])
+
+# Types of metadata fields, named as in
+# https://github.com/hubmapconsortium/ingest-validation-tools/blob/main/docs/field-types.yaml
+# Fields not listed here, or in the field-types.yaml next to this module if there is one, have their
+# type guessed from their names and values.
+FIELD_TYPES = {
+    'cell_barcode_size': 'string',
+    'cell_barcode_offset': 'string',
+}
+
+_FIELD_TYPES_PATH = Path(__file__).parent / 'field-types.yaml'
+
+_FALSE_VALUES = frozenset(['0', 'false', 'False'])
+_TRUE_VALUES = frozenset(['1', 'true', 'True'])
+
+# Strings which int() and float() accept as they are, and so need no exception handling
+_INTEGER = re.compile(r'[+-]?[0-9]+')
+_DECIMAL = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+# A character neither int() nor float() accepts: not a digit, space, sign, point, underscore,
+# exponent, or a letter of nan, inf or infinity.
+_NOT_NUMERIC = re.compile(r'[^\d\s+\-._eEnNaAiIfFtTyY]')
+
+
+# The conversion of fields which are dropped
+_DROP = object()
+
+
+def _keep(value):
+    return value
+
+
+def _to_boolean(value):
+    # Normalize booleans to all-caps, the Excel default.
+    if value in _FALSE_VALUES:
+        return 'FALSE'
+    if value in _TRUE_VALUES:
+        return 'TRUE'
+    return value
+
+
+def _parse_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+
+def _to_number(value):
+    '''
+    Return value as a number if it looks like one, and otherwise as it is.
+    Most values are decided by a regular expression, without an exception.
+
+    >>> [_to_number(v) for v in ['12', '-1.5e3', ' 7 ', 'nan', 'HBM123.ABC', '2020-01-01', 3, ['1']]]
+    [12, -1500.0, 7, nan, 'HBM123.ABC', '2020-01-01', 3, ['1']]
+    '''
+    if isinstance(value, str):
+        if _INTEGER.fullmatch(value):
+            return int(value)
+        if _DECIMAL.fullmatch(value):
+            return float(value)
+        if _NOT_NUMERIC.search(value):
+            return value
+    elif isinstance(value, list):
+        # Some organ metadata fields are lists.
+        return value
+    elif type(value) is int:
+        return value
+    # What is left is rare: e.g. strings with surrounding spaces or underscores, and floats,
+    # which are truncated to ints as they always have been.
+    as_number = _parse_number(value)
+    return value if as_number is None else as_number
+
+
+_CONVERTERS_BY_TYPE = {
+    'boolean': _to_boolean,
+    'integer': _to_number,
+    'number': _to_number,
+}
+
+
+class MetadataNormalizer:
+    '''
+    Normalizes the values of metadata dicts in place, with a conversion for
+    each field chosen once from the field types, or from the name of the field
+    when it has no type, and kept for the next time the field is seen:
+
+    - Bad fields, and fields starting with "_", are dropped.
+    - Booleans, i.e. fields starting with "is_", are normalized to all-caps.
+    - Numbers, i.e. other fields without a type, are converted to numbers if
+      their values look like numbers.
+
+    >>> metadata = {'is_good': 'true', 'count': '12', 'name': 'x', '_hidden': 1, 'version': '1', 'cell_barcode_size': '16'}
+    >>> MetadataNormalizer().normalize(metadata)
+    >>> metadata
+    {'is_good': 'TRUE', 'count': 12, 'name': 'x', 'cell_barcode_size': '16'}
+    '''
+
+    def __init__(self, field_types=None, max_fields=10000):
+        self.field_types = FIELD_TYPES if field_types is None else field_types
+        self.max_fields = max_fields
+        self._converters = {}
+
+    def _converter(self, field):
+        converter = self._converters.get(field)
+        if converter is None:
+            if field in BAD_METADATA_FIELDS or field.startswith('_'):
+                converter = _DROP
+            elif field in self.field_types:
+                converter = _CONVERTERS_BY_TYPE.get(self.field_types[field], _keep)
+            elif field.startswith('is_'):
+                # There is no guarantee that boolean fields will be prefixed this way,
+                # but at the moment it is the case.
+                converter = _to_boolean
+            else:
+                converter = _to_number
+            if len(self._converters) >= self.max_fields:
+                self._converters.clear()
+            self._converters[field] = converter
+        return converter
+
+    def normalize(self, metadata):
+        dropped = []
+        for field, value in metadata.items():
+            converter = self._converter(field)
+            if converter is _DROP:
+                dropped.append(field)
+                continue
+            converted = converter(value)
+            if converted is not value:
+                metadata[field] = converted
+        for field in dropped:
+            del metadata[field]
+
+
+def load_field_types(path=_FIELD_TYPES_PATH):
+    '''
+    Return FIELD_TYPES, updated with a copy of the field-types.yaml of
+    ingest-validation-tools at path, if there is one.
+    '''
+    field_types = dict(FIELD_TYPES)
+    if path.exists():
+        field_types.update(load_yaml(path.read_text()) or {})
+    return field_types
+
+
+_normalizer = None
+_normalizer_lock = threading.Lock()
+
+
+def get_metadata_normalizer():
+    '''
+    Return the MetadataNormalizer of this process.
+
+    >>> get_metadata_normalizer() is get_metadata_normalizer()
+    True
+    '''
+    global _normalizer
+    if _normalizer is None:
+        with _normalizer_lock:
+            if _normalizer is None:
+                _normalizer = MetadataNormalizer(load_field_types())
+    return _normalizer
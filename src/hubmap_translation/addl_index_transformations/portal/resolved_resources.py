@@ -0,0 +1,65 @@
+from copy import deepcopy
+
+
+class ResolutionException(Exception):
+    pass
+
+
+class ResolvedResources:
+    '''
+    The responses of ingest-api and entity-api which the transformation of a
+    set of documents needs, as recorded by resolve_resources() in
+    add_assay_details.py, so that transform() can look them up rather than
+    call either API. It holds plain data only, so it can be pickled, e.g. to
+    transform the documents in other processes.
+
+    What could not be fetched is recorded too, and raised as a
+    ResolutionException when it is looked up, where the transformation would
+    have raised the error of the call.
+
+    >>> resolved = ResolvedResources()
+    >>> resolved.add('assay_details', 'a', {'assaytype': 'A'})
+    >>> resolved.assay_details('a')
+    {'assaytype': 'A'}
+    >>> resolved.add_error('descendants', 'a', ConnectionError('refused'))
+    >>> try:
+    ...     resolved.descendants('a')
+    ... except ResolutionException as e:
+    ...     print(e)
+    Unable to resolve descendants of a: ConnectionError: refused
+    '''
+
+    def __init__(self):
+        # (kind, uuid) -> response
+        self.responses = {}
+        # (kind, uuid) -> error message
+        self.errors = {}
+
+    def add(self, kind, uuid, response):
+        # The transformation modifies what it looks up, e.g. the descendants it checks
+        self.responses[(kind, uuid)] = deepcopy(response)
+        self.errors.pop((kind, uuid), None)
+
+    def add_error(self, kind, uuid, error):
+        self.errors[(kind, uuid)] = f'{type(error).__name__}: {error}'
+
+    def update(self, other):
+        self.responses.update(other.responses)
+        self.errors.update(other.errors)
+
+    def _get(self, kind, uuid):
+        key = (kind, uuid)
+        if key in self.responses:
+            return deepcopy(self.responses[key])
+        if key in self.errors:
+            raise ResolutionException(f'Unable to resolve {kind} of {uuid}: {self.errors[key]}')
+        raise ResolutionException(f'The {kind} of {uuid} were not resolved.')
+
+    def assay_details(self, uuid):
+        return self._get('assay_details', uuid)
+
+    def descendants(self, uuid):
+        return self._get('descendants', uuid)
+
+    def parents(self, uuid):
+        return self._get('parents', uuid)
@@ -0,0 +1,156 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SoftAssayCache:
+    '''
+    A bounded LRU cache of ingest-api soft-assay responses, with a
+    time-to-live on each entry, shared by every transformation of the process.
+
+    The soft-assay details of a dataset depend only on the dataset, so they
+    are kept across reindex runs, and across the public and private
+    transformations of a document and the descendants checked for the
+    visualizations of all their siblings. Only successful responses are
+    stored. Loading is single-flight: when many threads miss on the same key
+    at once, only one of them calls ingest-api while the others wait for it.
+
+    Callers get their own copy of a response, and can modify it freely.
+
+    run() counts the ingest-api calls avoided during the reindex runs in
+    progress, and logs them when the last of them ends.
+
+    >>> cache = SoftAssayCache(max_entries=2, ttl_seconds=60)
+    >>> cache.get_or_load('a', lambda: {'assaytype': 'A'})
+    {'assaytype': 'A'}
+    >>> cache.get_or_load('a', lambda: 1 / 0)
+    {'assaytype': 'A'}
+    >>> cache.stats()['hits']
+    1
+    '''
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._run_depth = 0
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader, prefetch=False):
+        while True:
+            with self._lock:
+                entry = self._get_unexpired(key)
+                if entry is not None:
+                    if not prefetch:
+                        self.hits += 1
+                    return copy.deepcopy(entry)
+                loading_event = self._loading.get(key)
+                if loading_event is None:
+                    loading_event = threading.Event()
+                    self._loading[key] = loading_event
+                    if prefetch:
+                        self.prefetched += 1
+                    else:
+                        self.misses += 1
+                    break
+            # Another thread is loading this key. Wait for it, then look again. If its
+            # loader failed, nothing was stored and this thread will load the key itself.
+            loading_event.wait()
+
+        try:
+            entry = loader()
+            with self._lock:
+                self._store(key, entry)
+            return copy.deepcopy(entry)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading_event.set()
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._get_unexpired(key) is not None
+
+    def _get_unexpired(self, key):
+        stored = self._entries.get(key)
+        if stored is None:
+            return None
+        stored_at, entry = stored
+        if time.monotonic() - stored_at >= self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, entry):
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic(), entry)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._reset_stats()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'prefetched': self.prefetched,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries)}
+
+    @contextmanager
+    def run(self, run_name):
+        with self._lock:
+            self._run_depth += 1
+            first = self._run_depth == 1
+            if first:
+                self._reset_stats()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._run_depth -= 1
+                last = self._run_depth == 0
+            if last:
+                stats = self.stats()
+                if stats['hits'] or stats['misses'] or stats['prefetched']:
+                    logger.info(
+                        f"Soft assay cache for {run_name}: {stats['hits']} ingest-api calls avoided, "
+                        f"{stats['misses']} made while transforming and {stats['prefetched']} prefetched, "
+                        f"{stats['evictions']} evictions, {stats['entries']} entries.")
+
+
+_soft_assay_cache = None
+_soft_assay_cache_lock = threading.Lock()
+
+
+def get_soft_assay_cache():
+    '''
+    Return the SoftAssayCache of this process.
+
+    >>> get_soft_assay_cache() is get_soft_assay_cache()
+    True
+    '''
+    global _soft_assay_cache
+    if _soft_assay_cache is None:
+        with _soft_assay_cache_lock:
+            if _soft_assay_cache is None:
+                _soft_assay_cache = SoftAssayCache()
+    return _soft_assay_cache
@@ -0,0 +1,16 @@
+import pytest
+
+from hubmap_translation.addl_index_transformations.portal.fragment_cache import get_fragment_cache
+from hubmap_translation.addl_index_transformations.portal.soft_assay_cache import get_soft_assay_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_process_caches():
+    # The caches are shared by the process, so what was cached for one test,
+    # e.g. a mocked response, must not be served to the next.
+    caches = [get_soft_assay_cache(), get_fragment_cache()]
+    for cache in caches:
+        cache.clear()
+    yield
+    for cache in caches:
+        cache.clear()
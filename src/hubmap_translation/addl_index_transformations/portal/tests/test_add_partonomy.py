@@ -1,8 +1,15 @@
+import importlib
+import json
+
 import pytest
+import requests
 
 from hubmap_translation.addl_index_transformations.portal.add_partonomy import _get_organ_iri
 from hubmap_translation.addl_index_transformations.portal.translate import TranslationException
 
+# The portal package exports the add_partonomy function under the name of the module
+add_partonomy_module = importlib.import_module('hubmap_translation.addl_index_transformations.portal.add_partonomy')
+
 
 @pytest.mark.parametrize(
     "doc, expected_organ_iri",
@@ -47,3 +54,74 @@ def test_get_organ_iri_invalid_doc_handling(doc):
         _get_organ_iri(doc, {})
     assert "Invalid document" in str(excinfo.value)
     assert "Missing or empty" in str(excinfo.value)
+
+
+def _ld_node(node_id, label, parent_id=None):
+    return {
+        '@id': node_id,
+        'http://www.w3.org/2000/01/rdf-schema#label': [{'@value': label}],
+        'parent': [{'@id': parent_id}] if parent_id else [],
+    }
+
+
+PARTONOMY_LD = [
+    _ld_node('rk', 'right kidney', 'kidney'),
+    _ld_node('body', 'body'),
+    _ld_node('kidney', 'kidney', 'body'),
+    _ld_node('heart', 'heart', 'body'),
+]
+
+
+@pytest.fixture
+def partonomy_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(add_partonomy_module, '_facets_index_path', lambda version: tmp_path / 'facets.json')
+    monkeypatch.setattr(add_partonomy_module, '_partonomy_path', lambda version: tmp_path / 'partonomy.jsonld')
+    monkeypatch.setattr(add_partonomy_module, '_facets_index', None)
+    return tmp_path
+
+
+def _annotated_doc(*uris):
+    return {'rui_location': json.dumps({'ccf_annotations': list(uris)})}
+
+
+def test_build_facets_index():
+    _, index = add_partonomy_module._build_tree_index(PARTONOMY_LD)
+    assert add_partonomy_module._build_facets_index(index) == {
+        'body': ['body'],
+        'kidney': ['body', 'kidney'],
+        'rk': ['body', 'kidney', 'right kidney'],
+        'heart': ['body', 'heart'],
+    }
+
+
+def test_add_partonomy_prefers_packaged_facets(partonomy_paths, monkeypatch):
+    (partonomy_paths / 'facets.json').write_text(json.dumps({'rk': ['body', 'kidney', 'right kidney']}))
+    monkeypatch.setattr(requests, 'get', pytest.fail)
+    doc = _annotated_doc('rk', 'unknown')
+    add_partonomy_module.add_partonomy(doc, {})
+    assert doc['anatomy_0'] == ['body']
+    assert doc['anatomy_2'] == ['right kidney']
+
+
+def test_add_partonomy_builds_facets_from_cached_partonomy(partonomy_paths, monkeypatch):
+    (partonomy_paths / 'partonomy.jsonld').write_text(json.dumps(PARTONOMY_LD))
+    monkeypatch.setattr(requests, 'get', pytest.fail)
+    doc = _annotated_doc('rk', 'heart')
+    add_partonomy_module.add_partonomy(doc, {})
+    assert doc['anatomy_0'] == ['body']
+    assert doc['anatomy_1'] == ['heart', 'kidney']
+    assert doc['anatomy_2'] == ['right kidney']
+
+
+def test_add_partonomy_without_partonomy_fails_and_retries(partonomy_paths, monkeypatch):
+    def unreachable(url, *args, **kwargs):
+        raise requests.exceptions.ConnectionError(url)
+    monkeypatch.setattr(requests, 'get', unreachable)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        add_partonomy_module.add_partonomy(_annotated_doc('rk'), {})
+
+    # The failure is not cached: once the partonomy can be had, facets are added
+    (partonomy_paths / 'partonomy.jsonld').write_text(json.dumps(PARTONOMY_LD))
+    doc = _annotated_doc('rk')
+    add_partonomy_module.add_partonomy(doc, {})
+    assert doc['anatomy_2'] == ['right kidney']
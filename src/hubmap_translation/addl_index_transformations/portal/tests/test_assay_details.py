@@ -1,9 +1,19 @@
+import threading
+import time
+
 import pytest
+import requests
 
 from hubmap_translation.addl_index_transformations.portal.add_assay_details import (
     add_assay_details,
-    _add_dataset_categories
+    prefetch_assay_details,
+    resolve_resources,
+    _add_dataset_categories,
+    _first_visualizable_descendant,
+    _DESCENDANT_PREFETCH_WINDOW
 )
+from hubmap_translation.addl_index_transformations.portal.resolved_resources import ResolutionException
+from hubmap_translation.addl_index_transformations.portal.soft_assay_cache import get_soft_assay_cache
 
 mock_transformation_resources = {
     'ingest_api_soft_assay_url': 'abc123',
@@ -306,6 +316,57 @@ def test_transform_image_pyramid_parent(mocker):
     assert image_pyramid_input_doc == image_pyramid_output_doc
 
 
+def test_image_pyramid_parent_reads_relatives_from_doc(mocker):
+    def soft_assay_by_url(url, headers=None):
+        if url.startswith(mock_transformation_resources['ingest_api_soft_assay_url']):
+            return mock_image_pyramid_support() if url.endswith(('4919', '4918')) else mock_image_pyramid_parent()
+        pytest.fail(f'Unexpected request for relatives in the document: {url}')
+    get = mocker.patch('requests.get', side_effect=soft_assay_by_url)
+    descendants = [
+        {
+            'uuid': descendant['uuid'],
+            'entity_type': 'Dataset',
+            'creation_action': 'Central Process',
+            **descendant
+        } for descendant in mock_image_pyramid_descendants().json()
+    ] + [{'uuid': 'sample', 'entity_type': 'Sample', 'last_modified_timestamp': 1234567892}]
+    doc = {
+        'uuid': '69c70762689b20308bb049ac49653342',
+        'dataset_type': 'PAS',
+        'entity_type': 'Dataset',
+        'creation_action': 'Create Dataset Activity',
+        'descendants': descendants,
+        'immediate_ancestors': [{'uuid': 'sample', 'entity_type': 'Sample'}],
+    }
+    original_descendants = [dict(descendant) for descendant in descendants]
+
+    add_assay_details(doc, mock_transformation_resources)
+    assert doc['visualization'] is True
+    assert doc['descendants'] == original_descendants
+    assert all(call.args[0].startswith('abc123/') for call in get.call_args_list)
+
+
+def test_relatives_are_fetched_when_doc_lacks_their_fields(mocker):
+    get = mocker.patch('requests.get', side_effect=[
+        mock_raw_soft_assay(),
+        mock_empty_descendants(),
+        mock_empty_parents()])
+    doc = {
+        'uuid': '421007293469db7b528ce6478c00348d',
+        'dataset_type': 'RNAseq',
+        'entity_type': 'Dataset',
+        'creation_action': 'Create Dataset Activity',
+        # As in documents which do not carry the status of their descendants
+        'descendants': [{'uuid': 'abc', 'entity_type': 'Dataset', 'last_modified_timestamp': 1}],
+        'immediate_ancestors': [{'uuid': 'def'}],
+    }
+    add_assay_details(doc, mock_transformation_resources)
+    assert [call.args[0] for call in get.call_args_list] == [
+        'abc123/421007293469db7b528ce6478c00348d',
+        'ghi789/421007293469db7b528ce6478c00348d',
+        'jkl012/421007293469db7b528ce6478c00348d']
+
+
 def test_transform_image_pyramid_support(mocker):
     mocker.patch('requests.get', side_effect=[
         mock_image_pyramid_support(),
@@ -408,6 +469,129 @@ def test_transform_epic(mocker):
     assert epic_input_doc == epic_output_doc
 
 
+def test_soft_assay_details_are_requested_once(mocker):
+    get = mocker.patch('requests.get', side_effect=[
+        mock_raw_soft_assay(),
+        mock_empty_descendants(),
+        mock_empty_parents(),
+        # The second transformation of the dataset gets its soft assay details from the cache
+        mock_empty_descendants(),
+        mock_empty_parents(),
+    ])
+    docs = [{
+        'uuid': '421007293469db7b528ce6478c00348d',
+        'dataset_type': 'RNAseq',
+        'entity_type': 'Dataset',
+        'creation_action': 'Create Dataset Activity',
+    } for _ in range(2)]
+    for doc in docs:
+        add_assay_details(doc, mock_transformation_resources)
+    assert docs[0] == docs[1]
+    assert docs[1]['soft_assaytype'] == 'sciRNAseq'
+    assert get.call_count == 5
+    assert get_soft_assay_cache().stats()['hits'] == 1
+
+
+def test_prefetch_assay_details(mocker):
+    get = mocker.patch('requests.get', side_effect=lambda url, headers: mock_raw_soft_assay())
+    prefetch_assay_details(['a', 'b', 'a'], mock_transformation_resources)
+    prefetch_assay_details(['b'], mock_transformation_resources)
+    assert sorted(call.args[0] for call in get.call_args_list) == ['abc123/a', 'abc123/b']
+    assert get_soft_assay_cache().stats()['prefetched'] == 2
+
+
+def test_prefetch_assay_details_leaves_failures_to_the_transformation(mocker):
+    mocker.patch('requests.get', side_effect=requests.exceptions.ConnectionError)
+    prefetch_assay_details(['a'], mock_transformation_resources)
+    assert get_soft_assay_cache().stats()['entries'] == 0
+
+
+def _image_pyramid_by_url(url, headers=None):
+    if url.startswith(mock_transformation_resources['descendants_url']):
+        return mock_image_pyramid_descendants()
+    if url.startswith(mock_transformation_resources['parents_url']):
+        return mock_empty_parents()
+    return mock_image_pyramid_support() if url.endswith(('4919', '4918')) else mock_image_pyramid_parent()
+
+
+def _image_pyramid_parent_doc():
+    return {
+        'uuid': '69c70762689b20308bb049ac49653342',
+        'dataset_type': 'PAS',
+        'entity_type': 'Dataset',
+        'creation_action': 'Create Dataset Activity'
+    }
+
+
+def test_resolved_resources_make_add_assay_details_pure(mocker):
+    get = mocker.patch('requests.get', side_effect=_image_pyramid_by_url)
+    resolved = resolve_resources([_image_pyramid_parent_doc()], mock_transformation_resources)
+    # The calls are those add_assay_details() makes itself: a visible descendant has a
+    # visualization, so the parents are not needed.
+    urls = {call.args[0] for call in get.call_args_list}
+    assert {'abc123/69c70762689b20308bb049ac49653342',
+            'abc123/8adc3c31ca84ec4b958ed20a7c4f4919',
+            'ghi789/69c70762689b20308bb049ac49653342'} <= urls
+    assert not any(url.startswith('jkl012/') or url.endswith('4920') for url in urls)
+    get.reset_mock()
+
+    doc = _image_pyramid_parent_doc()
+    add_assay_details(doc, mock_transformation_resources, resolved)
+    get.assert_not_called()
+    get_soft_assay_cache().clear()
+    expected = _image_pyramid_parent_doc()
+    add_assay_details(expected, mock_transformation_resources)
+    assert doc == expected
+
+
+def test_resolution_errors_are_raised_by_add_assay_details(mocker):
+    mocker.patch('requests.get', side_effect=requests.exceptions.ConnectionError('refused'))
+    resolved = resolve_resources([_image_pyramid_parent_doc()], mock_transformation_resources)
+    with pytest.raises(ResolutionException, match='refused'):
+        add_assay_details(_image_pyramid_parent_doc(), mock_transformation_resources, resolved)
+
+
+def _descendant_assay_types(visualizable, slow=(), failing=()):
+    fetched = []
+    fetched_lock = threading.Lock()
+
+    def get_assay_type(descendant):
+        uuid = descendant['uuid'] if isinstance(descendant, dict) else descendant
+        with fetched_lock:
+            fetched.append(uuid)
+        if uuid in slow:
+            time.sleep(0.05)
+        if uuid in failing:
+            raise requests.exceptions.HTTPError(uuid)
+        return {'vitessce-hints': ['rna'] if uuid in visualizable else []}
+    return get_assay_type, fetched
+
+
+def test_first_visualizable_descendant_keeps_timestamp_order():
+    descendants = [{'uuid': uuid} for uuid in ['a', 'b', 'c']]
+    get_assay_type, _ = _descendant_assay_types(visualizable={'b', 'c'}, slow={'a', 'b'})
+    assert _first_visualizable_descendant(descendants, get_assay_type, 'parent')['uuid'] == 'b'
+
+
+def test_first_visualizable_descendant_stops_fetching_once_found():
+    descendants = [{'uuid': str(i)} for i in range(10 * _DESCENDANT_PREFETCH_WINDOW)]
+    get_assay_type, fetched = _descendant_assay_types(visualizable={'0'}, slow={'0'})
+    assert _first_visualizable_descendant(descendants, get_assay_type, 'parent')['uuid'] == '0'
+    # The window, and the one fetched when the first was taken from it
+    assert len([uuid for uuid in fetched if uuid != 'parent']) <= _DESCENDANT_PREFETCH_WINDOW + 1
+
+
+def test_first_visualizable_descendant_raises_errors_in_order():
+    descendants = [{'uuid': uuid} for uuid in ['a', 'b', 'c']]
+    get_assay_type, _ = _descendant_assay_types(visualizable={'b'}, failing={'c'})
+    assert _first_visualizable_descendant(descendants, get_assay_type, 'parent')['uuid'] == 'b'
+    get_assay_type, _ = _descendant_assay_types(visualizable={'b'}, failing={'a'})
+    with pytest.raises(requests.exceptions.HTTPError):
+        _first_visualizable_descendant(descendants, get_assay_type, 'parent')
+    get_assay_type, _ = _descendant_assay_types(visualizable=set())
+    assert _first_visualizable_descendant(descendants, get_assay_type, 'parent') is None
+
+
 def test_hubmap_processing():
     hubmap_processed_input_doc = {
         'creation_action': 'Central Process',
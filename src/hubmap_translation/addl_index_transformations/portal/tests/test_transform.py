@@ -1,4 +1,10 @@
-from hubmap_translation.addl_index_transformations.portal import transform
+import sys
+import types
+
+from hubmap_translation.addl_index_transformations import portal
+from hubmap_translation.addl_index_transformations.portal import (
+    set_transform_processes, transform, transform_batch
+)
 from hubmap_translation.addl_index_transformations.portal.add_assay_details import (
     CreationAction,
 )
@@ -268,3 +274,55 @@ def test_transform(mocker):
         expected_output_doc_integrated_epic,
         transformation_resources,
     )
+
+
+def test_transform_batch(mocker):
+    get = mocker.patch("requests.get", side_effect=mock_soft_assay)
+    transformation_resources = {
+        "ingest_api_soft_assay_url": "abc123",
+        "token": "def456",
+        "organ_map": {"LY": {"term": "Lymph Node"}},
+    }
+    # Documents transform() raises an exception for are returned as None
+    bad_doc = {"uuid": "bad", "descendants": 5}
+    inputs = [input_doc, bad_doc, input_doc_integrated_multiple_ancestors, input_doc_integrated_epic]
+
+    actual = transform_batch(inputs, transformation_resources)
+
+    assert actual[1] is None
+    expected = [transform(doc, transformation_resources) for doc in inputs if doc is not bad_doc]
+    for actual_doc, expected_doc in zip([actual[0]] + actual[2:], expected):
+        del actual_doc["mapper_metadata"]["datetime"]
+        del expected_doc["mapper_metadata"]["datetime"]
+        assert actual_doc == expected_doc
+    # The Datasets share a uuid, whose soft assay details are fetched once
+    assert get.call_count == 1
+
+
+def test_transform_batch_in_worker_processes(mocker):
+    mocker.patch("requests.get", side_effect=mock_soft_assay)
+    transformation_resources = {
+        "ingest_api_soft_assay_url": "abc123",
+        "token": "def456",
+        "organ_map": {"LY": {"term": "Lymph Node"}},
+    }
+    inputs = [input_doc, input_doc_integrated_multiple_ancestors, input_doc_integrated_epic]
+    expected = transform_batch(inputs, transformation_resources)
+
+    # The workers make no API calls, which would fail: what they need is resolved here
+    set_transform_processes(2)
+    try:
+        actual = transform_batch(inputs, transformation_resources)
+    finally:
+        set_transform_processes(0)
+
+    for actual_doc, expected_doc in zip(actual, expected):
+        del actual_doc["mapper_metadata"]["datetime"]
+        del expected_doc["mapper_metadata"]["datetime"]
+        assert actual_doc == expected_doc
+
+
+def test_no_transform_processes_under_uwsgi(monkeypatch):
+    monkeypatch.setitem(sys.modules, "uwsgi", types.ModuleType("uwsgi"))
+    set_transform_processes(2)
+    assert portal._transform_pool is None
@@ -0,0 +1,106 @@
+from copy import deepcopy
+
+from hubmap_translation.addl_index_transformations.portal.fragment_cache import get_fragment_cache
+from hubmap_translation.addl_index_transformations.portal.translate import (
+    translate,
+    _add_origin_samples_unique_mapped_organs,
+    _add_spatial_info,
+    _translate_access_level,
+    _translate_donor_metadata,
+    _translate_external_consortium,
+    _translate_file_description,
+    _translate_organ,
+    _translate_sample_category,
+    _translate_status,
+    _translate_timestamp,
+)
+
+ORGAN_MAP = {'LY': {'term': 'Lymph Node'}, 'RK': {'term': 'Kidney (Right)'}}
+
+DONOR = {
+    'uuid': 'donor',
+    'entity_type': 'Donor',
+    'last_modified_timestamp': 1590017663118,
+    'data_access_level': 'public',
+    'metadata': {'organ_donor_data': [
+        {'data_type': 'Numeric', 'data_value': '87.6', 'grouping_concept_preferred_term': 'Weight', 'units': 'kg'},
+        {'preferred_term': 'Diabetes', 'grouping_concept_preferred_term': 'Medical history'},
+    ]},
+}
+ORGAN = {
+    'uuid': 'organ',
+    'entity_type': 'Sample',
+    'last_modified_timestamp': 1590017663119,
+    'sample_category': 'organ',
+    'organ': 'LY',
+    'data_access_level': 'public',
+}
+
+
+def _dataset(uuid, organ_map_organ='LY'):
+    organ = {**ORGAN, 'organ': organ_map_organ}
+    # As the Translator makes them: the full Donor, and the Donor and organ among the ancestors
+    # with fewer fields.
+    return {
+        'uuid': uuid,
+        'entity_type': 'Dataset',
+        'status': 'Published',
+        'create_timestamp': 1575489509656,
+        'last_modified_timestamp': 1590017663120,
+        'data_access_level': 'public',
+        'group_name': 'EXT - Somewhere',
+        'metadata': {'analyte_class': 'RNA'},
+        'donor': deepcopy(DONOR),
+        'donors': [deepcopy(DONOR)],
+        'origin_samples': [deepcopy(organ)],
+        'source_samples': [deepcopy(organ)],
+        'ancestors': [
+            {k: DONOR[k] for k in ['uuid', 'entity_type', 'last_modified_timestamp']},
+            {k: organ[k] for k in ['uuid', 'entity_type', 'last_modified_timestamp', 'organ', 'sample_category']},
+        ],
+        'files': [{'rel_path': 'a.ome.tif', 'description': 'OME-TIFF pyramid file'}],
+    }
+
+
+def _translate_each_field(doc, organ_map):
+    # How translate() mapped each field over the document and its relatives in turn
+    _translate_file_description(doc)
+    _translate_status(doc)
+    _translate_organ(doc, organ_map)
+    _add_origin_samples_unique_mapped_organs(doc)
+    _translate_donor_metadata(doc)
+    _translate_sample_category(doc)
+    _translate_timestamp(doc)
+    _translate_access_level(doc)
+    _translate_external_consortium(doc)
+    _add_spatial_info(doc)
+
+
+def test_translate_reuses_relatives_with_the_same_result():
+    for uuid, organ in [('a', 'LY'), ('b', 'LY'), ('c', 'RK'), ('d', 'ZZ')]:
+        doc = _dataset(uuid, organ)
+        expected = deepcopy(doc)
+        _translate_each_field(expected, ORGAN_MAP)
+        translate(doc, ORGAN_MAP)
+        assert doc == expected
+    assert get_fragment_cache().stats()['hits'] > 0
+
+
+def test_translated_relatives_are_copies():
+    doc = _dataset('a')
+    translate(doc, ORGAN_MAP)
+    doc['donor']['mapped_metadata']['weight_value'].append(1.0)
+    doc['donors'][0]['mapped_metadata'].pop('medical_history')
+
+    doc = _dataset('b')
+    translate(doc, ORGAN_MAP)
+    assert doc['donors'][0]['mapped_metadata'] == {
+        'weight_value': [87.6], 'weight_unit': ['kg'], 'medical_history': ['Diabetes']}
+
+
+def test_relatives_with_other_fields_are_translated_apart():
+    doc = _dataset('a')
+    translate(doc, ORGAN_MAP)
+    # The Donor among the ancestors has no metadata, unlike the same Donor in donor
+    assert 'mapped_metadata' not in doc['ancestors'][0]
+    assert 'mapped_metadata' in doc['donor']
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+from portal_visualization.builder_factory import has_visualization
+
+from hubmap_translation.addl_index_transformations.portal.visualization_memo import VisualizationMemo
+
+_HINTS = ['is_image', 'rna', 'atac', 'pyramid', 'is_support', 'is_sc', 'is_tiled', 'spatial', 'epic',
+          'segmentation_mask', 'codex', 'anndata', 'json_based', 'sprm', 'visium', 'xenium', 'unknown-assay']
+_ASSAY_TYPES = [None, 'image_pyramid', 'salmon_rnaseq_10x', 'sciRNAseq', 'PAS', 'CODEX', 'seg-mask',
+                'salmon_rnaseq_visium', 'scatac', 'MALDI', 'IMC2D', 'Xenium']
+
+
+def _random_entity(rng):
+    entity = {'uuid': '%032x' % rng.getrandbits(128),
+              'vitessce-hints': rng.sample(_HINTS, rng.randint(0, 4))}
+    assay_type = rng.choice(_ASSAY_TYPES)
+    if assay_type:
+        entity['soft_assaytype'] = assay_type
+    return entity
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_memo_agrees_with_has_visualization():
+    rng = random.Random(0)
+    memo = VisualizationMemo(max_entries=50)
+    for _ in range(2000):
+        entity = _random_entity(rng)
+        parent = rng.choice([None, 'parent'])
+        parent_assay = rng.choice([None, {}, {'soft_assaytype': rng.choice(_ASSAY_TYPES)}])
+
+        def get_entity(uuid):
+            if parent_assay is None:
+                raise KeyError(uuid)
+            return parent_assay
+        assert memo.has_visualization(entity, get_entity, parent) == has_visualization(entity, get_entity, parent)
+    assert memo.stats()['hits'] > 0
+    assert memo.stats()['entries'] == 50
+
+
+def test_memo_looks_up_the_parent_once():
+    calls = []
+
+    def get_entity(uuid):
+        calls.append(uuid)
+        return {'soft_assaytype': 'image_pyramid'}
+    memo = VisualizationMemo()
+    entity = {'uuid': 'a', 'vitessce-hints': ['is_image', 'is_support', 'pyramid']}
+    memo.has_visualization(entity, get_entity, 'parent')
+    memo.has_visualization(entity, get_entity, 'parent')
+    assert calls == ['parent', 'parent']
+    assert memo.stats() == {'hits': 1, 'misses': 1, 'entries': 1, 'hit_rate': 0.5}
+
+
+def test_memo_raises_for_an_entity_without_uuid():
+    with pytest.raises(ValueError):
+        VisualizationMemo().has_visualization({'vitessce-hints': []}, None)
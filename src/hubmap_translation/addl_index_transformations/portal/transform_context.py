@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+import jsonschema
+
+logger = logging.getLogger(__name__)
+
+
+class TransformContext:
+    '''
+    What transform() needs for every document but which does not depend on
+    the document: the version written to mapper_metadata, and the validator
+    of the document schema. It is made once per process, by
+    get_transform_context() in __init__.py.
+
+    It also adds up the time transform() spends in each of its stages,
+    which run() logs for each reindex run, along with the hit rates of the
+    process-wide caches of the transformation, e.g. of soft-assay details.
+
+    >>> context = TransformContext('v1', {'type': 'object'})
+    >>> with context.run('example'):
+    ...     with context.stage('clean'):
+    ...         pass
+    >>> context.stage_timings()['clean']['calls']
+    1
+    '''
+
+    def __init__(self, version, validation_schema, caches=()):
+        self.version = version
+        self.validator = jsonschema.Draft7Validator(validation_schema)
+        # Each has a run(run_name) like this one's, which logs its statistics
+        self.caches = list(caches)
+        self._lock = threading.Lock()
+        self._run_depth = 0
+        self._reset_stage_timings()
+
+    def _reset_stage_timings(self):
+        self.documents = 0
+        # Stage name -> [seconds, calls]
+        self._stage_totals = {}
+
+    def count_document(self):
+        with self._lock:
+            self.documents += 1
+
+    def add_stage_timings(self, stage_timings, documents):
+        # Of documents transformed elsewhere, e.g. in the worker processes of a TransformPool
+        with self._lock:
+            self.documents += documents
+            for name, timing in stage_timings.items():
+                totals = self._stage_totals.setdefault(name, [0.0, 0])
+                totals[0] += timing['seconds']
+                totals[1] += timing['calls']
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                totals = self._stage_totals.setdefault(name, [0.0, 0])
+                totals[0] += seconds
+                totals[1] += 1
+
+    def stage_timings(self):
+        with self._lock:
+            return {
+                name: {'seconds': seconds, 'calls': calls}
+                for name, (seconds, calls) in self._stage_totals.items()
+            }
+
+    def log_stage_timings(self, run_name):
+        timings = self.stage_timings()
+        if not self.documents:
+            return
+        total_seconds = sum(t['seconds'] for t in timings.values())
+        breakdown = ', '.join(
+            f"{name} {1000 * t['seconds'] / self.documents:.2f} ms"
+            for name, t in sorted(
+                timings.items(), key=lambda item: item[1]['seconds'],
+                reverse=True)
+        )
+        logger.info(
+            f'Portal transform of {self.documents} documents for {run_name}: '
+            f'{1000 * total_seconds / self.documents:.2f} ms per document; '
+            f'{breakdown}.')
+
+    @contextmanager
+    def run(self, run_name):
+        # Like the entity document cache of the Translator, time the stages
+        # of all the runs in progress together: they nest, e.g. a batch
+        # within a donor tree, or overlap, on other threads. The timings
+        # are reset when the first run starts and logged when the last ends.
+        with self._lock:
+            self._run_depth += 1
+            first = self._run_depth == 1
+            if first:
+                self._reset_stage_timings()
+        try:
+            with ExitStack() as stack:
+                for cache in self.caches:
+                    stack.enter_context(cache.run(run_name))
+                yield self
+        finally:
+            with self._lock:
+                self._run_depth -= 1
+                last = self._run_depth == 0
+            if last:
+                self.log_stage_timings(run_name)
@@ -0,0 +1,74 @@
+import logging
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+def running_under_uwsgi():
+    '''
+    Whether this process was started by uWSGI, which provides the uwsgi
+    module to its workers only.
+
+    >>> running_under_uwsgi()
+    False
+    '''
+    try:
+        import uwsgi  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TransformPool:
+    '''
+    A pool of worker processes for the CPU-bound stages of transform(), which
+    otherwise compete for the GIL with the threads making the API calls of
+    a reindex run.
+
+    map_chunks() hands a list of documents over in about two chunks per
+    process, so the chunks balance across the processes without each
+    document being sent on its own. The workers are started with "spawn",
+    as the processes using the pool have threads, which forked workers
+    would inherit in whatever state they were in. Spawned workers run
+    sys.executable, which in a uWSGI worker is the uwsgi binary rather than
+    a Python interpreter, so the pool is not made there: see
+    running_under_uwsgi().
+
+    When a worker dies, the pool is replaced for the next call, and
+    map_chunks() raises the BrokenProcessPool for the caller to transform
+    the chunks itself.
+    '''
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._executor = self._make_executor()
+
+    def _make_executor(self):
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def map_chunks(self, function, items, *args):
+        '''
+        Return the results of function(chunk, *args) for the chunks of items, in order.
+        '''
+        chunk_size = max(1, math.ceil(len(items) / (2 * self.processes)))
+        chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+        with self._lock:
+            executor = self._executor
+        try:
+            futures = [executor.submit(function, chunk, *args) for chunk in chunks]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    logger.error(f'A transform worker process died; starting {self.processes} new ones.')
+                    self._executor = self._make_executor()
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            self._executor.shutdown()
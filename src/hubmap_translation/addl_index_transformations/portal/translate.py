@@ -2,6 +2,10 @@ import re
 from datetime import datetime
 from collections import defaultdict
 
+from hubmap_translation.addl_index_transformations.portal.fragment_cache import get_fragment_cache
+
+_NON_WORD_CHARACTERS = re.compile(r'\W+')
+
 
 class TranslationException(Exception):
     pass
@@ -13,14 +17,11 @@ def _unexpected(s):
 
 def translate(doc, organ_map):
     _translate_file_description(doc)
-    _translate_status(doc)
-    _translate_organ(doc, organ_map)
+    # Status, organ, donor metadata, sample category, timestamps and access level, of the
+    # document and its relatives, as the _translate_*() functions below would map them.
+    _translate_fragments(doc, organ_map)
     # _add_origin_samples_unique_mapped_organs depends on the existence of the mapped_organ field and must be performed after _translate_organ.
     _add_origin_samples_unique_mapped_organs(doc)
-    _translate_donor_metadata(doc)
-    _translate_sample_category(doc)
-    _translate_timestamp(doc)
-    _translate_access_level(doc)
     _translate_external_consortium(doc)
     _add_spatial_info(doc)
 
@@ -173,11 +174,13 @@ def _translate_organ(doc, organ_map):
     {'origin_samples': [{'organ': 'ZZ', 'mapped_organ': 'No translation for "ZZ"'}]}
 
     '''
-    def _organ_map(k):
-        if k not in organ_map:
-            return _unexpected(k)
-        return organ_map.get(k, {}).get('term')
-    _map(doc, 'organ', _organ_map)
+    _map(doc, 'organ', lambda k: _organ_map(k, organ_map))
+
+
+def _organ_map(k, organ_map):
+    if k not in organ_map:
+        return _unexpected(k)
+    return organ_map.get(k, {}).get('term')
 
 
 # Sample category:
@@ -251,7 +254,7 @@ def _donor_metadata_map(metadata):
 
     for kv in donor_metadata:
         term = kv['grouping_concept_preferred_term']
-        key = re.sub(r'\W+', '_', term).lower()
+        key = _NON_WORD_CHARACTERS.sub('_', term).lower()
         value = (
             float(kv['data_value'])
             if 'data_type' in kv and kv['data_type'] == 'Numeric'
@@ -308,3 +311,72 @@ def _add_spatial_info(doc):
         if nearest_rui_location_ancestor is not None:
             doc['is_spatial'] = nearest_rui_location_ancestor is not None
             doc['rui_location'] = nearest_rui_location_ancestor['rui_location']
+
+
+# Relatives:
+
+# The fields mapped on a document and on each of its relatives by _map(), other than organ,
+# whose mapping depends on the organ_map.
+_FRAGMENT_FIELD_MAPS = (
+    ('status', _status_map),
+    ('metadata', _donor_metadata_map),
+    ('sample_category', _sample_categories_map),
+    ('create_timestamp', _timestamp_map),
+    ('last_modified_timestamp', _timestamp_map),
+    ('data_access_level', _access_level_map),
+)
+
+
+def _relatives(doc):
+    # The relatives _map() recurses into
+    if 'donor' in doc:
+        yield doc['donor']
+        yield from _relatives(doc['donor'])
+    for field in ['origin_samples', 'source_samples', 'ancestors', 'donors']:
+        for relative in doc.get(field, []):
+            yield relative
+            yield from _relatives(relative)
+
+
+def _translate_fragments(doc, organ_map):
+    '''
+    Map the fields of _FRAGMENT_FIELD_MAPS, and organ, on the document and its
+    relatives. The same Donor or Sample is a relative of many documents, so what is
+    mapped from a relative is kept in the FragmentCache of the process, by its uuid,
+    last_modified_timestamp and which of the fields it has, and reused.
+
+    >>> doc = {'status': 'QA', 'donor': {'uuid': 'd', 'last_modified_timestamp': 0, 'data_access_level': 'public'}}
+    >>> _translate_fragments(doc, {})
+    >>> doc['mapped_status'], doc['donor']['mapped_data_access_level']
+    ('QA', 'Public')
+    '''
+    _translate_fragment(doc, organ_map, None)
+    cache = get_fragment_cache()
+    for relative in _relatives(doc):
+        _translate_fragment(relative, organ_map, cache)
+
+
+def _translate_fragment(fragment, organ_map, cache):
+    if 'organ' in fragment:
+        fragment['mapped_organ'] = _organ_map(fragment['organ'], organ_map)
+    cache_key = None
+    if cache is not None and 'uuid' in fragment and 'last_modified_timestamp' in fragment:
+        cache_key = (fragment['uuid'], fragment['last_modified_timestamp'],
+                     tuple(key for key, _ in _FRAGMENT_FIELD_MAPS if key in fragment))
+        mapped = cache.get(cache_key)
+        if mapped is not None:
+            fragment.update(_copy_mapped(mapped))
+            return
+    mapped = {f'mapped_{key}': map(fragment[key]) for key, map in _FRAGMENT_FIELD_MAPS if key in fragment}
+    if cache_key is not None:
+        cache.put(cache_key, _copy_mapped(mapped))
+    fragment.update(mapped)
+
+
+def _copy_mapped(mapped):
+    # Only mapped_metadata, a dict of lists, is not immutable. The transformed document may be
+    # modified, e.g. by public document exclusions, so it gets its own copy.
+    return {
+        key: {k: list(v) for k, v in value.items()} if isinstance(value, dict) else value
+        for key, value in mapped.items()
+    }
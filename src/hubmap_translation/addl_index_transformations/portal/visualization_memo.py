@@ -0,0 +1,157 @@
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from portal_visualization import builder_factory
+
+logger = logging.getLogger(__name__)
+
+# Raised by get_entity() for a parent without assay details, which has_visualization() treats as a
+# parent without an assay type
+_MISSING_PARENT_ERRORS = (FileNotFoundError, KeyError)
+
+
+def visualization_signature(entity, get_entity, parent=None):
+    '''
+    Return what the result of has_visualization() for the same arguments depends on, in
+    portal-visualization 0.5.5: the vitessce-hints and soft_assaytype of the entity, whether it
+    has a parent, and the soft_assaytype of the parent. Only the last calls get_entity().
+
+    Returns None for an entity has_visualization() rejects, so it is called and raises.
+
+    >>> visualization_signature({'uuid': 'a', 'vitessce-hints': ['rna'], 'soft_assaytype': 'x'}, None)
+    (('rna',), 'x', False, None)
+    >>> visualization_signature({'uuid': 'a'}, lambda uuid: {'soft_assaytype': 'y'}, 'parent')
+    ((), None, True, 'y')
+    '''
+    if entity.get('uuid') is None:
+        return None
+    hints = entity.get('vitessce-hints', [])
+    if not isinstance(hints, list):
+        return None
+    parent_assay_type = None
+    if parent is not None and get_entity is not None:
+        try:
+            parent_assay_type = get_entity(parent).get('soft_assaytype')
+        except _MISSING_PARENT_ERRORS:
+            pass
+    return (tuple(hints), entity.get('soft_assaytype'), parent is not None, parent_assay_type)
+
+
+class VisualizationMemo:
+    '''
+    A bounded LRU cache of the results of has_visualization(), keyed by
+    visualization_signature(), shared by every transformation of the process.
+    Thousands of datasets share a few signatures, so most calls are hits.
+
+    run() logs the hit rate of the reindex runs in progress when the last
+    of them ends.
+
+    >>> memo = VisualizationMemo(max_entries=10)
+    >>> memo.has_visualization({'uuid': 'a', 'vitessce-hints': ['rna']}, lambda uuid: {})
+    True
+    >>> memo.has_visualization({'uuid': 'b', 'vitessce-hints': ['rna']}, lambda uuid: {})
+    True
+    >>> memo.stats()['hits']
+    1
+    '''
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._run_depth = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def has_visualization(self, entity, get_entity, parent=None):
+        # The parent is looked up once, for the signature, and handed to has_visualization() on a miss.
+        parent_entity = {}
+
+        def get_parent(uuid):
+            if 'entity' not in parent_entity:
+                try:
+                    parent_entity['entity'] = get_entity(uuid)
+                except _MISSING_PARENT_ERRORS as e:
+                    parent_entity['entity'] = e
+            if isinstance(parent_entity['entity'], Exception):
+                raise parent_entity['entity']
+            return parent_entity['entity']
+
+        signature = visualization_signature(entity, get_parent if get_entity else None, parent)
+        if signature is None:
+            return builder_factory.has_visualization(entity, get_entity, parent)
+        with self._lock:
+            if signature in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(signature)
+                return self._entries[signature]
+            self.misses += 1
+        result = builder_factory.has_visualization(entity, get_parent if get_entity else None, parent)
+        with self._lock:
+            self._entries[signature] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            calls = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'entries': len(self._entries),
+                    'hit_rate': self.hits / calls if calls else 0.0}
+
+    @contextmanager
+    def run(self, run_name):
+        with self._lock:
+            self._run_depth += 1
+            first = self._run_depth == 1
+            if first:
+                self.hits = 0
+                self.misses = 0
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._run_depth -= 1
+                last = self._run_depth == 0
+            if last:
+                stats = self.stats()
+                if stats['hits'] or stats['misses']:
+                    logger.info(
+                        f"has_visualization() for {run_name}: {stats['hits'] + stats['misses']} calls, "
+                        f"{100 * stats['hit_rate']:.1f}% answered from {stats['entries']} signatures.")
+
+
+_visualization_memo = None
+_visualization_memo_lock = threading.Lock()
+
+
+def get_visualization_memo():
+    '''
+    Return the VisualizationMemo of this process.
+
+    >>> get_visualization_memo() is get_visualization_memo()
+    True
+    '''
+    global _visualization_memo
+    if _visualization_memo is None:
+        with _visualization_memo_lock:
+            if _visualization_memo is None:
+                _visualization_memo = VisualizationMemo()
+    return _visualization_memo
+
+
+def has_visualization(entity, get_entity, parent=None):
+    '''
+    has_visualization() of portal-visualization, memoized for the process.
+    '''
+    return get_visualization_memo().has_visualization(entity, get_entity, parent)
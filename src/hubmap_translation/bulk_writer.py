@@ -0,0 +1,337 @@
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from hubmap_translation import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Every document written carries a hash of its content in this top-level field. The index mappings
+# keep it as a stored field and leave it out of _source, so it is never returned to clients.
+CONTENT_HASH_FIELD = 'content_hash'
+
+
+def serialize_document(document: dict):
+    """
+    Return the JSON serialization of a document as it is written, as UTF-8 bytes, and the hash of
+    its content, in one pass over the document.
+
+    The hash is the same however the keys of the document are ordered, and leaves out what changes
+    on every write without changing the content, i.e. the transformation datetime in mapper_metadata
+    and the hash itself. The serialization carries the hash in its content_hash field and, when the
+    document has a mapper_metadata dict, the length in bytes of the document as clients get it, i.e.
+    without content_hash, in mapper_metadata.size, so the size is measured on the same buffer that
+    is written rather than by serializing the document again.
+
+    >>> serialized, document_hash = serialize_document({'b': [1, 2], 'a': 1, 'mapper_metadata': {'version': '1'}})
+    >>> document = json_codec.loads(serialized)
+    >>> document['content_hash'] == document_hash
+    True
+    >>> document['mapper_metadata']
+    {'version': '1', 'size': 61}
+    >>> del document['content_hash']
+    >>> len(json_codec.dumps(document))
+    61
+    """
+    body = json_codec.dumps({k: v for k, v in document.items() if k not in (CONTENT_HASH_FIELD, 'mapper_metadata')},
+                            sort_keys=True)
+    separator = b',' if body != b'{}' else b''
+    mapper_metadata = document.get('mapper_metadata')
+    if isinstance(mapper_metadata, dict):
+        hashed_metadata = {k: v for k, v in mapper_metadata.items() if k not in ('datetime', 'size')}
+        # The size includes mapper_metadata, and so the digits of the size itself
+        size = 0
+        while True:
+            mapper_metadata = {**mapper_metadata, 'size': size}
+            serialized_metadata = json_codec.dumps(mapper_metadata)
+            document_size = len(body) + len(separator) + len(b'"mapper_metadata":') + len(serialized_metadata)
+            if document_size == size:
+                break
+            size = document_size
+    else:
+        hashed_metadata = mapper_metadata
+        serialized_metadata = json_codec.dumps(mapper_metadata)
+    hasher = hashlib.sha256(body)
+    hasher.update(json_codec.dumps(hashed_metadata, sort_keys=True))
+    document_hash = hasher.hexdigest()
+
+    # Append mapper_metadata, and the hash, to the serialized body rather than serializing again
+    trailer = []
+    if 'mapper_metadata' in document:
+        trailer.append(b'"mapper_metadata":' + serialized_metadata)
+    trailer.append(f'"{CONTENT_HASH_FIELD}":"{document_hash}"'.encode('utf-8'))
+    return body[:-1] + separator + b','.join(trailer) + b'}', document_hash
+
+
+def content_hash(document: dict) -> str:
+    """
+    Return the hash of the content of a document, see serialize_document().
+
+    >>> content_hash({'a': 1, 'b': [1, 2]}) == content_hash({'b': [1, 2], 'a': 1})
+    True
+    >>> content_hash({'a': 1, 'mapper_metadata': {'version': '1', 'datetime': '2024-01-01'}}) \\
+    ...     == content_hash({'a': 1, 'mapper_metadata': {'version': '1', 'datetime': '2025-01-01'}})
+    True
+    >>> content_hash({'a': 1}) == content_hash({'a': 2})
+    False
+    """
+    return serialize_document(document)[1]
+
+
+class BulkWriter:
+    """
+    A buffer of documents which are written to OpenSearch with _bulk requests.
+
+    Documents are added with index(), which queues an "index" action for each one. The
+    "index" action replaces any existing document with the same _id, so there is no need
+    to delete a document before writing its new version.
+
+    The buffer is flushed when it reaches max_docs documents or max_bytes bytes of
+    request body, when flush_interval_seconds have passed since the first document went
+    into an empty buffer, and on flush() or close(). Flushes are sent one at a time, in the
+    order the documents were added, so a later version of a document is never overwritten
+    by an earlier one.
+
+    When a document is added more than once before a flush, only its last version is written.
+    Each document is serialized once, by serialize_document(), and written with its content hash.
+    When skip_unchanged is set, the hashes of the documents already in the indices are fetched with
+    one _mget per flush, and documents whose hash is unchanged are not written again.
+
+    Failures are reported per document. Documents OpenSearch rejects with a 429 because
+    it is overloaded, and whole requests which fail with a 429, fail to complete within
+    timeout_seconds or otherwise, or return a response which cannot be decoded, are retried
+    with exponential backoff up to max_retries times. Any other failure is logged with the
+    _id and index of the document and passed to on_item_failure, if given.
+    """
+
+    def __init__(self, http_client, es_urls_by_index: dict, max_docs: int = 500,
+                 max_bytes: int = 10 * 2**20, flush_interval_seconds: float = 5,
+                 max_retries: int = 5, initial_backoff_seconds: float = 1,
+                 skip_unchanged: bool = True, on_item_failure=None, timeout_seconds: float = 60):
+        self.http_client = http_client
+        # Index name -> base URL of the OpenSearch cluster holding the index
+        self.es_urls_by_index = es_urls_by_index
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retries = max_retries
+        self.initial_backoff_seconds = initial_backoff_seconds
+        self.skip_unchanged = skip_unchanged
+        self.on_item_failure = on_item_failure
+        self.timeout_seconds = timeout_seconds
+        # Each buffered action is (index_name, doc_id, ndjson_bytes, content_hash)
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._timer = None
+        # The depth of the runs of each thread, and the number of runs in progress on all threads
+        self._thread_runs = threading.local()
+        self._run_depth = 0
+        self._lock = threading.Lock()
+        # Held for the whole of a flush, so flushes never overlap or reorder documents
+        self._send_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.docs_written = 0
+        self.docs_failed = 0
+        self.docs_skipped = 0
+        self.bulk_requests = 0
+        self.retries = 0
+
+    # The document may be a dict, or its JSON serialization as bytes or str
+    def index(self, index_name: str, doc_id: str, document):
+        if index_name not in self.es_urls_by_index:
+            raise ValueError(f"No OpenSearch URL is configured for the index {index_name}.")
+        if not isinstance(document, dict):
+            document = json_codec.loads(document)
+        # The document is serialized here, once, so the caller is free to modify it after this returns
+        serialized, document_hash = serialize_document(document)
+        action = json_codec.dumps({'index': {'_index': index_name, '_id': doc_id}})
+        ndjson = b"\n".join([action, serialized, b""])
+
+        with self._lock:
+            self._buffer.append((index_name, doc_id, ndjson, document_hash))
+            self._buffer_bytes += len(ndjson)
+            buffer_full = len(self._buffer) >= self.max_docs or self._buffer_bytes >= self.max_bytes
+            if not buffer_full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval_seconds, self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if buffer_full:
+            self.flush()
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Exception flushing OpenSearch bulk writes after the flush interval.")
+
+    def flush(self):
+        with self._send_lock:
+            with self._lock:
+                actions = self._buffer
+                self._buffer = []
+                self._buffer_bytes = 0
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not actions:
+                return
+
+            actions = self._latest_actions(actions)
+            if self.skip_unchanged:
+                actions = self._without_unchanged(actions)
+
+            actions_by_es_url = {}
+            for action in actions:
+                actions_by_es_url.setdefault(self.es_urls_by_index[action[0]], []).append(action)
+            for es_url, es_url_actions in actions_by_es_url.items():
+                # Stay under max_bytes per request even when documents were added faster than
+                # the buffer could be flushed.
+                chunk = []
+                chunk_bytes = 0
+                for action in es_url_actions:
+                    if chunk and (len(chunk) >= self.max_docs or chunk_bytes + len(action[2]) > self.max_bytes):
+                        self._send(es_url, chunk)
+                        chunk = []
+                        chunk_bytes = 0
+                    chunk.append(action)
+                    chunk_bytes += len(action[2])
+                self._send(es_url, chunk)
+
+    def _latest_actions(self, actions: list) -> list:
+        # Keep only the last action for each document, which is the version the index must end up
+        # with. Comparing every version with the stored hash would drop the last one when it matches
+        # what is stored, leaving an intermediate version written.
+        latest_actions = {}
+        for action in actions:
+            latest_actions.pop((action[0], action[1]), None)
+            latest_actions[(action[0], action[1])] = action
+        self.docs_skipped += len(actions) - len(latest_actions)
+        return list(latest_actions.values())
+
+    def _without_unchanged(self, actions: list) -> list:
+        # Drop the actions for documents whose content hash matches the one already indexed. When
+        # the stored hashes cannot be fetched, every document is written.
+        stored_hashes = {}
+        actions_by_es_url = {}
+        for action in actions:
+            actions_by_es_url.setdefault(self.es_urls_by_index[action[0]], []).append(action)
+        for es_url, es_url_actions in actions_by_es_url.items():
+            try:
+                response = self.http_client.post(url=f"{es_url}/_mget"
+                                                 , params={'stored_fields': CONTENT_HASH_FIELD}
+                                                 , json={'docs': [{'_index': index_name, '_id': doc_id}
+                                                                  for index_name, doc_id, _, _ in es_url_actions]}
+                                                 , timeout=self.timeout_seconds)
+                response.raise_for_status()
+                for doc in response.json().get('docs', []):
+                    if doc.get('found'):
+                        stored_hashes[(doc['_index'], doc['_id'])] = doc.get('fields', {}).get(CONTENT_HASH_FIELD, [None])[0]
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(f"Unable to fetch the content hashes of {len(es_url_actions)} documents"
+                               f" from {es_url}, so writing all of them. e={str(e)}")
+
+        changed_actions = [action for action in actions
+                           if stored_hashes.get((action[0], action[1])) != action[3]]
+        self.docs_skipped += len(actions) - len(changed_actions)
+        return changed_actions
+
+    def _send(self, es_url: str, actions: list):
+        attempt = 0
+        while actions:
+            retry_actions = []
+            try:
+                self.bulk_requests += 1
+                response = self.http_client.post(url=f"{es_url}/_bulk"
+                                                 , headers={'Content-Type': 'application/x-ndjson'}
+                                                 , data=b''.join(action[2] for action in actions)
+                                                 , timeout=self.timeout_seconds)
+                if response.status_code == 429:
+                    retry_actions = actions
+                    failure_reason = 'HTTP 429 for the _bulk request'
+                elif not response.ok:
+                    self._fail(actions, f"HTTP {response.status_code} for the _bulk request: {response.text}")
+                    return
+                else:
+                    # The items of the response are in the same order as the actions of the request.
+                    for action, item in zip(actions, json_codec.loads(response.content).get('items', [])):
+                        result = item.get('index', {})
+                        status = result.get('status', 500)
+                        if status == 429:
+                            retry_actions.append(action)
+                        elif status >= 300:
+                            self._fail([action], f"HTTP {status}: {result.get('error')}")
+                        else:
+                            self.docs_written += 1
+                    failure_reason = 'HTTP 429 for documents of the _bulk request'
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # e.g. a connection error, a read timeout, or a response cut short or not JSON.
+                # Which documents were written is unknown, and writing them again is harmless.
+                retry_actions = actions
+                failure_reason = f"{type(e).__name__} for the _bulk request: {str(e)}"
+
+            if retry_actions and attempt >= self.max_retries:
+                self._fail(retry_actions, f"gave up after {self.max_retries} retries of {failure_reason}")
+                return
+            if retry_actions:
+                backoff_seconds = self.initial_backoff_seconds * 2**attempt
+                logger.warning(f"Retrying {len(retry_actions)} of {len(actions)} documents written to {es_url}"
+                               f" in {backoff_seconds} seconds after {failure_reason}.")
+                time.sleep(backoff_seconds)
+                attempt += 1
+                self.retries += 1
+            actions = retry_actions
+
+    def _fail(self, actions: list, reason: str):
+        for index_name, doc_id, _, _ in actions:
+            self.docs_failed += 1
+            logger.error(f"Failed to write document _id={doc_id} to index {index_name}: {reason}")
+            if self.on_item_failure is not None:
+                self.on_item_failure(doc_id, index_name, reason)
+
+    def close(self):
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'docs_written': self.docs_written
+                    , 'docs_failed': self.docs_failed
+                    , 'docs_skipped': self.docs_skipped
+                    , 'bulk_requests': self.bulk_requests
+                    , 'retries': self.retries
+                    , 'docs_buffered': len(self._buffer)}
+
+    @contextmanager
+    def run(self, run_name: str):
+        # Flush whatever is still buffered when the outermost run of a thread ends, so every
+        # document of a reindex run has been written, or reported as failed, by the time the run
+        # returns, even while runs on other threads go on. The statistics are of all the runs in
+        # progress, and are logged when the last of them ends.
+        thread_depth = getattr(self._thread_runs, 'depth', 0)
+        self._thread_runs.depth = thread_depth + 1
+        with self._lock:
+            self._run_depth += 1
+            if self._run_depth == 1:
+                self._reset_stats()
+        try:
+            yield self
+        finally:
+            self._thread_runs.depth = thread_depth
+            if thread_depth == 0:
+                self.flush()
+            with self._lock:
+                self._run_depth -= 1
+                last = self._run_depth == 0
+            if last:
+                stats = self.stats()
+                logger.info(f"OpenSearch bulk writes for {run_name}:"
+                            f" {stats['docs_written']} documents written with"
+                            f" {stats['bulk_requests']} _bulk requests,"
+                            f" {stats['docs_skipped']} unchanged or superseded documents skipped,"
+                            f" {stats['retries']} retries,"
+                            f" {stats['docs_failed']} documents failed.")
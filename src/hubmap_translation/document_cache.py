@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class EntityDocumentCache:
+    """
+    A bounded LRU cache of entity-api responses, with a time-to-live on each entry.
+
+    Entries hold the raw response body rather than the decoded dict, so every caller
+    decodes its own private copy and can modify it freely, and the cache itself is
+    never modified after an entry is stored.
+
+    Loading is single-flight: when many threads miss on the same key at once, e.g. the
+    Donor of every descendant being indexed concurrently by translate_donor_tree(), only
+    one of them calls the loader while the others wait for its result.
+
+    The cache is meant to live for one reindex run. run() clears it when the first
+    run starts and when the last run in progress ends, so nested runs, and runs which
+    overlap on other threads, share it, and separate runs never see each other's
+    documents.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 256 * 2**20, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._loading = {}
+        self._run_depth = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader) -> bytes:
+        while True:
+            with self._lock:
+                content = self._get_unexpired(key)
+                if content is not None:
+                    self.hits += 1
+                    return content
+                loading_event = self._loading.get(key)
+                if loading_event is None:
+                    loading_event = threading.Event()
+                    self._loading[key] = loading_event
+                    self.misses += 1
+                    break
+            # Another thread is loading this key. Wait for it, then look again. If its
+            # loader failed, nothing was stored and this thread will load the key itself.
+            loading_event.wait()
+
+        try:
+            content = loader()
+            with self._lock:
+                self._store(key, content)
+            return content
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading_event.set()
+
+    def _get_unexpired(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, content = entry
+        if time.monotonic() - stored_at >= self.ttl_seconds:
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return content
+
+    def _store(self, key, content: bytes):
+        if key in self._entries:
+            self._discard(key)
+        if len(content) > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic(), content)
+        self._total_bytes += len(content)
+        while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._discard(oldest_key)
+            self.evictions += 1
+
+    def _discard(self, key):
+        _, content = self._entries.pop(key)
+        self._total_bytes -= len(content)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits
+                    , 'misses': self.misses
+                    , 'evictions': self.evictions
+                    , 'entries': len(self._entries)
+                    , 'bytes': self._total_bytes
+                    , 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    @contextmanager
+    def run(self, run_name: str):
+        with self._lock:
+            self._run_depth += 1
+            first = self._run_depth == 1
+        if first:
+            self.clear()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._run_depth -= 1
+                last = self._run_depth == 0
+            if last:
+                stats = self.stats()
+                logger.info(f"Entity document cache for {run_name}:"
+                            f" {stats['hits']} hits, {stats['misses']} misses"
+                            f" ({100 * stats['hit_rate']:.1f}% hit rate),"
+                            f" {stats['evictions']} evictions.")
+                self.clear()
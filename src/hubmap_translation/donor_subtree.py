@@ -0,0 +1,85 @@
+import copy
+from collections import deque
+
+
+class DonorSubtree:
+    """
+    The provenance graph below one Donor, built from data fetched once for the whole subtree.
+
+    infos_by_uuid maps the uuid of the Donor and of each of its descendants to the dict entity-api
+    returns for it from its *-info endpoints, e.g. from descendants-info/<donor uuid>.
+    parent_ids_by_uuid maps the uuid of each descendant to the uuids of its immediate ancestors,
+    which may include entities outside the subtree, e.g. a Sample of another Donor.
+
+    relationships() returns, for one entity, the same lists entity-api would return from its
+    ancestors-info, descendants-info, parents-info and children-info endpoints, without calling them.
+    """
+
+    def __init__(self, donor_uuid: str, infos_by_uuid: dict, parent_ids_by_uuid: dict):
+        self.donor_uuid = donor_uuid
+        self.infos_by_uuid = infos_by_uuid
+        self.parent_ids_by_uuid = dict(parent_ids_by_uuid)
+        self.parent_ids_by_uuid[donor_uuid] = []
+        self.child_ids_by_uuid = {uuid: [] for uuid in infos_by_uuid}
+        for uuid, parent_ids in self.parent_ids_by_uuid.items():
+            for parent_id in parent_ids:
+                if parent_id in self.child_ids_by_uuid:
+                    self.child_ids_by_uuid[parent_id].append(uuid)
+        self._complete = {}
+
+    def is_complete(self, uuid: str) -> bool:
+        # True when every ancestor of the entity is in the subtree, so its relationships can be
+        # calculated locally. Otherwise, e.g. for a Dataset derived from the Samples of two Donors
+        # and everything derived from that Dataset, the relationships must come from entity-api.
+        if uuid not in self._complete:
+            to_check = [uuid]
+            while to_check:
+                current = to_check[-1]
+                if current in self._complete:
+                    to_check.pop()
+                    continue
+                if current not in self.parent_ids_by_uuid or current not in self.infos_by_uuid:
+                    self._complete[current] = False
+                    to_check.pop()
+                    continue
+                unchecked_parent_ids = [p for p in self.parent_ids_by_uuid[current] if p not in self._complete]
+                if unchecked_parent_ids:
+                    to_check.extend(unchecked_parent_ids)
+                    continue
+                self._complete[current] = all(self._complete[p] for p in self.parent_ids_by_uuid[current])
+                to_check.pop()
+        return self._complete[uuid]
+
+    def relationships(self, uuid: str):
+        # Returns None when the entity is not complete, see is_complete(),
+        # or when the info of one of its relatives is missing.
+        if not self.is_complete(uuid):
+            return None
+        relative_ids = {
+            # Farthest ancestor first, as returned by entity-api
+            'ancestors-info': list(reversed(self._traverse(uuid, self.parent_ids_by_uuid)))
+            , 'descendants-info': self._traverse(uuid, self.child_ids_by_uuid)
+            , 'parents-info': self.parent_ids_by_uuid[uuid]
+            , 'children-info': self.child_ids_by_uuid[uuid]
+        }
+        if any(relative_id not in self.infos_by_uuid for ids in relative_ids.values() for relative_id in ids):
+            return None
+        return {endpoint_base: self._infos(ids) for endpoint_base, ids in relative_ids.items()}
+
+    def _traverse(self, uuid: str, edges: dict) -> list:
+        # Breadth first, nearest relatives first, each relative once
+        visited = {uuid}
+        relative_ids = []
+        queue = deque(edges.get(uuid, []))
+        while queue:
+            relative_id = queue.popleft()
+            if relative_id in visited:
+                continue
+            visited.add(relative_id)
+            relative_ids.append(relative_id)
+            queue.extend(edges.get(relative_id, []))
+        return relative_ids
+
+    def _infos(self, uuids) -> list:
+        # Each caller gets its own copies, which it is free to modify
+        return [copy.deepcopy(self.infos_by_uuid[uuid]) for uuid in uuids]
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Same formula concurrent.futures.ThreadPoolExecutor uses for its default max_workers,
+# which is the width of every executor the Translator creates. A host pool this size
+# lets every worker thread keep its own connection alive between calls.
+DEFAULT_POOL_MAXSIZE = min(32, (os.cpu_count() or 1) + 4)
+
+
+class PooledHTTPClient:
+    """
+    A keep-alive HTTP client which can be shared by every thread of a process.
+
+    Each thread gets its own requests.Session, so nothing like cookies leaks between
+    threads, but all the sessions are mounted on the same HTTPAdapter instances. The
+    urllib3 connection pools of those adapters are thread-safe and are where the
+    TCP/TLS connections live, so a connection opened by one thread is reused by any other.
+
+    Hosts can be given their own pool size with set_pool_maxsize(), typically to match
+    the width of the executor whose threads call that host.
+    """
+
+    def __init__(self, default_pool_maxsize: int = DEFAULT_POOL_MAXSIZE):
+        self._lock = threading.Lock()
+        self._thread_local = threading.local()
+        self._default_adapter = HTTPAdapter(pool_connections=10
+                                            , pool_maxsize=default_pool_maxsize)
+        # URL prefix -> HTTPAdapter for hosts with a dedicated pool size
+        self._prefix_adapters = {}
+        self._prefix_pool_maxsizes = {}
+
+    def set_pool_maxsize(self, url_prefix: str, pool_maxsize: int):
+        # Only ever grow a pool, so several Translator instances sharing this client
+        # can each ask for the size they need without shrinking another's pool.
+        url_prefix = url_prefix.rstrip('/') + '/'
+        with self._lock:
+            if self._prefix_pool_maxsizes.get(url_prefix, 0) >= pool_maxsize:
+                return
+            # The mapping is copied rather than mutated so threads building their
+            # sessions never iterate a dict which is changing underneath them.
+            prefix_adapters = dict(self._prefix_adapters)
+            prefix_adapters[url_prefix] = HTTPAdapter(pool_connections=1
+                                                      , pool_maxsize=pool_maxsize)
+            self._prefix_adapters = prefix_adapters
+            self._prefix_pool_maxsizes[url_prefix] = pool_maxsize
+        logger.debug(f"Connection pool for {url_prefix} set to pool_maxsize={pool_maxsize}")
+
+    def _session(self) -> requests.Session:
+        prefix_adapters = self._prefix_adapters
+        session = getattr(self._thread_local, 'session', None)
+        if session is None or self._thread_local.prefix_adapters is not prefix_adapters:
+            session = requests.Session()
+            session.mount('https://', self._default_adapter)
+            session.mount('http://', self._default_adapter)
+            for url_prefix, adapter in prefix_adapters.items():
+                session.mount(url_prefix, adapter)
+            self._thread_local.session = session
+            self._thread_local.prefix_adapters = prefix_adapters
+        return session
+
+    def request(self, method, url, **kwargs):
+        return self._session().request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def connection_stats(self) -> dict:
+        """
+        Return connection reuse statistics for each host the client has talked to, as
+
+            {'<scheme>://<host>:<port>': {'requests': n, 'connections': m, 'reused': n - m}, ...}
+
+        The counts come from urllib3, which records every new connection a pool opens and
+        every request it sends, so 'reused' is the number of requests which did not pay
+        for a TCP/TLS handshake.
+        """
+        stats = {}
+        adapters = [self._default_adapter] + list(self._prefix_adapters.values())
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                host = f"{pool.scheme}://{pool.host}:{pool.port}"
+                host_stats = stats.setdefault(host, {'requests': 0, 'connections': 0, 'reused': 0})
+                host_stats['requests'] += pool.num_requests
+                host_stats['connections'] += pool.num_connections
+                host_stats['reused'] = host_stats['requests'] - host_stats['connections']
+        return stats
+
+    def log_connection_stats(self, log_level: int = logging.INFO):
+        for host, host_stats in self.connection_stats().items():
+            reuse_pct = 100 * host_stats['reused'] / host_stats['requests'] if host_stats['requests'] else 0
+            logger.log(level=log_level
+                       , msg=f"Connection reuse for {host}:"
+                             f" {host_stats['requests']} requests over"
+                             f" {host_stats['connections']} connections,"
+                             f" {reuse_pct:.1f}% reused.")
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def get_shared_client() -> PooledHTTPClient:
+    # One client per process, so every Translator instance in the process draws on
+    # the same warm connection pools.
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = PooledHTTPClient()
+    return _shared_client
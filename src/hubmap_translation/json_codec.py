@@ -0,0 +1,44 @@
+"""
+Encoding and decoding of the JSON documents search-api reads from entity-api and writes to
+OpenSearch, with orjson.
+
+dumps() returns compact UTF-8 bytes, which are handed to the HTTP layer as the body of a request
+as they are, rather than as a str which requests would encode again. The content hashes of the
+bulk writer are computed from these bytes, so they depend on the formatting of orjson alone.
+"""
+import json
+
+import orjson
+
+_OPTION = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def dumps(obj, sort_keys: bool = False) -> bytes:
+    """
+    Return the compact JSON serialization of obj as UTF-8 bytes. Values JSON has no type for,
+    e.g. datetimes, are serialized as their str().
+
+    >>> dumps({'b': 'caf\\u00e9', 'a': [1, 2.5, None]}, sort_keys=True)
+    b'{"a":[1,2.5,null],"b":"caf\\xc3\\xa9"}'
+    >>> dumps([1e16, -1.5e-07, float('nan')])
+    b'[1e16,-1.5e-7,null]'
+    """
+    option = _OPTION | orjson.OPT_SORT_KEYS if sort_keys else _OPTION
+    try:
+        return orjson.dumps(obj, default=str, option=option)
+    except orjson.JSONEncodeError:
+        # e.g. an integer wider than 64 bits, which only the json module can serialize. A document
+        # always takes the same path, so its content hash is still stable.
+        return json.dumps(obj, sort_keys=sort_keys, separators=(',', ':'), ensure_ascii=False,
+                          default=str).encode('utf-8')
+
+
+def loads(data):
+    """
+    Return the object serialized in data, which may be bytes, e.g. the content of an HTTP
+    response, or str.
+
+    >>> loads(b'{"a":[1,2.5,null]}')
+    {'a': [1, 2.5, None]}
+    """
+    return orjson.loads(data)
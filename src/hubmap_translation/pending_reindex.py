@@ -0,0 +1,103 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] is the pending key of an entity, ARGV[1] the priority to enqueue it with (a lower number
+# is more urgent), ARGV[2] the TTL of the key in seconds, and ARGV[3] '1' to always enqueue.
+# Returns the generation the new job must carry, or nil when the entity is already pending with
+# the same or a more urgent priority and no job should be enqueued.
+_CLAIM_SCRIPT = """
+local pending_priority = redis.call('HGET', KEYS[1], 'priority')
+if pending_priority and ARGV[3] ~= '1' and tonumber(pending_priority) <= tonumber(ARGV[1]) then
+    return false
+end
+local generation = redis.call('HINCRBY', KEYS[1], 'generation', 1)
+-- The new job supersedes any pending one, so its priority is the one pending, even when forced at
+-- a less urgent priority.
+redis.call('HSET', KEYS[1], 'priority', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return generation
+"""
+
+# KEYS[1] is the pending key of an entity and ARGV[1] the generation of the job starting, or '' for
+# a job enqueued without one. Returns 1 when the job should run, after clearing the key so later
+# updates to the entity enqueue a new job, or 0 when a newer job for the entity has been enqueued.
+_RELEASE_SCRIPT = """
+local generation = redis.call('HGET', KEYS[1], 'generation')
+if generation and ARGV[1] ~= '' and generation ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+# KEYS[1] is the pending key of an entity and ARGV[1] the generation of a claim whose job could not
+# be enqueued. Clears the key unless the entity has been claimed again since, so the entity is not
+# left pending without a job. Returns 1 when the key was cleared.
+_UNCLAIM_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'generation') == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+class PendingReindexSet:
+    """
+    Redis-backed tracking of the entities with a reindex job waiting in the job queue, keyed by
+    (entity uuid, signature of the indices the job writes to).
+
+    Before a job is enqueued, claim() records the entity as pending. A job for an entity which is
+    already pending with the same or a more urgent priority is dropped. A job for an entity pending
+    with a less urgent priority is enqueued with a new generation, which promotes the entity to the
+    more urgent priority, and the older job skips itself when release() finds a newer generation.
+    Jobs call release() as they start, so updates to an entity made while it is being reindexed
+    enqueue a new job.
+
+    When a claimed job cannot be enqueued, unclaim_many() clears the claim again, so the entity is
+    not left pending without a job. Keys expire after ttl_seconds, so an entity whose job was lost is not kept pending forever.
+    """
+
+    KEY_PREFIX = 'search-api:pending-reindex'
+
+    def __init__(self, redis_client, ttl_seconds: int = 86400):
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self._claim_script = redis_client.register_script(_CLAIM_SCRIPT)
+        self._release_script = redis_client.register_script(_RELEASE_SCRIPT)
+        self._unclaim_script = redis_client.register_script(_UNCLAIM_SCRIPT)
+
+    def _key(self, entity_id, indices_signature):
+        return f"{self.KEY_PREFIX}:{indices_signature}:{entity_id}"
+
+    def claim_many(self, entity_ids, indices_signature: str, priority: int, force: bool = False) -> dict:
+        # Returns {entity_id: generation} for the entities whose jobs should be enqueued
+        entity_ids = list(entity_ids)
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for entity_id in entity_ids:
+            self._claim_script(keys=[self._key(entity_id, indices_signature)]
+                               , args=[priority, self.ttl_seconds, '1' if force else '0']
+                               , client=pipeline)
+        generations = pipeline.execute()
+        return {entity_id: int(generation)
+                for entity_id, generation in zip(entity_ids, generations) if generation is not None}
+
+    def claim(self, entity_id, indices_signature: str, priority: int, force: bool = False):
+        # Returns the generation for the job to enqueue, or None when it should not be enqueued
+        return self.claim_many([entity_id], indices_signature, priority, force=force).get(entity_id)
+
+    def unclaim_many(self, generations: dict, indices_signature: str):
+        # Takes the {entity_id: generation} returned by claim_many() for jobs which were not enqueued
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for entity_id, generation in generations.items():
+            self._unclaim_script(keys=[self._key(entity_id, indices_signature)]
+                                 , args=[str(generation)]
+                                 , client=pipeline)
+        pipeline.execute()
+
+    def release(self, entity_id, indices_signature: str, generation=None) -> bool:
+        # Returns False when the job of this generation has been superseded and should not run
+        result = self._release_script(keys=[self._key(entity_id, indices_signature)]
+                                      , args=['' if generation is None else str(generation)])
+        return result == 1
@@ -0,0 +1,173 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def remove_fields(a_dict, obj_to_remove, include_mapped=False):
+    """
+    Remove a string field from a dictionary, or call recursively if the object passed in is a dict
+    or list rather than a str. With include_mapped, a field of a transformed document which a
+    transformer mapped from a removed field, named mapped_<field>, is removed along with it.
+
+    This walks the rules for every document it is applied to, so documents are generated with an
+    ExclusionPlan compiled from the rules instead, which removes the same fields.
+
+    >>> remove_fields({'a': 1, 'b': {'c': 2, 'd': 3}}, ['a', {'b': 'c'}])
+    {'b': {'d': 3}}
+    """
+    # Most of the code of this method is designed to work with a dict, so if
+    # given a list instead, apply obj_to_remove to each element of the list
+    if isinstance(a_dict, list):
+        for list_entry in a_dict:
+            remove_fields(list_entry, obj_to_remove, include_mapped=include_mapped)
+    elif isinstance(obj_to_remove, str):
+        if obj_to_remove in a_dict:
+            a_dict.pop(obj_to_remove)
+        if include_mapped:
+            a_dict.pop(f"mapped_{obj_to_remove}", None)
+    elif isinstance(obj_to_remove, list):
+        for obj in obj_to_remove:
+            # Recursively remove each element in the list
+            a_dict = remove_fields(a_dict, obj, include_mapped=include_mapped)
+    elif isinstance(obj_to_remove, dict):
+        for k, v in obj_to_remove.items():
+            # Recursively process the value for each dictionary key
+            if k in a_dict:
+                a_dict[k] = remove_fields(a_dict[k], v, include_mapped=include_mapped)
+            if include_mapped and isinstance(a_dict.get(f"mapped_{k}"), (dict, list)):
+                a_dict[f"mapped_{k}"] = remove_fields(a_dict[f"mapped_{k}"], v, include_mapped=include_mapped)
+    else:
+        logger.error(f"Unable to process obj_to_remove.type()={type(obj_to_remove)}")
+        raise Exception('Error generating public document. See logs.')
+    return a_dict
+
+
+class _Node:
+    __slots__ = ('removed', 'children')
+
+    def __init__(self):
+        # Fields removed at this level of the document
+        self.removed = set()
+        # Field -> _Node of the rules for the value of the field
+        self.children = {}
+
+
+class ExclusionPlan:
+    """
+    The public document exclusion rules of one entity type, compiled into a trie of the paths they
+    remove, which is applied to a document in one pass over just those paths.
+
+    The rules have the shape of the excluded_properties_from_public_response lists of the entity-api
+    provenance_schema.yaml: a field name, a dict of field names to the rules for their values, or a
+    list of either. The rules for a field whose value is a list of dicts, e.g. origin_samples or
+    datasets, apply to each dict of the list. With include_mapped, the rules also apply to the field
+    named mapped_<field> which a transformer made from a field.
+
+    apply() removes the paths from a document in place, and without() returns a copy of the document
+    without them which shares every value it does not change with the document, as remove_fields()
+    would leave them.
+
+    >>> plan = ExclusionPlan(['lab_id', {'donor': ['lab_id', {'metadata': 'living_donor_data'}]}])
+    >>> doc = {'lab_id': 'X', 'donor': {'lab_id': 'Y', 'metadata': {'living_donor_data': [], 'keep': 1}}}
+    >>> plan.without(doc)
+    {'donor': {'metadata': {'keep': 1}}}
+    >>> doc['lab_id']
+    'X'
+    >>> plan.apply(doc)
+    {'donor': {'metadata': {'keep': 1}}}
+    """
+
+    def __init__(self, rules, include_mapped=False):
+        self.include_mapped = include_mapped
+        self._root = _Node()
+        self._compile(rules, self._root)
+        # Which of the removed fields also have rules for their values does not matter once they
+        # are removed, so drop those rules.
+        self._prune(self._root)
+
+    def _compile(self, rules, node):
+        if isinstance(rules, str):
+            node.removed.add(rules)
+            if self.include_mapped:
+                node.removed.add(f"mapped_{rules}")
+        elif isinstance(rules, list):
+            for rule in rules:
+                self._compile(rule, node)
+        elif isinstance(rules, dict):
+            for field, field_rules in rules.items():
+                fields = [field, f"mapped_{field}"] if self.include_mapped else [field]
+                for name in fields:
+                    self._compile(field_rules, node.children.setdefault(name, _Node()))
+        else:
+            logger.error(f"Unable to compile public document exclusion rule of type {type(rules)}")
+            raise Exception('Error compiling public document exclusions. See logs.')
+
+    def _prune(self, node):
+        for field in list(node.children):
+            if field in node.removed:
+                del node.children[field]
+            else:
+                self._prune(node.children[field])
+
+    def apply(self, document):
+        self._apply(self._root, document)
+        return document
+
+    def _apply(self, node, value):
+        if isinstance(value, list):
+            for entry in value:
+                self._apply(node, entry)
+        elif isinstance(value, dict):
+            for field in node.removed:
+                value.pop(field, None)
+            for field, child in node.children.items():
+                if field in value:
+                    self._apply(child, value[field])
+
+    def without(self, document):
+        return self._without(self._root, document)
+
+    def _without(self, node, value):
+        if isinstance(value, list):
+            entries = [self._without(node, entry) for entry in value]
+            return value if all(new is old for new, old in zip(entries, value)) else entries
+        if not isinstance(value, dict):
+            return value
+        changed = {}
+        for field, child in node.children.items():
+            if field in value:
+                child_value = self._without(child, value[field])
+                if child_value is not value[field]:
+                    changed[field] = child_value
+        if not changed and node.removed.isdisjoint(value):
+            return value
+        copied = {k: v for k, v in value.items() if k not in node.removed}
+        copied.update(changed)
+        return copied
+
+
+def derive_public_transformed_doc(transformed_doc: dict, public_descendant_uuids, exclusion_plan,
+                                  refresh_relative_fields):
+    """
+    Make the public document of an entity from its transformed private document: drop the descendants
+    whose uuids are not in public_descendant_uuids, remove the fields of exclusion_plan, then call
+    refresh_relative_fields() of the transformer on the document, to recompute what it derived from
+    the relatives and fields which were removed. The exclusion_plan, if any, is compiled with
+    include_mapped, so a field the transformer mapped from an excluded field goes with it.
+
+    This makes the same document as transforming the public document of the entity would. The fields
+    are removed with without(), as they were from the entity, rather than apply(): a relative can be
+    the value of more than one field, e.g. the donor of a Dataset is also the first of its donors, and
+    the rules of one field must leave the other as it is.
+
+    >>> doc = {'lab_id': 'X', 'mapped_lab_id': 'x', 'descendants': [{'uuid': 'a'}, {'uuid': 'b'}]}
+    >>> derive_public_transformed_doc(doc, {'b'}, ExclusionPlan(['lab_id'], include_mapped=True), lambda doc: None)
+    {'descendants': [{'uuid': 'b'}]}
+    """
+    for field in ['descendants', 'immediate_descendants']:
+        if field in transformed_doc:
+            transformed_doc[field] = [d for d in transformed_doc[field] if d.get('uuid') in public_descendant_uuids]
+    if exclusion_plan is not None:
+        transformed_doc = exclusion_plan.without(transformed_doc)
+    refresh_relative_fields(transformed_doc)
+    return transformed_doc
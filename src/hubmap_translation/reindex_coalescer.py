@@ -0,0 +1,99 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ReindexCoalescer:
+    """
+    Merge the reindexes of related entities requested within a time window.
+
+    The first add() for a key opens a window of window_seconds. The entity ids of every add()
+    for that key until the window closes are unioned, and when it closes the callback of the
+    latest add() is called once with the union, on a timer thread. So when ingest updates many
+    entities of one Donor tree within a few seconds, each entity of the tree is reindexed once,
+    rather than once for every update.
+
+    discard() drops an entity id from the pending set of a key, for when the entity has been
+    reindexed by other means since it was added.
+
+    The timer threads are daemons, so the windows still open when the process exits would be
+    lost. close(), which is meant to be called at exit, logs and reindexes them right away, on
+    the calling thread, and every add() after it reindexes its entities right away too.
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        # key -> (set of pending entity ids, callback)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.requests = 0
+        self.ids_requested = 0
+        self.ids_reindexed = 0
+
+    def add(self, key, entity_ids, callback):
+        with self._lock:
+            self.requests += 1
+            self.ids_requested += len(entity_ids)
+            closed = self._closed
+            if closed:
+                self.ids_reindexed += len(set(entity_ids))
+            elif key in self._pending:
+                pending_ids, _ = self._pending[key]
+                pending_ids.update(entity_ids)
+                self._pending[key] = (pending_ids, callback)
+                return
+            else:
+                self._pending[key] = (set(entity_ids), callback)
+        if closed:
+            self._reindex(set(entity_ids), callback)
+            return
+        timer = threading.Timer(self.window_seconds, self._flush, args=[key])
+        timer.daemon = True
+        timer.start()
+
+    def discard(self, key, entity_id):
+        with self._lock:
+            if key in self._pending:
+                self._pending[key][0].discard(entity_id)
+
+    def _flush(self, key):
+        with self._lock:
+            if key not in self._pending:
+                # Already reindexed by close()
+                return
+            pending_ids, callback = self._pending.pop(key)
+            self.ids_reindexed += len(pending_ids)
+        stats = self.stats()
+        logger.info(f"Reindexing {len(pending_ids)} related entities coalesced over {self.window_seconds} seconds."
+                    f" {stats['ids_reindexed']} entity reindexes for {stats['requests']} requests so far,"
+                    f" {stats['reindexes_avoided']} avoided.")
+        self._reindex(pending_ids, callback)
+
+    def _reindex(self, pending_ids, callback):
+        try:
+            callback(pending_ids)
+        except Exception:
+            logger.exception(f"Exception reindexing {len(pending_ids)} coalesced related entities:"
+                             f" {sorted(pending_ids)}")
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            pending = self._pending
+            self._pending = {}
+            self.ids_reindexed += sum(len(pending_ids) for pending_ids, _ in pending.values())
+        for key, (pending_ids, callback) in pending.items():
+            logger.warning(f"Reindexing {len(pending_ids)} related entities of {key} before their window closed,"
+                           f" as the process is exiting: {sorted(pending_ids)}")
+            self._reindex(pending_ids, callback)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending_count = sum(len(pending_ids) for pending_ids, _ in self._pending.values())
+            return {'requests': self.requests
+                    , 'ids_requested': self.ids_requested
+                    , 'ids_reindexed': self.ids_reindexed
+                    , 'ids_pending': pending_count
+                    , 'reindexes_avoided': self.ids_requested - self.ids_reindexed - pending_count}
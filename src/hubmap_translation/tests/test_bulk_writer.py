@@ -0,0 +1,258 @@
+import threading
+
+import pytest
+import requests
+
+from hubmap_translation import json_codec
+from hubmap_translation.bulk_writer import BulkWriter, content_hash
+
+_ES_URL = 'http://opensearch:9200'
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = json_codec.dumps(body if body is not None else {})
+        self.text = self.content.decode('utf-8')
+
+    def json(self):
+        return json_codec.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(f'HTTP {self.status_code}')
+
+
+class FakeOpenSearch:
+    '''
+    Answers _mget from the documents it holds, and _bulk by storing the documents, or with the
+    statuses queued in bulk_statuses: an int for the whole request, a list with one per item, an
+    exception to raise, or bytes for the body of a 200 response.
+    '''
+
+    def __init__(self, stored=None):
+        # (index, _id) -> document
+        self.stored = dict(stored or {})
+        self.bulk_statuses = []
+        self.bulk_bodies = []
+        self.timeouts = []
+
+    def post(self, url, params=None, json=None, headers=None, data=None, timeout=None):
+        self.timeouts.append(timeout)
+        if url.endswith('/_mget'):
+            # content_hash is a stored field, left out of _source
+            assert params == {'stored_fields': 'content_hash'}
+            return FakeResponse(body={'docs': [
+                {'_index': doc['_index'], '_id': doc['_id'], 'found': True,
+                 'fields': {'content_hash': [self.stored[(doc['_index'], doc['_id'])]['content_hash']]}}
+                if (doc['_index'], doc['_id']) in self.stored
+                else {'_index': doc['_index'], '_id': doc['_id'], 'found': False}
+                for doc in json['docs']]})
+        assert url == f'{_ES_URL}/_bulk'
+        lines = data.split(b'\n')[:-1]
+        actions = [(json_codec.loads(action)['index'], json_codec.loads(document))
+                   for action, document in zip(lines[::2], lines[1::2])]
+        self.bulk_bodies.append(actions)
+        statuses = self.bulk_statuses.pop(0) if self.bulk_statuses else [201] * len(actions)
+        if isinstance(statuses, Exception):
+            raise statuses
+        if isinstance(statuses, int):
+            return FakeResponse(status_code=statuses)
+        if isinstance(statuses, bytes):
+            response = FakeResponse()
+            response.content = statuses
+            return response
+        items = []
+        for (action, document), status in zip(actions, statuses):
+            if status < 300:
+                self.stored[(action['_index'], action['_id'])] = document
+            items.append({'index': {'_index': action['_index'], '_id': action['_id'], 'status': status,
+                                    'error': None if status < 300 else {'type': 'some_error'}}})
+        return FakeResponse(body={'items': items})
+
+
+def _writer(opensearch, **kwargs):
+    kwargs.setdefault('initial_backoff_seconds', 0)
+    return BulkWriter(http_client=opensearch, es_urls_by_index={'portal': _ES_URL, 'entities': _ES_URL},
+                      flush_interval_seconds=60, **kwargs)
+
+
+def _stored(opensearch, doc_id, index_name='portal'):
+    document = dict(opensearch.stored[(index_name, doc_id)])
+    del document['content_hash']
+    return document
+
+
+def test_writes_and_skips_unchanged():
+    opensearch = FakeOpenSearch()
+    writer = _writer(opensearch)
+    writer.index('portal', 'a', {'uuid': 'a', 'n': 1})
+    writer.index('entities', 'a', {'uuid': 'a', 'n': 1})
+    writer.flush()
+    assert writer.stats()['docs_written'] == 2
+    assert _stored(opensearch, 'a') == {'uuid': 'a', 'n': 1}
+
+    writer.index('portal', 'a', {'n': 1, 'uuid': 'a'})
+    writer.index('entities', 'a', {'uuid': 'a', 'n': 2})
+    writer.flush()
+    assert writer.stats()['docs_skipped'] == 1
+    assert writer.stats()['docs_written'] == 3
+    assert [action['_index'] for action, _ in opensearch.bulk_bodies[-1]] == ['entities']
+
+
+def test_documents_carry_their_size_and_hash():
+    opensearch = FakeOpenSearch()
+    writer = _writer(opensearch)
+    document = {'uuid': 'a', 'description': 'café', 'mapper_metadata': {'version': '1', 'datetime': 'now'}}
+    writer.index('portal', 'a', document)
+    writer.flush()
+    stored = _stored(opensearch, 'a')
+    # The size of the document as clients get it, without content_hash
+    assert stored['mapper_metadata']['size'] == len(json_codec.dumps(stored))
+    assert opensearch.stored[('portal', 'a')]['content_hash'] == content_hash(document)
+
+
+def test_skip_unchanged_can_be_turned_off():
+    document = {'uuid': 'a'}
+    opensearch = FakeOpenSearch({('portal', 'a'): {**document, 'content_hash': content_hash(document)}})
+    writer = _writer(opensearch, skip_unchanged=False)
+    writer.index('portal', 'a', document)
+    writer.flush()
+    assert writer.stats()['docs_written'] == 1
+
+
+def test_last_version_of_a_document_wins():
+    stored = {'uuid': 'a', 'version': 'A'}
+    opensearch = FakeOpenSearch({('portal', 'a'): {**stored, 'content_hash': content_hash(stored)}})
+    writer = _writer(opensearch)
+    # A (stored) -> B -> A leaves A in the index, without writing anything
+    writer.index('portal', 'a', {'uuid': 'a', 'version': 'B'})
+    writer.index('portal', 'a', {'uuid': 'a', 'version': 'A'})
+    writer.index('portal', 'b', {'uuid': 'b', 'version': 'A'})
+    writer.index('portal', 'b', {'uuid': 'b', 'version': 'B'})
+    writer.flush()
+    assert _stored(opensearch, 'a') == stored
+    assert _stored(opensearch, 'b') == {'uuid': 'b', 'version': 'B'}
+    assert len(opensearch.bulk_bodies) == 1
+    assert [action['_id'] for action, _ in opensearch.bulk_bodies[0]] == ['b']
+    assert writer.stats()['docs_skipped'] == 3
+
+
+def test_retries_items_rejected_with_429(mocker):
+    sleep = mocker.patch('hubmap_translation.bulk_writer.time.sleep')
+    opensearch = FakeOpenSearch()
+    opensearch.bulk_statuses = [[201, 429, 429], [429, 201], [201]]
+    writer = _writer(opensearch, initial_backoff_seconds=1)
+    for doc_id in ['a', 'b', 'c']:
+        writer.index('portal', doc_id, {'uuid': doc_id})
+    writer.flush()
+    assert [[action['_id'] for action, _ in body] for body in opensearch.bulk_bodies] == [['a', 'b', 'c'],
+                                                                                          ['b', 'c'],
+                                                                                          ['b']]
+    assert [call.args[0] for call in sleep.call_args_list] == [1, 2]
+    assert writer.stats()['docs_written'] == 3
+    assert writer.stats()['retries'] == 2
+
+
+def test_retries_requests_rejected_with_429_and_gives_up(mocker):
+    mocker.patch('hubmap_translation.bulk_writer.time.sleep')
+    failures = []
+    opensearch = FakeOpenSearch()
+    opensearch.bulk_statuses = [429, 429, 429]
+    writer = _writer(opensearch, max_retries=2,
+                     on_item_failure=lambda doc_id, index_name, reason: failures.append((doc_id, index_name)))
+    writer.index('portal', 'a', {'uuid': 'a'})
+    writer.flush()
+    assert len(opensearch.bulk_bodies) == 3
+    assert failures == [('a', 'portal')]
+    assert writer.stats()['docs_failed'] == 1
+
+
+def test_retries_requests_which_time_out_or_return_no_json(mocker):
+    mocker.patch('hubmap_translation.bulk_writer.time.sleep')
+    opensearch = FakeOpenSearch()
+    opensearch.bulk_statuses = [requests.exceptions.ReadTimeout('read timed out'),
+                                requests.exceptions.ChunkedEncodingError('connection broken'),
+                                b'<html>Bad Gateway</html>']
+    writer = _writer(opensearch, timeout_seconds=7)
+    writer.index('portal', 'a', {'uuid': 'a'})
+    writer.flush()
+    assert len(opensearch.bulk_bodies) == 4
+    assert _stored(opensearch, 'a') == {'uuid': 'a'}
+    assert writer.stats()['retries'] == 3
+    # Both the _mget and the _bulk requests are bounded
+    assert set(opensearch.timeouts) == {7}
+
+
+def test_gives_up_on_requests_which_keep_failing(mocker):
+    mocker.patch('hubmap_translation.bulk_writer.time.sleep')
+    failures = []
+    opensearch = FakeOpenSearch()
+    opensearch.bulk_statuses = [requests.exceptions.ReadTimeout('read timed out')] * 3
+    writer = _writer(opensearch, max_retries=2,
+                     on_item_failure=lambda doc_id, index_name, reason: failures.append((doc_id, index_name)))
+    writer.index('portal', 'a', {'uuid': 'a'})
+    with writer.run('test'):
+        writer.index('portal', 'b', {'uuid': 'b'})
+    assert failures == [('a', 'portal'), ('b', 'portal')]
+    assert writer.stats()['docs_failed'] == 2
+
+
+def test_reports_failed_items_and_writes_the_rest():
+    failures = []
+    opensearch = FakeOpenSearch()
+    opensearch.bulk_statuses = [[201, 400, 201]]
+    writer = _writer(opensearch,
+                     on_item_failure=lambda doc_id, index_name, reason: failures.append((doc_id, index_name)))
+    for doc_id in ['a', 'b', 'c']:
+        writer.index('portal', doc_id, {'uuid': doc_id})
+    writer.flush()
+    assert failures == [('b', 'portal')]
+    assert sorted(doc_id for _, doc_id in opensearch.stored) == ['a', 'c']
+    assert writer.stats()['docs_written'] == 2
+    assert writer.stats()['docs_failed'] == 1
+    # The failed document is not retried
+    assert len(opensearch.bulk_bodies) == 1
+
+
+def test_flushes_when_the_buffer_is_full():
+    opensearch = FakeOpenSearch()
+    writer = _writer(opensearch, max_docs=2)
+    writer.index('portal', 'a', {'uuid': 'a'})
+    assert opensearch.bulk_bodies == []
+    writer.index('portal', 'b', {'uuid': 'b'})
+    assert len(opensearch.bulk_bodies) == 1
+    assert writer.stats()['docs_buffered'] == 0
+
+
+def test_rejects_unknown_indices():
+    writer = _writer(FakeOpenSearch())
+    with pytest.raises(ValueError):
+        writer.index('unknown', 'a', {'uuid': 'a'})
+
+
+def test_each_thread_flushes_its_run():
+    opensearch = FakeOpenSearch()
+    writer = _writer(opensearch)
+    other_run_started = threading.Event()
+    other_run_may_end = threading.Event()
+
+    def other_run():
+        with writer.run('other'):
+            other_run_started.set()
+            other_run_may_end.wait()
+
+    thread = threading.Thread(target=other_run)
+    thread.start()
+    try:
+        other_run_started.wait()
+        # This run ends first, while the other is still in progress, and its document is written
+        with writer.run('outer'):
+            with writer.run('nested'):
+                writer.index('portal', 'a', {'uuid': 'a'})
+            assert opensearch.bulk_bodies == []
+        assert ('portal', 'a') in opensearch.stored
+    finally:
+        other_run_may_end.set()
+        thread.join()
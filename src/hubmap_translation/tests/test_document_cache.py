@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from hubmap_translation.document_cache import EntityDocumentCache
+
+
+def test_overlapping_runs_share_the_cache_until_the_last_ends():
+    cache = EntityDocumentCache()
+    other_run_started = threading.Event()
+    first_run_ended = threading.Event()
+    looked_up = []
+
+    def other_run():
+        with cache.run('other'):
+            cache.get_or_load('a', lambda: b'{"uuid": "a"}')
+            other_run_started.set()
+            first_run_ended.wait()
+            looked_up.append(cache.get_or_load('a', lambda: b'reloaded'))
+
+    thread = threading.Thread(target=other_run)
+    try:
+        with cache.run('first'):
+            thread.start()
+            other_run_started.wait()
+    finally:
+        first_run_ended.set()
+        thread.join()
+    # The first run to end did not clear the cache of the other
+    assert looked_up == [b'{"uuid": "a"}']
+    assert cache.stats()['entries'] == 0
+
+
+def test_concurrent_misses_load_once():
+    cache = EntityDocumentCache()
+    loader_may_return = threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(threading.current_thread().name)
+        loader_may_return.wait()
+        return b'{"uuid": "a"}'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('a', loader)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    try:
+        # Every thread but the loading one waits on it
+        while not loads:
+            time.sleep(0.001)
+    finally:
+        loader_may_return.set()
+        for thread in threads:
+            thread.join()
+    assert len(loads) == 1
+    assert results == [b'{"uuid": "a"}'] * 8
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['hits'] == 7
+
+
+def test_waiters_load_again_when_the_loader_fails():
+    cache = EntityDocumentCache()
+    loading = threading.Event()
+    loader_may_fail = threading.Event()
+    results = []
+
+    def failing_loader():
+        loading.set()
+        loader_may_fail.wait()
+        raise ValueError('entity-api is down')
+
+    def waiter():
+        loading.wait()
+        results.append(cache.get_or_load('a', lambda: b'loaded'))
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    try:
+        threading.Timer(0.05, loader_may_fail.set).start()
+        with pytest.raises(ValueError):
+            cache.get_or_load('a', failing_loader)
+    finally:
+        loader_may_fail.set()
+        thread.join()
+    assert results == [b'loaded']
+    assert cache.get_or_load('a', lambda: b'reloaded') == b'loaded'
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('hubmap_translation.document_cache.time.monotonic', lambda: now[0])
+    cache = EntityDocumentCache(ttl_seconds=60)
+    cache.get_or_load('a', lambda: b'old')
+    now[0] += 59
+    assert cache.get_or_load('a', lambda: b'new') == b'old'
+    now[0] += 1
+    assert cache.get_or_load('a', lambda: b'new') == b'new'
+    assert cache.stats()['entries'] == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = EntityDocumentCache(max_entries=2, max_bytes=20)
+    cache.get_or_load('a', lambda: b'aaa')
+    cache.get_or_load('b', lambda: b'bbb')
+    cache.get_or_load('a', lambda: b'reloaded')
+    cache.get_or_load('c', lambda: b'ccc')
+    assert cache.get_or_load('a', lambda: b'reloaded') == b'aaa'
+    assert cache.get_or_load('b', lambda: b'reloaded') == b'reloaded'
+    # Too big for max_bytes, so returned but not stored
+    assert cache.get_or_load('d', lambda: b'd' * 21) == b'd' * 21
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['bytes'] == 11
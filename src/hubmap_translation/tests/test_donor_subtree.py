@@ -0,0 +1,77 @@
+from hubmap_translation.donor_subtree import DonorSubtree
+
+# donor -> organ -> block -> section-1 -> raw -> processed
+#                         -> section-2 -> raw
+# and other-donor -> other-organ -> multi, a Dataset derived from section-2 too, -> multi-processed
+_PARENT_IDS = {
+    'organ': ['donor'],
+    'block': ['organ'],
+    'section-1': ['block'],
+    'section-2': ['block'],
+    'raw': ['section-1', 'section-2'],
+    'processed': ['raw'],
+    'multi': ['section-2', 'other-organ'],
+    'multi-processed': ['multi'],
+}
+
+
+def _info(uuid):
+    return {'uuid': uuid, 'entity_type': 'Donor' if uuid == 'donor' else 'Sample'}
+
+
+def _subtree(parent_ids=None, missing=()):
+    parent_ids = _PARENT_IDS if parent_ids is None else parent_ids
+    uuids = {'donor', *parent_ids}
+    # The parents-info of multi also returns other-organ, though it is outside the subtree
+    uuids.add('other-organ')
+    infos = {uuid: _info(uuid) for uuid in uuids if uuid not in missing}
+    return DonorSubtree(donor_uuid='donor', infos_by_uuid=infos, parent_ids_by_uuid=parent_ids)
+
+
+def _uuids(relationships):
+    return {endpoint_base: [info['uuid'] for info in infos] for endpoint_base, infos in relationships.items()}
+
+
+def test_relationships_are_ordered_as_by_entity_api():
+    # ancestors-info has the farthest ancestor first, descendants-info the nearest descendant first,
+    # and parents-info and children-info the order of the edges.
+    subtree = _subtree()
+    assert _uuids(subtree.relationships('raw')) == {
+        'ancestors-info': ['donor', 'organ', 'block', 'section-2', 'section-1'],
+        'descendants-info': ['processed'],
+        'parents-info': ['section-1', 'section-2'],
+        'children-info': ['processed'],
+    }
+    assert _uuids(subtree.relationships('donor')) == {
+        'ancestors-info': [],
+        'descendants-info': ['organ', 'block', 'section-1', 'section-2', 'raw', 'multi', 'processed',
+                             'multi-processed'],
+        'parents-info': [],
+        'children-info': ['organ'],
+    }
+    assert _uuids(subtree.relationships('section-2'))['children-info'] == ['raw', 'multi']
+
+
+def test_entities_with_ancestors_outside_the_subtree_are_incomplete():
+    subtree = _subtree()
+    assert subtree.is_complete('processed')
+    assert not subtree.is_complete('multi')
+    assert subtree.relationships('multi') is None
+    assert subtree.relationships('multi-processed') is None
+    # Not below the Donor at all
+    assert subtree.relationships('unknown') is None
+
+
+def test_entities_with_relatives_without_info_are_incomplete():
+    subtree = _subtree(missing=['processed'])
+    assert subtree.relationships('raw') is None
+    assert subtree.relationships('processed') is None
+    # Nor can those whose descendants-info would list it
+    assert subtree.relationships('organ') is None
+    assert _uuids(_subtree().relationships('organ'))['parents-info'] == ['donor']
+
+
+def test_each_caller_gets_its_own_infos():
+    subtree = _subtree()
+    subtree.relationships('raw')['parents-info'][0]['uuid'] = 'changed'
+    assert subtree.relationships('raw')['parents-info'][0]['uuid'] == 'section-1'
@@ -0,0 +1,74 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from hubmap_translation.http_client import PooledHTTPClient, get_shared_client
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _in_thread(function):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(function()))
+    thread.start()
+    thread.join()
+    return results[0]
+
+
+def test_threads_reuse_each_others_connections(server_url):
+    client = PooledHTTPClient()
+    assert client.get(f"{server_url}/a").text == '/a'
+    assert _in_thread(lambda: client.get(f"{server_url}/b").text) == '/b'
+    assert client.get(f"{server_url}/c").text == '/c'
+    host_stats = client.connection_stats()[server_url]
+    assert host_stats == {'requests': 3, 'connections': 1, 'reused': 2}
+
+
+def test_each_thread_has_its_own_session():
+    client = PooledHTTPClient()
+    session = client._session()
+    assert client._session() is session
+    assert _in_thread(client._session) is not session
+
+
+def test_pool_sizes_only_grow(server_url):
+    client = PooledHTTPClient(default_pool_maxsize=2)
+    client.set_pool_maxsize(server_url, 8)
+    session = client._session()
+    adapter = session.get_adapter(f"{server_url}/a")
+    assert adapter is not client._default_adapter
+    assert adapter._pool_maxsize == 8
+    # A smaller size leaves the pool, and the sessions mounted on it, as they are
+    client.set_pool_maxsize(server_url + '/', 4)
+    assert client._session() is session
+    # A larger one is mounted on the sessions of every thread
+    client.set_pool_maxsize(server_url, 16)
+    assert client._session().get_adapter(f"{server_url}/a")._pool_maxsize == 16
+    assert client.get(f"{server_url}/a").text == '/a'
+
+
+def test_one_client_per_process():
+    assert get_shared_client() is get_shared_client()
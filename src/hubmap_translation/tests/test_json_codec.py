@@ -0,0 +1,21 @@
+import datetime
+
+from hubmap_translation import json_codec
+
+
+def test_round_trip():
+    value = {'uuid': 'a', 'count': 3, 'size': 2.5, 'files': [{'rel_path': 'café.txt'}], 'published': None}
+    assert json_codec.loads(json_codec.dumps(value)) == value
+
+
+def test_sort_keys_and_non_str_keys():
+    assert json_codec.dumps({'b': 1, 'a': 2, 3: 'c'}, sort_keys=True) == b'{"3":"c","a":2,"b":1}'
+
+
+def test_values_without_a_json_type_are_serialized_as_str():
+    value = {'at': datetime.datetime(2024, 1, 2, 3, 4, 5)}
+    assert json_codec.dumps(value) == b'{"at":"2024-01-02 03:04:05"}'
+
+
+def test_integers_orjson_cannot_serialize_fall_back_to_the_json_module():
+    assert json_codec.dumps({'big': 2**70}) == b'{"big":1180591620717411303424}'
@@ -0,0 +1,69 @@
+import fakeredis
+import pytest
+
+from hubmap_translation.pending_reindex import PendingReindexSet
+
+_SIGNATURE = 'portal+entities'
+
+
+@pytest.fixture
+def pending():
+    return PendingReindexSet(redis_client=fakeredis.FakeRedis(), ttl_seconds=60)
+
+
+def _priority(pending, entity_id):
+    return int(pending.redis_client.hget(pending._key(entity_id, _SIGNATURE), 'priority'))
+
+
+def test_claim_drops_jobs_pending_at_the_same_or_a_more_urgent_priority(pending):
+    assert pending.claim('a', _SIGNATURE, priority=2) == 1
+    assert pending.claim('a', _SIGNATURE, priority=2) is None
+    assert pending.claim('a', _SIGNATURE, priority=3) is None
+    # Another set of indices is tracked separately
+    assert pending.claim('a', 'entities', priority=2) == 1
+
+
+def test_more_urgent_claim_supersedes_the_pending_job(pending):
+    assert pending.claim('a', _SIGNATURE, priority=2) == 1
+    assert pending.claim('a', _SIGNATURE, priority=1) == 2
+    assert _priority(pending, 'a') == 1
+    # The older job skips itself, the newer one runs and clears the key
+    assert not pending.release('a', _SIGNATURE, generation=1)
+    assert pending.release('a', _SIGNATURE, generation=2)
+    assert pending.claim('a', _SIGNATURE, priority=2) == 1
+
+
+def test_forced_claim_takes_over_the_priority(pending):
+    assert pending.claim('a', _SIGNATURE, priority=1) == 1
+    assert pending.claim('a', _SIGNATURE, priority=2, force=True) == 2
+    assert _priority(pending, 'a') == 2
+    # The pending job is now the less urgent one, so a claim at the same priority is dropped
+    # and a more urgent one is enqueued.
+    assert pending.claim('a', _SIGNATURE, priority=2) is None
+    assert pending.claim('a', _SIGNATURE, priority=1) == 3
+
+
+def test_claim_many_returns_the_entities_to_enqueue(pending):
+    pending.claim('b', _SIGNATURE, priority=1)
+    assert pending.claim_many(['a', 'b', 'c'], _SIGNATURE, priority=2) == {'a': 1, 'c': 1}
+
+
+def test_release_without_generation_always_runs(pending):
+    assert pending.release('a', _SIGNATURE)
+    pending.claim('a', _SIGNATURE, priority=2)
+    assert pending.release('a', _SIGNATURE)
+    assert pending.claim('a', _SIGNATURE, priority=2) == 1
+
+
+def test_unclaim_clears_only_its_own_claim(pending):
+    generations = pending.claim_many(['a', 'b'], _SIGNATURE, priority=2)
+    # 'b' is claimed again, by a job which was enqueued, before 'a' and 'b' are unclaimed
+    assert pending.claim('b', _SIGNATURE, priority=1) == 2
+    pending.unclaim_many(generations, _SIGNATURE)
+    assert pending.claim('a', _SIGNATURE, priority=2) == 1
+    assert pending.claim('b', _SIGNATURE, priority=2) is None
+
+
+def test_keys_expire(pending):
+    pending.claim('a', _SIGNATURE, priority=2)
+    assert 0 < pending.redis_client.ttl(pending._key('a', _SIGNATURE)) <= 60
@@ -0,0 +1,226 @@
+import random
+from copy import deepcopy
+
+import pytest
+
+from hubmap_translation.addl_index_transformations import portal
+from hubmap_translation.addl_index_transformations.portal.soft_assay_cache import get_soft_assay_cache
+from hubmap_translation.public_exclusions import ExclusionPlan, derive_public_transformed_doc, remove_fields
+
+# The shape of the excluded_properties_from_public_response rules of the entity-api
+# provenance_schema.yaml, after Translator.supplement_public_doc_exclusion_dict()
+_DONOR_RULES = ['lab_donor_id', 'label', {'metadata': [{'living_donor_data': ['grouping_code']}, 'lab_id']}]
+_SAMPLE_RULES = ['lab_tissue_sample_id', {'metadata': ['lab_id', 'slide_id']}]
+_DATASET_RULES = [
+    'lab_dataset_id',
+    {'metadata': ['lab_id', 'slide_id']},
+    {'ingest_metadata': {'metadata': ['lab_id', 'slide_id']}},
+]
+RULES = {
+    'Donor': _DONOR_RULES,
+    'Sample': _SAMPLE_RULES + [{'origin_samples': _SAMPLE_RULES}, {'donor': _DONOR_RULES}],
+    'Dataset': _DATASET_RULES + [
+        {'donor': _DONOR_RULES},
+        {'origin_samples': _SAMPLE_RULES},
+        {'source_samples': _SAMPLE_RULES},
+    ],
+    'Collection': [{'datasets': _DATASET_RULES}],
+}
+
+_FIELDS = ['lab_donor_id', 'label', 'metadata', 'living_donor_data', 'grouping_code', 'lab_id',
+           'lab_tissue_sample_id', 'slide_id', 'lab_dataset_id', 'ingest_metadata', 'donor',
+           'origin_samples', 'source_samples', 'datasets', 'uuid', 'status']
+
+
+def _random_value(rng, depth, mapped):
+    kind = rng.random()
+    if depth >= 3 or kind < 0.4:
+        return rng.choice(['x', 1, None, 2.5])
+    if kind < 0.7:
+        return [_random_doc(rng, depth + 1, mapped) for _ in range(rng.randint(0, 2))]
+    return _random_doc(rng, depth + 1, mapped)
+
+
+def _random_doc(rng, depth=0, mapped=False):
+    doc = {}
+    for field in rng.sample(_FIELDS, rng.randint(1, 6)):
+        doc[field] = _random_value(rng, depth, mapped)
+        if mapped and rng.random() < 0.2:
+            doc[f'mapped_{field}'] = _random_value(rng, depth, mapped)
+    return doc
+
+
+def _legacy(doc, rules, include_mapped=False):
+    # remove_fields() fails on rules reaching a scalar where a dict was expected, which entity
+    # documents do not have, so compare on the documents it handles.
+    try:
+        return remove_fields(deepcopy(doc), rules, include_mapped=include_mapped)
+    except (AttributeError, TypeError):
+        return None
+
+
+@pytest.mark.parametrize('entity_type', RULES.keys())
+@pytest.mark.parametrize('include_mapped', [False, True])
+def test_plan_removes_what_remove_fields_removes(entity_type, include_mapped):
+    rng = random.Random(f'{entity_type}-{include_mapped}')
+    plan = ExclusionPlan(RULES[entity_type], include_mapped=include_mapped)
+    compared = 0
+    for _ in range(300):
+        doc = _random_doc(rng, mapped=include_mapped)
+        expected = _legacy(doc, RULES[entity_type], include_mapped=include_mapped)
+        if expected is None:
+            continue
+        compared += 1
+        original = deepcopy(doc)
+
+        assert plan.without(doc) == expected
+        # without() leaves the document as it was
+        assert doc == original
+        assert plan.apply(doc) == expected
+    assert compared > 100
+
+
+def test_without_shares_unchanged_values():
+    plan = ExclusionPlan(RULES['Dataset'])
+    doc = {
+        'uuid': 'u',
+        'lab_dataset_id': 'secret',
+        'files': [{'rel_path': 'a'}],
+        'donor': {'uuid': 'd', 'label': 'secret'},
+        'origin_samples': [{'uuid': 's'}],
+    }
+    public_doc = plan.without(doc)
+    assert public_doc == {
+        'uuid': 'u',
+        'files': [{'rel_path': 'a'}],
+        'donor': {'uuid': 'd'},
+        'origin_samples': [{'uuid': 's'}],
+    }
+    assert public_doc['files'] is doc['files']
+    assert public_doc['origin_samples'] is doc['origin_samples']
+    assert public_doc['donor'] is not doc['donor']
+
+
+def test_without_returns_the_document_when_nothing_is_excluded():
+    doc = {'uuid': 'u', 'donor': {'uuid': 'd'}}
+    assert ExclusionPlan(RULES['Dataset']).without(doc) is doc
+
+
+def test_removes_mapped_fields_with_include_mapped():
+    plan = ExclusionPlan(RULES['Dataset'], include_mapped=True)
+    doc = {
+        'metadata': {'lab_id': 'a', 'keep': 1},
+        'mapped_metadata': {'lab_id': ['a'], 'mapped_slide_id': ['b'], 'keep': [1]},
+        'lab_dataset_id': 'c',
+        'mapped_lab_dataset_id': 'c',
+    }
+    assert plan.apply(doc) == {'metadata': {'keep': 1}, 'mapped_metadata': {'keep': [1]}}
+
+
+def test_rejects_rules_of_other_types():
+    with pytest.raises(Exception):
+        ExclusionPlan(['lab_id', 3])
+
+
+class _SoftAssayResponse:
+    status_code = 200
+    text = 'Logger call requires this'
+
+    def json(self):
+        return {'assaytype': 'salmon_rnaseq_10x', 'contains-pii': False, 'primary': False,
+                'description': 'scRNA-seq (10x Genomics) [Salmon]', 'vitessce-hints': ['is_sc', 'rna']}
+
+    def raise_for_status(self):
+        pass
+
+
+_ORGAN_MAP = {'LY': {'rui_code': 'LY', 'organ_uberon': 'UBERON:0000029', 'term': 'Lymph Node'}}
+_TRANSFORMATION_RESOURCES = {'ingest_api_soft_assay_url': 'abc123', 'token': 'def456', 'organ_map': _ORGAN_MAP}
+
+
+def _donor_metadata():
+    return {
+        'lab_id': 'lab-1',
+        'living_donor_data': [
+            {'data_type': 'Nominal', 'grouping_concept_preferred_term': 'Sex', 'preferred_term': 'Male',
+             'grouping_code': '57312000'},
+            {'data_type': 'Numeric', 'grouping_concept_preferred_term': 'Age', 'data_value': '53',
+             'units': 'years', 'grouping_code': '424144002'},
+        ],
+    }
+
+
+def _portal_dataset_doc():
+    # A Dataset as _generate_doc() hands it to the portal transformation
+    donor = {'uuid': 'donor', 'entity_type': 'Donor', 'lab_donor_id': 'D-1', 'label': 'Donor 1',
+             'metadata': _donor_metadata()}
+    return {
+        'uuid': 'dataset',
+        'hubmap_id': 'HBM123.ABCD.456',
+        'entity_type': 'Dataset',
+        'status': 'Published',
+        'data_access_level': 'public',
+        'creation_action': 'Create Dataset Activity',
+        'group_name': 'University of Florida TMC',
+        'dataset_type': 'RNAseq [Salmon]',
+        'lab_dataset_id': 'lab-dataset-1',
+        'metadata': {'analyte_class': 'RNA', 'lab_id': 'lab-1', 'slide_id': 'slide-1', 'read_count': '1000'},
+        'ingest_metadata': {'dag_provenance_list': [],
+                            'metadata': {'lab_id': 'lab-1', 'slide_id': 'slide-1', 'read_count': '1000'}},
+        'files': [{'rel_path': 'a.fastq', 'description': 'reads', 'size': 10}],
+        # The same dict, as the translator makes them
+        'donor': donor,
+        'donors': [donor],
+        'origin_samples': [{'uuid': 'organ', 'entity_type': 'Sample', 'sample_category': 'organ',
+                            'organ': 'LY', 'lab_tissue_sample_id': 'T-0',
+                            'metadata': {'lab_id': 'lab-1', 'slide_id': 'slide-0', 'volume': '1.5'}}],
+        'source_samples': [{'uuid': 'section', 'entity_type': 'Sample', 'sample_category': 'section',
+                            'lab_tissue_sample_id': 'T-1', 'metadata': {'lab_id': 'lab-1', 'slide_id': 'slide-1'}}],
+        'ancestors': [{'uuid': 'section', 'entity_type': 'Sample'}, {'uuid': 'organ', 'entity_type': 'Sample'},
+                      {'uuid': 'donor', 'entity_type': 'Donor'}],
+        'immediate_ancestors': [{'uuid': 'section', 'entity_type': 'Sample'}],
+        'descendants': [
+            {'uuid': 'published', 'entity_type': 'Dataset', 'status': 'Published',
+             'creation_action': 'Central Process'},
+            {'uuid': 'unpublished', 'entity_type': 'Dataset', 'status': 'QA', 'creation_action': 'Central Process'},
+            {'uuid': 'unpublished-support', 'entity_type': 'Dataset', 'status': 'New',
+             'creation_action': 'Create Dataset Activity'},
+        ],
+        'immediate_descendants': [{'uuid': 'published', 'entity_type': 'Dataset'},
+                                  {'uuid': 'unpublished', 'entity_type': 'Dataset'}],
+    }
+
+
+# Rules excluding fields which the portal transformation maps, to mapped_metadata and
+# mapped_sample_category, along with the rules of a Dataset
+_RULES_OF_MAPPED_FIELDS = RULES['Dataset'] + [{'donor': ['metadata']}, {'origin_samples': ['sample_category']}]
+
+
+@pytest.mark.parametrize('rules', [RULES['Dataset'], _RULES_OF_MAPPED_FIELDS])
+def test_derived_public_doc_is_the_transformed_public_doc(mocker, rules):
+    mocker.patch('requests.get', return_value=_SoftAssayResponse())
+    get_soft_assay_cache().clear()
+    public_descendant_uuids = {'published'}
+    doc = _portal_dataset_doc()
+
+    # Before: the public document was made from the entity, then transformed
+    public_entity = ExclusionPlan(rules).without(doc)
+    for field in ['descendants', 'immediate_descendants']:
+        public_entity[field] = [d for d in public_entity[field] if d['uuid'] in public_descendant_uuids]
+    expected = portal.transform(public_entity, _TRANSFORMATION_RESOURCES, add_size=False)
+
+    # Now: it is derived from the transformed private document
+    private_doc = portal.transform(doc, _TRANSFORMATION_RESOURCES, add_size=False)
+    assert private_doc['donor']['mapped_metadata']['sex'] == ['Male']
+    assert private_doc['origin_samples'][0]['mapped_sample_category'] == 'Organ'
+    assert len(private_doc['descendants']) == 3
+    actual = derive_public_transformed_doc(private_doc, public_descendant_uuids,
+                                           ExclusionPlan(rules, include_mapped=True),
+                                           portal.refresh_relative_fields)
+
+    for public_doc in [expected, actual]:
+        del public_doc['mapper_metadata']['datetime']
+    assert actual == expected
+    assert [d['uuid'] for d in actual['descendants']] == ['published']
+    assert 'lab_dataset_id' not in actual
+    get_soft_assay_cache().clear()
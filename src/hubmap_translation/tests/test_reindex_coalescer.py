@@ -0,0 +1,71 @@
+import threading
+
+from hubmap_translation.reindex_coalescer import ReindexCoalescer
+
+
+def test_reindexes_requested_within_the_window_are_merged():
+    coalescer = ReindexCoalescer(window_seconds=0.05)
+    flushed = threading.Event()
+    calls = []
+
+    def latest_callback(entity_ids):
+        calls.append(('latest', entity_ids))
+        flushed.set()
+
+    coalescer.add('donor', ['a', 'b'], lambda entity_ids: calls.append(('first', entity_ids)))
+    coalescer.add('donor', ['b', 'c', 'd'], latest_callback)
+    coalescer.discard('donor', 'd')
+    assert coalescer.stats()['ids_pending'] == 3
+    assert flushed.wait(5)
+    assert calls == [('latest', {'a', 'b', 'c'})]
+    assert coalescer.stats() == {'requests': 2, 'ids_requested': 5, 'ids_reindexed': 3, 'ids_pending': 0,
+                                 'reindexes_avoided': 2}
+
+
+def test_each_key_and_window_is_flushed_separately():
+    coalescer = ReindexCoalescer(window_seconds=0.01)
+    calls = []
+    flushes = threading.Semaphore(0)
+
+    def callback(entity_ids):
+        calls.append(entity_ids)
+        flushes.release()
+
+    coalescer.add('donor-1', ['a'], callback)
+    coalescer.add('donor-2', ['b'], callback)
+    assert flushes.acquire(timeout=5) and flushes.acquire(timeout=5)
+    # A request after the window closed opens a new one
+    coalescer.add('donor-1', ['a'], callback)
+    assert flushes.acquire(timeout=5)
+    assert sorted(map(sorted, calls)) == [['a'], ['a'], ['b']]
+
+
+def test_a_failing_callback_does_not_stop_later_windows():
+    coalescer = ReindexCoalescer(window_seconds=0.01)
+    flushed = threading.Event()
+
+    def failing_callback(entity_ids):
+        flushed.set()
+        raise ValueError('entity-api is down')
+
+    coalescer.add('donor', ['a'], failing_callback)
+    assert flushed.wait(5)
+    flushed.clear()
+    coalescer.add('donor', ['a'], lambda entity_ids: flushed.set())
+    assert flushed.wait(5)
+
+
+def test_close_reindexes_what_is_pending_and_every_later_request(caplog):
+    coalescer = ReindexCoalescer(window_seconds=60)
+    calls = []
+    coalescer.add('donor-1', ['a', 'b'], lambda entity_ids: calls.append(('donor-1', entity_ids)))
+    coalescer.add('donor-2', ['c'], lambda entity_ids: calls.append(('donor-2', entity_ids)))
+    coalescer.close()
+    assert sorted(calls) == [('donor-1', {'a', 'b'}), ('donor-2', {'c'})]
+    assert 'before their window closed' in caplog.text
+    # The timers of the windows find nothing left to reindex
+    coalescer._flush('donor-1')
+    coalescer.add('donor-1', ['d'], lambda entity_ids: calls.append(('donor-1', entity_ids)))
+    assert calls[-1] == ('donor-1', {'d'})
+    assert len(calls) == 3
+    assert coalescer.stats()['ids_reindexed'] == 4
@@ -1,5 +1,9 @@
+import atexit
 import concurrent.futures
+import contextlib
 import copy
+import functools
+import hashlib
 import importlib
 import requests
 import json
@@ -7,6 +11,7 @@ import logging
 import os
 import re
 import sys
+import threading
 import time
 from redis import Redis, ConnectionError, RedisError
 from urllib3.exceptions import InsecureRequestWarning
@@ -23,6 +28,14 @@ from flask import Flask, Response
 
 # Local modules
 from hubmap_commons.hm_auth import AuthHelper
+from hubmap_translation.http_client import get_shared_client, DEFAULT_POOL_MAXSIZE
+from hubmap_translation.document_cache import EntityDocumentCache
+from hubmap_translation.bulk_writer import BulkWriter
+from hubmap_translation.donor_subtree import DonorSubtree
+from hubmap_translation.reindex_coalescer import ReindexCoalescer
+from hubmap_translation.pending_reindex import PendingReindexSet
+from hubmap_translation.public_exclusions import ExclusionPlan, derive_public_transformed_doc
+from hubmap_translation import json_codec
 
 sys.path.append("search-adaptor/src")
 from indexer import Indexer
@@ -87,6 +100,7 @@ INDEX_GROUP_ENTITIES_DOC_FIELDS = {
     , 'organ': PropertyRetentionEnum.CALC_ONLY # Needed to fill origin_samples
     , 'data_access_level': PropertyRetentionEnum.CALC_ONLY # Needed for is_public() calculations for Sample
     , 'status': PropertyRetentionEnum.CALC_ONLY # Needed for is_public() calculations for Dataset & Publication
+    , 'creation_action': PropertyRetentionEnum.CALC_ONLY # Needed by the portal transformation, see TRANSFORM_ONLY_DESCENDANT_FIELDS
 }
 
 # For ElasticSearch documents being written to the 'portal' indices, these are the
@@ -96,8 +110,74 @@ INDEX_GROUP_PORTAL_DOC_FIELDS = {
     , 'entity_type': PropertyRetentionEnum.ES_DOC
     , 'data_access_level': PropertyRetentionEnum.CALC_ONLY  # Needed for is_public() calculations for Sample
     , 'status': PropertyRetentionEnum.CALC_ONLY  # Needed for is_public() calculations for Dataset & Publication
+    , 'creation_action': PropertyRetentionEnum.CALC_ONLY  # Needed by the transformation, see TRANSFORM_ONLY_DESCENDANT_FIELDS
 }
 
+# Of the fields not retained in the documents of index groups with a transformer, those which are left
+# on the 'descendants' of the document handed to the transformer, and removed from the transformed
+# document. The portal transformation reads them to check the descendants of a Dataset for a
+# visualization, rather than fetching the descendants from entity-api again.
+TRANSFORM_ONLY_DESCENDANT_FIELDS = ['status', 'creation_action']
+
+# Scope the Translator's entity document cache and OpenSearch bulk writes to one call of the
+# decorated method, so the documents of Donors, origin Samples and other relatives are each
+# fetched roughly once per reindex run, and every document of the run has been written when
+# it returns. Nested calls, e.g. translate_donor_tree() within translate_all(), share the
+# cache and the bulk requests of the outermost run of their thread. Runs which overlap on
+# other threads, e.g. reindexes coalesced on a timer thread during a translate(), share the
+# cache until the last of them ends. Transformers which time their stages log the timings
+# of the runs in progress when the last of them ends.
+def reindex_run(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        run_name = f"{method.__name__}()"
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(self.document_cache.run(run_name))
+            stack.enter_context(self.bulk_writer.run(run_name))
+            for transform_context in self.transform_contexts:
+                stack.enter_context(transform_context.run(run_name))
+            return method(self, *args, **kwargs)
+    return wrapper
+
+# Independent entity-api calls for one entity, e.g. its ancestors-info and descendants-info, are
+# issued together on this executor, shared by every Translator of the process. Its width bounds
+# how many such calls are in flight at once, on top of the calls made by the ThreadPoolExecutors
+# each Translator uses to work through many entities.
+_fanout_executor = None
+_fanout_executor_lock = threading.Lock()
+
+def get_fanout_executor():
+    global _fanout_executor
+    if _fanout_executor is None:
+        with _fanout_executor_lock:
+            if _fanout_executor is None:
+                _fanout_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=app.config.get('ENTITY_API_FANOUT_WORKERS', DEFAULT_POOL_MAXSIZE)
+                    , thread_name_prefix='entity-api-fanout')
+    return _fanout_executor
+
+# When REINDEX_COALESCE_WINDOW_SECONDS is set, translate() leaves the reindex of the related entities
+# of an entity to this coalescer, shared by every Translator of the process, which reindexes each
+# related entity once per window however many of the entities it relates to were updated.
+_reindex_coalescer = None
+_reindex_coalescer_lock = threading.Lock()
+
+def get_reindex_coalescer():
+    # Returns None when coalescing is disabled
+    global _reindex_coalescer
+    window_seconds = app.config.get('REINDEX_COALESCE_WINDOW_SECONDS', 0)
+    if not window_seconds:
+        return None
+    if _reindex_coalescer is None:
+        with _reindex_coalescer_lock:
+            if _reindex_coalescer is None:
+                _reindex_coalescer = ReindexCoalescer(window_seconds=window_seconds)
+                # Reindex what is still pending when the process exits, rather than losing it with
+                # the timer threads. uWSGI runs the atexit functions of a worker when it exits or
+                # is reloaded, within worker-reload-mercy.
+                atexit.register(_reindex_coalescer.close)
+    return _reindex_coalescer
+
 class Translator(TranslatorInterface):
     ACCESS_LEVEL_PUBLIC = 'public'
     ACCESS_LEVEL_CONSORTIUM = 'consortium'
@@ -128,6 +208,9 @@ class Translator(TranslatorInterface):
             self.INDICES: dict = {'default_index': self.DEFAULT_INDEX_WITHOUT_PREFIX, 'indices': self.indices}
             self.DEFAULT_ENTITY_API_URL = self.INDICES['indices'][self.DEFAULT_INDEX_WITHOUT_PREFIX]['document_source_endpoint'].strip('/')
             self._ontology_api_base_url = ontology_api_base_url
+            # Per Translator, rather than the lists of the class shared by every Translator of the process
+            self.failed_entity_api_calls = []
+            self.failed_entity_ids = []
 
             if not indices['entity_api_prov_schema_raw_url']:
                 raise Exception(f"Unable read the URL for access to Entity API's provenance_schema.yaml using the translator's"
@@ -138,6 +221,22 @@ class Translator(TranslatorInterface):
 
             self.indexer = Indexer(self.indices, self.DEFAULT_INDEX_WITHOUT_PREFIX)
 
+            # Documents of the reindex-enabled indices are written with OpenSearch _bulk requests
+            # rather than one Indexer call each, see reindex_run()
+            es_urls_by_index = {}
+            for index_group, index_group_config in self.indices.items():
+                for scope in ['public', 'private']:
+                    es_urls_by_index[index_group_config[scope]] = index_group_config['elasticsearch']['url'].strip('/')
+            self.bulk_writer = BulkWriter(http_client=get_shared_client()
+                                          , es_urls_by_index=es_urls_by_index
+                                          , max_docs=app.config.get('BULK_WRITE_MAX_DOCS', 500)
+                                          , max_bytes=app.config.get('BULK_WRITE_MAX_BYTES', 10 * 2**20)
+                                          , flush_interval_seconds=app.config.get('BULK_WRITE_FLUSH_INTERVAL_SECONDS', 5)
+                                          , max_retries=app.config.get('BULK_WRITE_MAX_RETRIES', 5)
+                                          , skip_unchanged=app.config.get('BULK_WRITE_SKIP_UNCHANGED', True)
+                                          , timeout_seconds=app.config.get('BULK_WRITE_TIMEOUT_SECONDS', 60)
+                                          , on_item_failure=self._record_failed_write)
+
             # Keep a dictionary of each ElasticSearch index in an index group which may be
             # looked up for the re-indexing process.
             self.index_group_es_indices = {
@@ -164,6 +263,17 @@ class Translator(TranslatorInterface):
         try:
             self.request_headers = self.create_request_headers_for_auth(token)
             self.entity_api_url = self.indices[self.DEFAULT_INDEX_WITHOUT_PREFIX]['document_source_endpoint'].strip('/')
+            # Every outbound call goes through keep-alive connection pools shared by all the
+            # Translator instances of this process. Size the entity-api pool to the width of
+            # the ThreadPoolExecutors below, so each worker thread keeps a warm connection.
+            # The threads of get_fanout_executor() call entity-api alongside those executors.
+            self.http_client = get_shared_client()
+            self.http_client.set_pool_maxsize(self.entity_api_url
+                                              , DEFAULT_POOL_MAXSIZE + get_fanout_executor()._max_workers)
+            # Entity documents fetched during a reindex run, see reindex_run()
+            self.document_cache = EntityDocumentCache(max_entries=app.config.get('ENTITY_DOCUMENT_CACHE_MAX_ENTRIES', 10000)
+                                                      , max_bytes=app.config.get('ENTITY_DOCUMENT_CACHE_MAX_BYTES', 256 * 2**20)
+                                                      , ttl_seconds=app.config.get('ENTITY_DOCUMENT_CACHE_TTL_SECONDS', 600))
             # Add index_version by parsing the VERSION file
             self.index_version = ((Path(__file__).absolute().parent.parent / 'VERSION').read_text()).strip()
             self.transformation_resources = {'ingest_api_soft_assay_url': self.ingest_api_soft_assay_url,
@@ -176,6 +286,11 @@ class Translator(TranslatorInterface):
 
             # # Preload all the transformers
             self.init_transformers()
+            # The per-process contexts of the transformers which have one, e.g. portal's, which
+            # time the stages of their transformations.
+            self.transform_contexts = [transformer.get_transform_context()
+                                       for transformer in set(self.TRANSFORMERS.values())
+                                       if hasattr(transformer, 'get_transform_context')]
 
             # Preload the list of fields per entity type to be excluded from public index documents, from the
             # source also used by entity-api
@@ -184,6 +299,7 @@ class Translator(TranslatorInterface):
             # nested fields which the loaded Entity API YAML does not know about. Supplement the
             # dictionary so the fields are excluded throughout the document in the public index.
             self.supplement_public_doc_exclusion_dict()
+            self.compile_public_doc_exclusion_plans()
         except Exception as e:
             msg = 'Error configuring translator during initialization'
             logger.error(f"{msg}, e={str(e)}")
@@ -226,6 +342,7 @@ class Translator(TranslatorInterface):
                     , msg=f"\tTRANSFORMERS={self.TRANSFORMERS}")
 
     # Used by full reindex via script and live reindex-all call
+    @reindex_run
     def translate_all(self):
         with app.app_context():
             try:
@@ -272,7 +389,7 @@ class Translator(TranslatorInterface):
                     logger.info(f"The number of worker threads being used by default: {executor._max_workers}")
 
                     # Submit tasks to the thread pool
-                    collection_futures_list = [executor.submit(self.translate_collection, uuid, reindex=True) for uuid in collection_uuids_list]
+                    collection_futures_list = [executor.submit(self.translate_collections, collection_uuids_list, reindex=True)]
                     upload_futures_list = [executor.submit(self.translate_upload, uuid, reindex=True) for uuid in upload_uuids_list]
 
                     # Append the above lists into one
@@ -290,12 +407,14 @@ class Translator(TranslatorInterface):
                 end = time.time()
 
                 logger.info(f"Finished executing translate_all(). Total time used: {end - start} seconds.")
+                self.http_client.log_connection_stats()
             except Exception as e:
                 logger.error(e)
 
     # Used by full reindex scripts only.
     # Assumes the index named indices are already created and empty.
     # Require Data Admin privileges to execute.
+    @reindex_run
     def translate_full(self, reindex_queue=None, index_override=None):
         auth_helper_instance = self.init_auth_helper()
         if not auth_helper_instance.has_data_admin_privs(self.token):
@@ -333,7 +452,7 @@ class Translator(TranslatorInterface):
                 else:
                     with concurrent.futures.ThreadPoolExecutor() as executor:
                         logger.info(f"The number of worker threads being used by default: {executor._max_workers}")
-                        collection_futures_list = [executor.submit(self.translate_collection, uuid, reindex=True) for uuid in collection_uuids_list]
+                        collection_futures_list = [executor.submit(self.translate_collections, collection_uuids_list, reindex=True)]
                         upload_futures_list = [executor.submit(self.translate_upload, uuid, reindex=True) for uuid in upload_uuids_list]
                         futures_list = collection_futures_list + upload_futures_list
                         for f in concurrent.futures.as_completed(futures_list):
@@ -348,10 +467,12 @@ class Translator(TranslatorInterface):
                 logger.info(f"############# Executing translate_full() took"
                             f" {time.strftime('%H:%M:%S', time.gmtime(elapsed_seconds))}."
                             f" #############")
+                self.http_client.log_connection_stats()
             except Exception as e:
                 logger.exception(e)
 
     # ONLY used by collections-only reindex via script - added by Zhou 7/19/2023
+    @reindex_run
     def translate_all_collections(self):
         with app.app_context():
             try:
@@ -360,22 +481,12 @@ class Translator(TranslatorInterface):
                 start = time.time()
                 collection_uuids_list = get_uuids_by_entity_type("collection", self.request_headers, self.DEFAULT_ENTITY_API_URL)
 
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    # The default number of threads in the ThreadPoolExecutor is calculated as: 
-                    # From 3.8 onwards default value is min(32, os.cpu_count() + 4)
-                    # Where the number of CPUs is determined by Python and will take hyperthreading into account
-                    logger.info(f"The number of worker threads being used by default: {executor._max_workers}")
-
-                    # Submit tasks to the thread pool
-                    collection_futures_list = [executor.submit(self.translate_collection, uuid, reindex=True) for uuid in collection_uuids_list]
-
-                    # The target function runs the task logs more details when f.result() gets executed
-                    for f in concurrent.futures.as_completed(collection_uuids_list):
-                        result = f.result()
+                self.translate_collections(collection_uuids_list, reindex=True)
 
                 end = time.time()
 
                 logger.info(f"Finished executing translate_all_collections(). Total time used: {end - start} seconds.")
+                self.http_client.log_connection_stats()
             except Exception as e:
                 logger.error(e)
 
@@ -614,66 +725,129 @@ class Translator(TranslatorInterface):
         elif entity['entity_type'] == 'Upload':
             self.translate_upload(entity_id=entity_id, reindex=True)
         else:
+            enriched_entity = self._enrich_entity(entity)
             for index_group in index_groups:
                 self._transform_and_write_entity_to_index_group(entity=entity
-                                                                , index_group=index_group)
+                                                                , index_group=index_group
+                                                                , enriched_entity=enriched_entity)
 
         logger.info(f"Finished executing _exec_reindex_entity_to_index_group_by_id()")
 
-    def _transform_and_write_entity_to_index_group(self, entity: dict, index_group: str):
+    # The enriched_entity argument is the result of _enrich_entity() for entity, which callers writing
+    # the entity to several index groups should produce once and pass in for each of them.
+    def _transform_and_write_entity_to_index_group(self, entity: dict, index_group: str, enriched_entity: dict=None):
         logger.info(f"Start executing direct '{index_group}' updates for"
                     f" entity['uuid']={entity['uuid']},"
                     f" entity['entity_type']={entity['entity_type']}")
 
-        try:
+        index_group_docs = self._generate_index_group_docs(entity=entity
+                                                           , index_group=index_group
+                                                           , enriched_entity=enriched_entity)
+        self._transform_index_group_docs(index_group=index_group, index_group_docs_list=[index_group_docs])
+        self._write_index_group_docs(index_group_docs)
+        logger.info(f"Finished direct '{index_group}' updates for"
+                    f" entity['uuid']={entity['uuid']},"
+                    f" entity['entity_type']={entity['entity_type']}")
 
-            doc_entity=copy.deepcopy(entity)
-            private_doc = self._generate_doc(entity=doc_entity, return_type='json', index_group=index_group)
-            if self.is_public(entity):
-                public_doc = self._generate_public_doc(entity=doc_entity
-                                                   , index_group=index_group)
-            del doc_entity
+    # Make the untransformed documents of the entity for the index group, in a dict which
+    # _transform_index_group_docs() adds the transformed documents to and _write_index_group_docs() writes.
+    def _generate_index_group_docs(self, entity: dict, index_group: str, enriched_entity: dict=None):
+        index_group_docs = {'entity': entity
+                            , 'index_group': index_group
+                            , 'enriched_entity': enriched_entity
+                            , 'private_doc': None
+                            , 'public_doc': None
+                            # A transformer which can refresh what it derives from the relatives of a document
+                            # only transforms the private document, and the public one is derived from the result.
+                            , 'derive_public_doc': hasattr(self.TRANSFORMERS.get(index_group), 'refresh_relative_fields')}
+        try:
+            if enriched_entity is None:
+                index_group_docs['enriched_entity'] = enriched_entity = self._enrich_entity(entity)
+            # The documents stay dicts, which the bulk writer hashes and serializes
+            index_group_docs['private_doc'] = self._generate_doc(entity=enriched_entity, return_type='dict', index_group=index_group)
+            if self.is_public(entity) and not index_group_docs['derive_public_doc']:
+                index_group_docs['public_doc'] = self._generate_public_doc(entity=enriched_entity
+                                                                           , index_group=index_group
+                                                                           , return_type='dict')
         except Exception as e:
             msg = f"Exception document generation" \
                 f" for uuid: {entity['uuid']}, entity_type: {entity['entity_type']}" \
                 f" for '{index_group}' reindex caused \'{str(e)}\'"
             logger.exception(msg)
-        if 'private_doc' not in locals() or private_doc is None:
+        if index_group_docs['private_doc'] is None:
             logger.error(f"For {entity['entity_type']} {entity['uuid']},"
                         f" failed to generate document for consortium indices.")
-        docs_to_write_dict = {
-            self.index_group_es_indices[index_group]['private']: None,
-            self.index_group_es_indices[index_group]['public']: None
-        }
+        return index_group_docs
+
+    # Transform the documents of several entities for one index group together, with the transform_batch()
+    # of transformers which have one, and set the documents to write for each entity.
+    def _transform_index_group_docs(self, index_group: str, index_group_docs_list: list):
+        private_index = self.index_group_es_indices[index_group]['private']
+        public_index = self.index_group_es_indices[index_group]['public']
         transformer = self.TRANSFORMERS.get(index_group, None)
         if transformer is None:
             logger.info(f"Unable to find '{index_group}' transformer, indexing documents untransformed.")
-            docs_to_write_dict[self.index_group_es_indices[index_group]['private']] = private_doc
-            if 'public_doc' in locals() and public_doc is not None:
-                docs_to_write_dict[self.index_group_es_indices[index_group]['public']] = public_doc
-        else:
-            private_transformed = transformer.transform(json.loads(private_doc),
-                                                        self.transformation_resources)
-            docs_to_write_dict[self.index_group_es_indices[index_group]['private']] = json.dumps(private_transformed)
-            if 'public_doc' in locals() and public_doc is not None:
-                public_transformed = transformer.transform(json.loads(public_doc),
-                                                        self.transformation_resources)
-                docs_to_write_dict[self.index_group_es_indices[index_group]['public']] = json.dumps(public_transformed)
-        for index_name in docs_to_write_dict.keys():
-            if docs_to_write_dict[index_name] is None:
+            for index_group_docs in index_group_docs_list:
+                index_group_docs['docs_to_write'] = {private_index: index_group_docs['private_doc']
+                                                     , public_index: index_group_docs['public_doc']}
+            return
+
+        docs = []
+        doc_targets = []
+        for index_group_docs in index_group_docs_list:
+            index_group_docs['docs_to_write'] = {private_index: None, public_index: None}
+            if index_group_docs['private_doc'] is not None:
+                docs.append(index_group_docs['private_doc'])
+                doc_targets.append((index_group_docs, private_index))
+            if index_group_docs['public_doc'] is not None:
+                docs.append(index_group_docs['public_doc'])
+                doc_targets.append((index_group_docs, public_index))
+        for (index_group_docs, index_name), transformed_doc in zip(doc_targets, self._transform_docs(transformer, docs)):
+            self._strip_transform_only_fields(transformed_doc)
+            index_group_docs['docs_to_write'][index_name] = transformed_doc
+
+        for index_group_docs in index_group_docs_list:
+            private_transformed = index_group_docs['docs_to_write'][private_index]
+            if index_group_docs['derive_public_doc'] and private_transformed is not None \
+                    and self.is_public(index_group_docs['entity']):
+                # Derived from the private document once that has been serialized, by _write_index_group_docs().
+                index_group_docs['docs_to_write'][public_index] = \
+                    functools.partial(self._derive_public_transformed_doc
+                                      , transformed_doc=private_transformed
+                                      , enriched_entity=index_group_docs['enriched_entity']
+                                      , transformer=transformer)
+
+    # The bulk writer fills in mapper_metadata.size as it serializes each document. A document the
+    # transformer fails on is logged and not written, without losing the rest of the documents.
+    def _transform_docs(self, transformer, docs: list):
+        if not docs:
+            return []
+        if hasattr(transformer, 'transform_batch'):
+            return transformer.transform_batch(docs, self.transformation_resources, add_size=False)
+        transformed_docs = []
+        for doc in docs:
+            try:
+                transformed_docs.append(transformer.transform(doc, self.transformation_resources, add_size=False))
+            except Exception as e:
+                logger.exception(f"Encountered exception e={str(e)} transforming uuid: {doc.get('uuid')}")
+                transformed_docs.append(None)
+        return transformed_docs
+
+    def _write_index_group_docs(self, index_group_docs: dict):
+        entity = index_group_docs['entity']
+        for index_name, document in index_group_docs['docs_to_write'].items():
+            if document is None:
                 continue
-            self.indexer.index(entity_id=entity['uuid']
-                            , document=docs_to_write_dict[index_name]
-                            , index_name=index_name
-                            , reindex=True)
-            logger.info(f"Finished executing indexer.index() during direct '{index_group}' reindexing with"
+            if callable(document):
+                document = document()
+            # The bulk "index" action replaces the existing document, so there is no delete first.
+            self.bulk_writer.index(index_name=index_name
+                                   , doc_id=entity['uuid']
+                                   , document=document)
+            logger.info(f"Finished queueing bulk write during direct '{index_group_docs['index_group']}' reindexing with"
                         f" entity['uuid']={entity['uuid']},"
                         f" entity['entity_type']={entity['entity_type']},"
                         f" index_name={index_name}.")
-        logger.info(f"Finished direct '{index_group}' updates for"
-                    f" entity['uuid']={entity['uuid']},"
-                    f" entity['entity_type']={entity['entity_type']}")
-        
 
     def enqueue_reindex(self, entity_id, reindex_queue, priority, index_override=None):
         try:
@@ -684,22 +858,29 @@ class Translator(TranslatorInterface):
             kwargs_for_job = {}
             if index_override:
                 kwargs_for_job['index_override'] = index_override
-            reference_id = reindex_queue.enqueue(
-                job_metadata = {"uuid": entity.get('uuid'), "hubmap_id": entity.get('hubmap_id')},
-                task_func=reindex_entity_queued_wrapper,
-                entity_id=entity_id,
-                args=[entity_id, self.token],
-                kwargs=kwargs_for_job,
-                priority=priority
-            )
+            # Always enqueue the requested entity, superseding any job already pending for it.
+            pending_generation = self._claim_pending_reindexes(entity_ids=[entity_id]
+                                                               , index_override=index_override
+                                                               , priority=priority
+                                                               , force=True).get(entity_id)
+            if pending_generation is not None:
+                kwargs_for_job['pending_generation'] = pending_generation
+            try:
+                reference_id = reindex_queue.enqueue(
+                    job_metadata = {"uuid": entity.get('uuid'), "hubmap_id": entity.get('hubmap_id')},
+                    task_func=reindex_entity_queued_wrapper,
+                    entity_id=entity_id,
+                    args=[entity_id, self.token],
+                    kwargs=kwargs_for_job,
+                    priority=priority
+                )
+            except Exception:
+                self._unclaim_pending_reindexes(pending_generations={entity_id: pending_generation}
+                                                , index_override=index_override)
+                raise
             collection_associations = []
             upload_associations = []
-            previous_revision_ids = []
-            next_revision_ids = []
-            neo4j_collection_ids = []
-            neo4j_upload_ids = []
-            neo4j_ancestor_ids = []
-            neo4j_descendant_ids = []
+            related_entity_ids = set()
 
             if entity['entity_type'] in ['Collection', 'Epicollection']:
                 collection = self.get_collection_doc(entity_id=entity_id)
@@ -720,89 +901,58 @@ class Translator(TranslatorInterface):
                                     
             else:
                 logger.info(f"Calculating related entities for {entity_id}")
-                
-                neo4j_ancestor_ids = self.call_entity_api(
-                    entity_id=entity_id,
-                    endpoint_base='ancestors',
-                    endpoint_suffix=None,
-                    url_property='uuid'
-                )
-                
-                neo4j_descendant_ids = self.call_entity_api(
-                    entity_id=entity_id,
-                    endpoint_base='descendants',
-                    endpoint_suffix=None,
-                    url_property='uuid'
-                )
-            
-            if entity['entity_type'] in ['Dataset', 'Publication']:
-                previous_revision_ids = self.call_entity_api(
-                    entity_id=entity_id,
-                    endpoint_base='previous_revisions',
-                    endpoint_suffix=None,
-                    url_property='uuid'
-                )
-                
-                next_revision_ids = self.call_entity_api(
-                    entity_id=entity_id,
-                    endpoint_base='next_revisions',
-                    endpoint_suffix=None,
-                    url_property='uuid'
-                )
-                
-                neo4j_collection_ids = self.call_entity_api(
-                    entity_id=entity_id,
-                    endpoint_base='entities',
-                    endpoint_suffix='collections',
-                    url_property='uuid'
-                )
-                
-                neo4j_upload_ids = self.call_entity_api(
-                    entity_id=entity_id,
-                    endpoint_base='entities',
-                    endpoint_suffix='uploads',
-                    url_property='uuid'
-                )
-            
-            target_ids = set(
-                neo4j_ancestor_ids + 
-                neo4j_descendant_ids + 
-                previous_revision_ids + 
-                next_revision_ids + 
-                neo4j_collection_ids + 
-                neo4j_upload_ids + 
-                upload_associations +
-                collection_associations
-            )
-
-            logger.info(f"Enqueueing {len(target_ids)} related entities for {entity_id}")
-
-            url = f"{self.entity_api_url}/entities/batch-ids"
-            associated_metadata = {}
+                related_entity_ids = self._get_related_entity_ids(entity)
+
+            target_ids = related_entity_ids.union(upload_associations, collection_associations)
+
+            # Leave out the related entities whose reindex is already waiting in the queue with the
+            # same or a more urgent priority.
+            target_ids.discard(entity_id)
+            pending_generations = self._claim_pending_reindexes(entity_ids=target_ids
+                                                                , index_override=index_override
+                                                                , priority=subsequent_priority)
+            if len(pending_generations) < len(target_ids):
+                logger.info(f"Skipping {len(target_ids) - len(pending_generations)} related entities of {entity_id}"
+                            f" already pending reindex.")
+            target_ids = set(pending_generations.keys())
+
             try:
-                response = requests.post(url, headers=self.request_headers, json=list(target_ids))
-                if response.status_code == 200:
-                    associated_metadata = response.json()
-                else:
-                    self.logger.error(f"Failed to fetch batch metadata: {response.status_code}")
-                    associated_metadata = {}
-            except Exception as e:
-                logger.error(f"Unable to retrieve uuid and hubmap_id from entity-api. Proceed with enqueuing but this info will be missing from logging and status. {e}")
-            jobs = []
-            for related_entity_id in target_ids:
-                meta = associated_metadata.get(related_entity_id) or {}
-                jobs.append({
-                    "entity_id": related_entity_id,
-                    "args": [related_entity_id, self.token],
-                    "kwargs": {"index_override": index_override} if index_override else {},
-                    "metadata": meta,
-                })
-            if jobs:
-                reindex_queue.bulk_enqueue(
-                    task_func = reindex_entity_queued_wrapper,
-                    jobs=jobs,
-                    priority=subsequent_priority
-                )
+                logger.info(f"Enqueueing {len(target_ids)} related entities for {entity_id}")
+
+                url = f"{self.entity_api_url}/entities/batch-ids"
+                associated_metadata = {}
+                try:
+                    response = self.http_client.post(url, headers=self.request_headers, json=list(target_ids))
+                    if response.status_code == 200:
+                        associated_metadata = response.json()
+                    else:
+                        self.logger.error(f"Failed to fetch batch metadata: {response.status_code}")
+                        associated_metadata = {}
+                except Exception as e:
+                    logger.error(f"Unable to retrieve uuid and hubmap_id from entity-api. Proceed with enqueuing but this info will be missing from logging and status. {e}")
+                jobs = []
+                for related_entity_id in target_ids:
+                    meta = associated_metadata.get(related_entity_id) or {}
+                    related_kwargs = {"index_override": index_override} if index_override else {}
+                    if pending_generations[related_entity_id] is not None:
+                        related_kwargs['pending_generation'] = pending_generations[related_entity_id]
+                    jobs.append({
+                        "entity_id": related_entity_id,
+                        "args": [related_entity_id, self.token],
+                        "kwargs": related_kwargs,
+                        "metadata": meta,
+                    })
+                if jobs:
+                    reindex_queue.bulk_enqueue(
+                        task_func = reindex_entity_queued_wrapper,
+                        jobs=jobs,
+                        priority=subsequent_priority
+                    )
+            except Exception:
+                # Leave none of the related entities pending without a job in the queue.
+                self._unclaim_pending_reindexes(pending_generations=pending_generations
+                                                , index_override=index_override)
+                raise
             logger.info(f"Bulk-enqueued {len(jobs)} related entities for {entity_id}")
             return reference_id
         except ValueError as e:
@@ -814,6 +964,37 @@ class Translator(TranslatorInterface):
             logger.exception(msg)
             raise
 
+    # Record the entities as pending reindex, see PendingReindexSet, and return {entity_id: generation}
+    # for those whose jobs should be enqueued. The generation is None when pending reindexes are not
+    # tracked, in which case every entity is returned.
+    def _claim_pending_reindexes(self, entity_ids, index_override, priority, force=False):
+        entity_ids = list(entity_ids)
+        pending_reindex_set = get_pending_reindex_set()
+        if pending_reindex_set is None:
+            return {entity_id: None for entity_id in entity_ids}
+        try:
+            return pending_reindex_set.claim_many(entity_ids=entity_ids
+                                                  , indices_signature=get_indices_signature(index_override)
+                                                  , priority=priority
+                                                  , force=force)
+        except RedisError as re:
+            logger.warning(f"Unable to check for pending reindexes, enqueueing all {len(entity_ids)} entities. re={str(re)}")
+            return {entity_id: None for entity_id in entity_ids}
+
+    # Clear the claims of _claim_pending_reindexes() for jobs which could not be enqueued.
+    def _unclaim_pending_reindexes(self, pending_generations, index_override):
+        pending_generations = {entity_id: generation for entity_id, generation in pending_generations.items()
+                               if generation is not None}
+        if not pending_generations:
+            return
+        try:
+            get_pending_reindex_set().unclaim_many(generations=pending_generations
+                                                   , indices_signature=get_indices_signature(index_override))
+        except RedisError as re:
+            logger.warning(f"Unable to clear the pending reindexes of {len(pending_generations)} entities"
+                           f" which were not enqueued, they expire with their keys. re={str(re)}")
+
+    @reindex_run
     def reindex_entity_queued(self, entity_id):
         try:
             logger.info(f"Start executing reindex_entity_queued() on uuid: {entity_id}")
@@ -837,7 +1018,16 @@ class Translator(TranslatorInterface):
             
             raise
 
+    # Reindex the entities related to an entity reindexed by translate()
+    @reindex_run
+    def reindex_related_entities(self, entity_ids):
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures_list = [executor.submit(self._exec_reindex_entity_to_index_group_by_id, related_entity_uuid, ['entities','portal']) for related_entity_uuid in entity_ids]
+            for f in concurrent.futures.as_completed(futures_list):
+                result = f.result()
+
     # Used by individual live reindex call
+    @reindex_run
     def translate(self, entity_id):
         try:
             # Retrieve the entity details
@@ -847,6 +1037,12 @@ class Translator(TranslatorInterface):
 
             logger.info(f"Start executing translate() on {entity['entity_type']} of uuid: {entity_id}")
 
+            # The entity is about to be reindexed with its current relationships, so it need not be
+            # reindexed again for the updates of related entities coalesced so far.
+            reindex_coalescer = get_reindex_coalescer()
+            if reindex_coalescer is not None:
+                reindex_coalescer.discard(key=self.token, entity_id=entity_id)
+
             if entity['entity_type'] in ['Collection', 'Epicollection']:
                 # Expect entity-api to stop update of Collections which should not be modified e.g. those which
                 # have a DOI.  But entity-api may still request such Collections be indexed, particularly right
@@ -862,58 +1058,21 @@ class Translator(TranslatorInterface):
                 # BEGIN - Below block is the original implementation prior to the direct document update
                 # against Elasticsearch. Added back by Zhou to avoid 409 conflicts - 7/20/2024
 
-                previous_revision_ids = []
-                next_revision_ids = []
-
-                # Get the ancestors and descendants of this entity as they exist in Neo4j
-                neo4j_ancestor_ids = self.call_entity_api(  entity_id=entity_id
-                                                            , endpoint_base='ancestors'
-                                                            , endpoint_suffix=None
-                                                            , url_property='uuid')
-                neo4j_descendant_ids = self.call_entity_api(    entity_id=entity_id
-                                                                , endpoint_base='descendants'
-                                                                , endpoint_suffix=None
-                                                                , url_property='uuid')
-
-                # Only Dataset/Publication entities may have previous/next revisions
-                if entity['entity_type'] in ['Dataset', 'Publication']:
-                    previous_revision_ids = self.call_entity_api(entity_id=entity_id
-                                                                , endpoint_base='previous_revisions'
-                                                                , endpoint_suffix=None
-                                                                , url_property='uuid')
-                    next_revision_ids = self.call_entity_api(entity_id=entity_id
-                                                            , endpoint_base='next_revisions'
-                                                            , endpoint_suffix=None
-                                                            , url_property='uuid')
-
-                # If working with a Dataset or Publication, it may be copied into ElasticSearch documents for
-                # Collections and Uploads, so identify any of those which must be reindexed.
-                neo4j_collection_ids = []
-                neo4j_upload_ids = []
-                if entity['entity_type'] in ['Dataset', 'Publication']:
-                    neo4j_collection_ids = self.call_entity_api(entity_id=entity_id
-                                                                , endpoint_base='entities'
-                                                                , endpoint_suffix='collections'
-                                                                , url_property='uuid')
-                    neo4j_upload_ids = self.call_entity_api(entity_id=entity_id
-                                                            , endpoint_base='entities'
-                                                            , endpoint_suffix='uploads'
-                                                            , url_property='uuid')
+                # All unique entity ids in the path excluding the entity itself
+                target_ids = self._get_related_entity_ids(entity)
 
                 # Reindex the entity itself first before dealing with other documents for related entities.
                 self._call_indexer(entity=entity
                                    , delete_existing_doc_first=True)
 
-                # All unique entity ids in the path excluding the entity itself
-                target_ids = set(neo4j_ancestor_ids + neo4j_descendant_ids + \
-                                 previous_revision_ids + next_revision_ids + \
-                                 neo4j_collection_ids + neo4j_upload_ids)
-
-                # Reindex the rest of the entities in the list
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    futures_list = [executor.submit(self._exec_reindex_entity_to_index_group_by_id, related_entity_uuid, ['entities','portal']) for related_entity_uuid in target_ids]
-                    for f in concurrent.futures.as_completed(futures_list):
-                        result = f.result()
+                # Reindex the rest of the entities in the list, merged with those of other entities
+                # updated within the coalescing window if there is one.
+                if reindex_coalescer is None:
+                    self.reindex_related_entities(target_ids)
+                else:
+                    reindex_coalescer.add(key=self.token
+                                          , entity_ids=target_ids
+                                          , callback=self.reindex_related_entities)
                 
                 # END - Above block is the original implementation prior to the direct document update
                 # against Elasticsearch. Added back by Zhou to avoid 409 conflicts - 7/20/2024
@@ -1042,6 +1201,8 @@ class Translator(TranslatorInterface):
             logger.exception(msg)
 
     def update(self, entity_id, document, index=None, scope=None):
+        # Encoded once, and passed to the indexer as bytes for every index it is written to
+        document_json = json_codec.dumps(document)
         if index is not None and index == 'files':
             # The "else clause" is the dominion of the original flavor of OpenSearch indices, for which search-api
             # was created.  This clause is specific to 'files' indices, by virtue of the conditions and the
@@ -1056,7 +1217,7 @@ class Translator(TranslatorInterface):
                     # silently skip public if it was put on the list by __get_scope_list() because
                     # the scope was not explicitly specified.
                     continue
-                response += self.indexer.index(entity_id, json.dumps(document), target_index, True)
+                response += self.indexer.index(entity_id, document_json, target_index, True)
                 response += '. '
         else:
             for index in self.indices.keys():
@@ -1064,12 +1225,14 @@ class Translator(TranslatorInterface):
                 private_index = self.INDICES['indices'][index]['private']
 
                 if self.is_public(document):
-                    response = self.indexer.index(entity_id, json.dumps(document), public_index, True)
+                    response = self.indexer.index(entity_id, document_json, public_index, True)
 
-                response += self.indexer.index(entity_id, json.dumps(document), private_index, True)
+                response += self.indexer.index(entity_id, document_json, private_index, True)
         return response
 
     def add(self, entity_id, document, index=None, scope=None):
+        # Encoded once, and passed to the indexer as bytes for every index it is written to
+        document_json = json_codec.dumps(document)
         if index is not None and index == 'files':
             # The "else clause" is the dominion of the original flavor of OpenSearch indices, for which search-api
             # was created.  This clause is specific to 'files' indices, by virtue of the conditions and the
@@ -1084,7 +1247,7 @@ class Translator(TranslatorInterface):
                     # silently skip public if it was put on the list by __get_scope_list() because
                     # the scope was not explicitly specified.
                     continue
-                response += self.indexer.index(entity_id, json.dumps(document), target_index, False)
+                response += self.indexer.index(entity_id, document_json, target_index, False)
                 response += '. '
         else:
             for index in self.indices.keys():
@@ -1092,9 +1255,9 @@ class Translator(TranslatorInterface):
                 private_index = self.INDICES['indices'][index]['private']
 
                 if self.is_public(document):
-                    response = self.indexer.index(entity_id, json.dumps(document), public_index, False)
+                    response = self.indexer.index(entity_id, document_json, public_index, False)
 
-                response += self.indexer.index(entity_id, json.dumps(document), private_index, False)
+                response += self.indexer.index(entity_id, document_json, private_index, False)
         return response
 
     # This method is only applied to Collection/Donor/Sample/Dataset/File
@@ -1240,7 +1403,7 @@ class Translator(TranslatorInterface):
             self.add_calculated_fields(upload)
 
             self._index_doc_directly_to_es_index(   entity=upload
-                                                    , document=json.dumps(upload)
+                                                    , document=upload
                                                     , es_index=default_private_index
                                                     , delete_existing_doc_first=reindex)
 
@@ -1255,47 +1418,14 @@ class Translator(TranslatorInterface):
             entity = self.call_entity_api(entity_id=entity, endpoint_base='documents')
         logger.info(f"Start executing translate_collection() for {entity.get('uuid')}")
 
-        # The entity-api returns public collection with a list of connected public/published datasets, for either
-        # - a valid token but not in HuBMAP-Read group or
-        # - no token at all
-        # Here we do NOT send over the token
         try:
             for index_group in self.indices.keys():
-                collection = entity
-                self._add_datasets_to_entity(   entity=collection
-                                                , index_group=index_group)
-                self._entity_keys_rename(collection)
-
-                # Add additional calculated fields if any applies to Collection
-                self.add_calculated_fields(collection)
-
-                # each index should have a public index
-                public_index = self.INDICES['indices'][index_group]['public']
-                private_index = self.INDICES['indices'][index_group]['private']
-
-                # If this Collection meets entity-api's criteria for visibility to the world by
-                # returning the value of its schema_constants.py DataVisibilityEnum.PUBLIC, put
-                # the Collection in the public index.
-                # If the index group has a transformer use to retrieve a modified version of
-                # the Collection entity to index.
-                coll_data = copy.deepcopy(collection)
+                collection = self._prepare_collection(entity, index_group)
+                coll_data = collection
                 if self.TRANSFORMERS.get(index_group):
-                    coll_data = self.TRANSFORMERS[index_group].transform(collection, self.transformation_resources)
-                if self.is_public(collection):
-                    # Remove fields explicitly marked for excluded_properties_from_public_response per entity type in
-                    # the provenance_schema.yaml of the entity-api.
-                    pub_coll_data = copy.deepcopy(coll_data)
-                    if pub_coll_data['entity_type'] in self.public_doc_exclusion_dict:
-                        self._remove_field_from_dict(a_dict=pub_coll_data
-                                                     , obj_to_remove=self.public_doc_exclusion_dict[pub_coll_data['entity_type']])
-                    self._index_doc_directly_to_es_index(entity=pub_coll_data
-                                                         , document=json.dumps(pub_coll_data)
-                                                         , es_index=public_index
-                                                         , delete_existing_doc_first=reindex)
-                self._index_doc_directly_to_es_index(entity=coll_data
-                                                     , document=json.dumps(coll_data)
-                                                     , es_index=private_index
-                                                     , delete_existing_doc_first=reindex)
+                    coll_data = self.TRANSFORMERS[index_group].transform(collection, self.transformation_resources
+                                                                         , add_size=False)
+                self._write_collection(collection, coll_data, index_group, reindex)
 
             logger.info(f"Finished executing translate_collection() for {entity.get('uuid')}")
         except requests.exceptions.RequestException as e:
@@ -1305,6 +1435,88 @@ class Translator(TranslatorInterface):
         except Exception as e:
             logger.error(e)
 
+    # Like translate_collection() for each of the Collections, but the Collections of each batch are
+    # fetched and prepared concurrently, then transformed together with the transform_batch() of the
+    # transformers which have one.
+    def translate_collections(self, collection_uuids, reindex=False):
+        batch_size = app.config.get('TRANSFORM_BATCH_SIZE', 50)
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            for batch_start in range(0, len(collection_uuids), batch_size):
+                batch_uuids = collection_uuids[batch_start:batch_start + batch_size]
+                collections = [collection for collection in executor.map(self._get_collection_document, batch_uuids)
+                               if collection is not None]
+                # Each index group adds its own datasets to the Collections, so the documents of one
+                # index group are written before the Collections are prepared for the next.
+                for index_group in self.indices.keys():
+                    prepared = [collection for collection in executor.map(
+                                    functools.partial(self._try_prepare_collection, index_group=index_group), collections)
+                                if collection is not None]
+                    coll_data_list = prepared
+                    if self.TRANSFORMERS.get(index_group):
+                        coll_data_list = self._transform_docs(self.TRANSFORMERS[index_group], prepared)
+                    for collection, coll_data in zip(prepared, coll_data_list):
+                        if coll_data is not None:
+                            self._write_collection(collection, coll_data, index_group, reindex)
+                logger.info(f"Finished translating {len(collections)} of {len(batch_uuids)} Collections"
+                            f" of batch starting with uuid: {batch_uuids[0]}")
+
+    def _get_collection_document(self, uuid):
+        try:
+            return self.call_entity_api(entity_id=uuid, endpoint_base='documents')
+        except Exception as e:
+            logger.exception(e)
+            logger.error(f"translate_collections() failed to get collection of uuid: {uuid} via entity-api")
+            return None
+
+    def _try_prepare_collection(self, collection, index_group):
+        try:
+            return self._prepare_collection(collection, index_group)
+        except Exception as e:
+            logger.exception(e)
+            logger.error(f"translate_collections() failed to prepare collection of uuid: {collection.get('uuid')}"
+                         f" for the '{index_group}' index group")
+            return None
+
+    # The entity-api returns public collection with a list of connected public/published datasets, for either
+    # - a valid token but not in HuBMAP-Read group or
+    # - no token at all
+    # Here we do NOT send over the token
+    def _prepare_collection(self, collection, index_group):
+        self._add_datasets_to_entity(   entity=collection
+                                        , index_group=index_group)
+        self._entity_keys_rename(collection)
+
+        # Add additional calculated fields if any applies to Collection
+        self.add_calculated_fields(collection)
+        return collection
+
+    # If this Collection meets entity-api's criteria for visibility to the world by
+    # returning the value of its schema_constants.py DataVisibilityEnum.PUBLIC, put
+    # the Collection in the public index.
+    # coll_data is the Collection as transformed by the transformer of the index group, if it has one.
+    # Neither document is modified once made, and the bulk writer serializes each as it
+    # is queued, so they need not be copied from the Collection.
+    def _write_collection(self, collection, coll_data, index_group, reindex):
+        # each index should have a public index
+        public_index = self.INDICES['indices'][index_group]['public']
+        private_index = self.INDICES['indices'][index_group]['private']
+
+        if self.is_public(collection):
+            # Remove fields explicitly marked for excluded_properties_from_public_response per entity type in
+            # the provenance_schema.yaml of the entity-api.
+            pub_coll_data = coll_data
+            if pub_coll_data['entity_type'] in self.public_doc_exclusion_plans:
+                pub_coll_data = self.public_doc_exclusion_plans[pub_coll_data['entity_type']].without(pub_coll_data)
+            self._index_doc_directly_to_es_index(entity=pub_coll_data
+                                                 , document=pub_coll_data
+                                                 , es_index=public_index
+                                                 , delete_existing_doc_first=reindex)
+        self._index_doc_directly_to_es_index(entity=coll_data
+                                             , document=coll_data
+                                             , es_index=private_index
+                                             , delete_existing_doc_first=reindex)
+
+    @reindex_run
     def translate_donor_tree(self, entity_id):
         try:
             logger.info(f"Start executing translate_donor_tree() for donor of uuid: {entity_id}")
@@ -1314,29 +1526,113 @@ class Translator(TranslatorInterface):
                                                     , endpoint_suffix=None
                                                     , url_property='uuid')
 
+            donor_subtree = None
+            if app.config.get('DONOR_TREE_PREFETCH_MODE', False) and descendant_uuids:
+                donor_subtree = self._prefetch_donor_subtree(entity_id, descendant_uuids)
+                self._prefetch_assay_details(donor_subtree, descendant_uuids)
+
             # Index the donor entity itself
-            donor = self.call_entity_api(entity_id, 'documents')
-            self._call_indexer(entity=donor)
+            donor = self.get_entity_document(entity_id)
+            self._call_indexer(entity=donor
+                               , relationships=donor_subtree.relationships(entity_id) if donor_subtree else None)
 
-            # Index all the descendants of this donor
+            # Index all the descendants of this donor. Their documents are generated concurrently, and
+            # transformed in batches as they are ready.
+            batch_size = app.config.get('TRANSFORM_BATCH_SIZE', 50)
             with concurrent.futures.ThreadPoolExecutor() as executor:
-                donor_descendants_list = [executor.submit(self.index_entity, uuid) for uuid in descendant_uuids]
+                donor_descendants_list = [executor.submit(self._generate_entity_docs, uuid, donor_subtree) for uuid in descendant_uuids]
+                pending_docs_list = []
                 for f in concurrent.futures.as_completed(donor_descendants_list):
-                    result = f.result()
+                    pending_docs_list.extend(f.result())
+                    if len(pending_docs_list) >= batch_size * len(self.indices):
+                        self._transform_and_write_index_group_docs(pending_docs_list)
+                        pending_docs_list = []
+                self._transform_and_write_index_group_docs(pending_docs_list)
 
             logger.info(f"Finished executing translate_donor_tree() for donor of uuid: {entity_id}")
         except Exception as e:
             logger.error(e)
 
-    def index_entity(self, uuid):
+    # Have the transformers which keep soft-assay details, e.g. portal's, load those of every Dataset
+    # of a Donor subtree at once, rather than one at a time as each Dataset and its siblings are transformed.
+    def _prefetch_assay_details(self, donor_subtree, descendant_uuids):
+        dataset_uuids = [uuid for uuid in descendant_uuids
+                         if donor_subtree.infos_by_uuid.get(uuid, {}).get('entity_type') == 'Dataset']
+        for transformer in set(self.TRANSFORMERS.values()):
+            if dataset_uuids and hasattr(transformer, 'prefetch_assay_details'):
+                transformer.prefetch_assay_details(dataset_uuids, self.transformation_resources)
+
+    # Fetch what is needed to calculate the relationships of every entity below a Donor, i.e. the
+    # descendants-info of the Donor and the parents-info of each descendant, with one call each,
+    # rather than four calls for every entity. The parents-info calls also provide the Donor's own info.
+    def _prefetch_donor_subtree(self, donor_uuid, descendant_uuids):
+        included_fields = ','.join(INDEX_GROUP_ENTITIES_DOC_FIELDS.keys())
+        subtree_calls = {
+            uuid: functools.partial(self.call_entity_api
+                                    , entity_id=uuid + f"?include={included_fields}"
+                                    , endpoint_base='parents-info')
+            for uuid in descendant_uuids
+        }
+        subtree_calls[donor_uuid] = functools.partial(self.call_entity_api
+                                                      , entity_id=donor_uuid + f"?include={included_fields}"
+                                                      , endpoint_base='descendants-info')
+        results = self._call_concurrently(entity_id=donor_uuid, calls=subtree_calls)
+
+        infos_by_uuid = {info['uuid']: info for info in results.pop(donor_uuid)}
+        parent_ids_by_uuid = {}
+        for uuid, parents in results.items():
+            parent_ids_by_uuid[uuid] = [parent['uuid'] for parent in parents]
+            for parent in parents:
+                infos_by_uuid.setdefault(parent['uuid'], parent)
+
+        donor_subtree = DonorSubtree(donor_uuid=donor_uuid
+                                     , infos_by_uuid=infos_by_uuid
+                                     , parent_ids_by_uuid=parent_ids_by_uuid)
+        incomplete_count = sum(not donor_subtree.is_complete(uuid) for uuid in descendant_uuids)
+        logger.info(f"Prefetched the subtree of Donor {donor_uuid} with {len(descendant_uuids)} descendants,"
+                    f" {incomplete_count} of which have ancestors outside the subtree and will be"
+                    f" indexed with their own entity-api calls.")
+        return donor_subtree
+
+    # When given the DonorSubtree the entity belongs to, take the relationships of the entity from it
+    # rather than from entity-api where possible.
+    def index_entity(self, uuid, donor_subtree=None):
         logger.info(f"Start executing index_entity() on uuid: {uuid}")
 
-        entity_dict = self.call_entity_api(uuid, 'documents')
-        self._call_indexer(entity=entity_dict)
+        entity_dict = self.get_entity_document(uuid)
+        relationships = donor_subtree.relationships(uuid) if donor_subtree else None
+        self._call_indexer(entity=entity_dict, relationships=relationships)
 
         logger.info(f"Finished executing index_entity() on uuid: {uuid}")
 
+    # Like index_entity(), but only make the untransformed documents of the entity for each index group,
+    # for _transform_and_write_index_group_docs() to transform and write with those of other entities.
+    def _generate_entity_docs(self, uuid, donor_subtree=None):
+        entity = self.get_entity_document(uuid)
+        relationships = donor_subtree.relationships(uuid) if donor_subtree else None
+        try:
+            enriched_entity = self._enrich_entity(entity, relationships=relationships)
+            return [self._generate_index_group_docs(entity=entity
+                                                    , index_group=index_group
+                                                    , enriched_entity=enriched_entity)
+                    for index_group in self.indices.keys()]
+        except Exception as e:
+            msg = f"Encountered exception e={str(e)}" \
+                f" executing _generate_entity_docs() with" \
+                f" uuid: {entity['uuid']}, entity_type: {entity['entity_type']}"
+            logger.exception(msg)
+            return []
+
+    def _transform_and_write_index_group_docs(self, index_group_docs_list: list):
+        for index_group in self.indices.keys():
+            self._transform_index_group_docs(index_group=index_group
+                                             , index_group_docs_list=[index_group_docs for index_group_docs in index_group_docs_list
+                                                                      if index_group_docs['index_group'] == index_group])
+        for index_group_docs in index_group_docs_list:
+            self._write_index_group_docs(index_group_docs)
+
     # Used by individual PUT /reindex/<id> call
+    @reindex_run
     def reindex_entity(self, uuid):
         logger.info(f"Start executing reindex_entity() on uuid: {uuid}")
 
@@ -1348,8 +1644,8 @@ class Translator(TranslatorInterface):
     def load_public_doc_exclusion_dict(self, entity_api_prov_schema_raw_url):
         # Keep a semi-immutable dictionary of fields to exclude from public indices, using the
         # same information entity-api uses for excluding fields for public entities.
-        response = requests.get(    url=entity_api_prov_schema_raw_url
-                                    , verify=False)
+        response = self.http_client.get(url=entity_api_prov_schema_raw_url
+                                        , verify=False)
         if response.status_code == 200:
             yaml_contents = response.text
             try:
@@ -1416,6 +1712,15 @@ class Translator(TranslatorInterface):
         #     if 'excluded_properties_from_public_response' in v:
         #         self.public_doc_exclusion_dict[k]=v['excluded_properties_from_public_response']
 
+    # Compile the rules of public_doc_exclusion_dict for each entity type once, rather than walking
+    # them for every public document. The plans with include_mapped are for transformed documents.
+    def compile_public_doc_exclusion_plans(self):
+        self.public_doc_exclusion_plans = {}
+        self.public_doc_exclusion_plans_with_mapped = {}
+        for entity_type, exclusions in self.public_doc_exclusion_dict.items():
+            self.public_doc_exclusion_plans[entity_type] = ExclusionPlan(exclusions)
+            self.public_doc_exclusion_plans_with_mapped[entity_type] = ExclusionPlan(exclusions, include_mapped=True)
+
     def init_transformers(self):
         logger.info("Start executing init_transformers()")
 
@@ -1428,6 +1733,8 @@ class Translator(TranslatorInterface):
                 try:
                     m = importlib.import_module(xform_module)
                     self.TRANSFORMERS[index] = m
+                    if hasattr(m, 'set_transform_processes'):
+                        m.set_transform_processes(app.config.get('PORTAL_TRANSFORM_PROCESSES', 0))
                 except Exception as e:
                     logger.error(e)
                     msg = f"Failed to dynamically import transform module index: {index} at time: {time.time()}"
@@ -1491,13 +1798,21 @@ class Translator(TranslatorInterface):
 
 
 
+    # Called by the bulk writer for each document OpenSearch did not accept
+    def _record_failed_write(self, entity_id, index_name, reason):
+        if entity_id not in self.failed_entity_ids:
+            self.failed_entity_ids.append(entity_id)
+
     # Note: this entity dict input (if Dataset) has already removed ingest_metadata.files and
     # ingest_metadata.metadata sub fields with empty string values from previous call
-    def _index_doc_directly_to_es_index(self, entity:dict, document:json, es_index:str, delete_existing_doc_first:bool=False):
+    #
+    # The document, a dict or its JSON serialization, is queued on the bulk writer, whose "index" action
+    # replaces any existing document, so delete_existing_doc_first no longer needs a separate delete request.
+    def _index_doc_directly_to_es_index(self, entity:dict, document, es_index:str, delete_existing_doc_first:bool=False):
         logger.info(f"Start executing _index_doc_directly_to_es_index() on uuid: {entity['uuid']}, entity_type: {entity['entity_type']}")
 
         try:
-            self.indexer.index(entity['uuid'], document, es_index, reindex=delete_existing_doc_first)
+            self.bulk_writer.index(index_name=es_index, doc_id=entity['uuid'], document=document)
             logger.info(f"Finished executing _index_doc_directly_to_es_index() on uuid: {entity['uuid']}, entity_type: {entity['entity_type']}")
         except Exception as e:
             msg =   f"Encountered exception e={str(e)}" \
@@ -1509,11 +1824,17 @@ class Translator(TranslatorInterface):
 
     # Note: this entity dict input (if Dataset) has already removed ingest_metadata.files and
     # ingest_metadata.metadata sub fields with empty string values from previous call
-    def _call_indexer(self, entity, delete_existing_doc_first=False):
+    # The optional relationships argument is passed through to _enrich_entity().
+    def _call_indexer(self, entity, delete_existing_doc_first=False, relationships=None):
         logger.info(f"Start executing _call_indexer() on uuid: {entity['uuid']}, entity_type: {entity['entity_type']}")
-        try:            
+        try:
+            # Make the entity-api calls for the relatives of the entity once, then project the
+            # document of each index group from the result.
+            enriched_entity = self._enrich_entity(entity, relationships=relationships)
             for index_group in self.indices.keys():
-                self._transform_and_write_entity_to_index_group(entity=entity, index_group=index_group)
+                self._transform_and_write_entity_to_index_group(entity=entity
+                                                                , index_group=index_group
+                                                                , enriched_entity=enriched_entity)
             logger.info(f"Finished executing _call_indexer() on uuid: {entity['uuid']}, entity_type: {entity['entity_type']}")
         except Exception as e:
             msg = f"Encountered exception e={str(e)}" \
@@ -1571,13 +1892,13 @@ class Translator(TranslatorInterface):
         included_fields = ','.join(ig_doc_fields.keys())
         try:
             url = f"{self.entity_api_url}/entities/{entity['uuid']}/dataset-documents?include={included_fields}"
-            response = requests.get(url, headers=self.request_headers, verify=False)
+            response = self.http_client.get(url, headers=self.request_headers, verify=False)
             if response.status_code == 200:
                 batch_docs = response.json()
             elif response.status_code == 303:
                 s3_url = response.text
                 logger.info(f"dataset-documents for {entity['uuid']} redirected to S3: {s3_url}")
-                s3_response = requests.get(s3_url, verify=False)
+                s3_response = self.http_client.get(s3_url, verify=False)
                 if s3_response.status_code == 200:
                     batch_docs = s3_response.json()
                 else:
@@ -1592,7 +1913,7 @@ class Translator(TranslatorInterface):
                 if batch_docs and dataset_stub['uuid'] in batch_docs:
                     dataset = batch_docs[dataset_stub['uuid']]
                 else:
-                    dataset = self.call_entity_api(dataset_stub['uuid'], 'documents')
+                    dataset = self.get_entity_document(dataset_stub['uuid'])
                     for field in NESTED_EXCLUDED_ES_FIELDS_FOR_COLLECTIONS_AND_UPLOADS:
                         dataset.pop(field, None)
 
@@ -1700,7 +2021,7 @@ class Translator(TranslatorInterface):
     def _relatives_for_index_group(self, relative_ids:list, index_group:str):
         relatives_for_index_group = []
         for relative_uuid in relative_ids:
-            relative_dict = self.call_entity_api(relative_uuid, 'documents')
+            relative_dict = self.get_entity_document(relative_uuid)
             # Only retain the elements of each relative needed for the index group
             entity_relative_dict = {}
             ig_doc_fields = INDEX_GROUP_PORTAL_DOC_FIELDS if index_group == 'portal' else INDEX_GROUP_ENTITIES_DOC_FIELDS
@@ -1710,27 +2031,109 @@ class Translator(TranslatorInterface):
             relatives_for_index_group.append(entity_relative_dict)
         return relatives_for_index_group
 
+    # Return the ids of the entities whose documents include content from the given Donor, Sample,
+    # Dataset or Publication, and so must be reindexed along with it: its ancestors and descendants,
+    # and for a Dataset or Publication its revisions and the Collections and Uploads it belongs to.
+    def _get_related_entity_ids(self, entity):
+        entity_id = entity['uuid']
+        related_id_calls = {
+            'ancestors': functools.partial(self.call_entity_api, entity_id=entity_id, endpoint_base='ancestors'
+                                           , endpoint_suffix=None, url_property='uuid')
+            , 'descendants': functools.partial(self.call_entity_api, entity_id=entity_id, endpoint_base='descendants'
+                                               , endpoint_suffix=None, url_property='uuid')
+        }
+        # Only Dataset/Publication entities may have previous/next revisions, and only they are copied
+        # into the documents of Collections and Uploads.
+        if entity['entity_type'] in ['Dataset', 'Publication']:
+            related_id_calls['previous_revisions'] = functools.partial(self.call_entity_api, entity_id=entity_id
+                                                                       , endpoint_base='previous_revisions'
+                                                                       , endpoint_suffix=None, url_property='uuid')
+            related_id_calls['next_revisions'] = functools.partial(self.call_entity_api, entity_id=entity_id
+                                                                   , endpoint_base='next_revisions'
+                                                                   , endpoint_suffix=None, url_property='uuid')
+            related_id_calls['collections'] = functools.partial(self.call_entity_api, entity_id=entity_id
+                                                                , endpoint_base='entities'
+                                                                , endpoint_suffix='collections', url_property='uuid')
+            related_id_calls['uploads'] = functools.partial(self.call_entity_api, entity_id=entity_id
+                                                            , endpoint_base='entities'
+                                                            , endpoint_suffix='uploads', url_property='uuid')
+        related_ids = self._call_concurrently(entity_id=entity_id, calls=related_id_calls)
+        return set().union(*related_ids.values())
+
+    # Make independent calls, e.g. to several entity-api endpoints for the same entity, on the shared
+    # fanout executor, and return a dict of their results keyed like the calls dict. Raises the
+    # exception of the first failed call, in the order of the calls dict.
+    #
+    # Logs the latency of the calls for the entity both as it would have been making them one after
+    # another, i.e. the sum of their durations, and as the wall time of making them concurrently.
+    def _call_concurrently(self, entity_id, calls: dict) -> dict:
+        def timed_call(call):
+            call_start = time.perf_counter()
+            result = call()
+            return result, time.perf_counter() - call_start
+
+        start = time.perf_counter()
+        executor = get_fanout_executor()
+        futures = {name: executor.submit(timed_call, call) for name, call in calls.items()}
+        concurrent.futures.wait(futures.values())
+        wall_seconds = time.perf_counter() - start
+
+        results = {}
+        sequential_seconds = 0
+        for name, future in futures.items():
+            result, call_seconds = future.result()
+            results[name] = result
+            sequential_seconds += call_seconds
+        logger.info(f"Made {len(calls)} entity-api calls for uuid: {entity_id} in {wall_seconds:.3f} seconds,"
+                    f" {sequential_seconds:.3f} seconds when made one after another.")
+        return results
+
     # Note: this entity dict input (if Dataset) has already handled ingest_metadata.files (with empty string or missing)
     # and ingest_metadata.metadata sub fields with empty string values from previous call
-    
-    def _generate_doc(self, entity, return_type, index_group: str):
+    #
+    # Make every entity-api call needed for the documents of all index groups, and return the
+    # entity enriched with all the relatives and calculated fields. The entity is enriched in place,
+    # so callers hand over an entity they own, e.g. one just fetched from entity-api, rather than
+    # copying it. Each index group's document is then projected from the enriched entity by
+    # _generate_doc() and _generate_public_doc(), without going back to entity-api.
+    #
+    # The relationships argument, when given, holds the results of the ancestors-info, descendants-info,
+    # parents-info and children-info calls, e.g. from DonorSubtree.relationships(), so they are not made.
+    def _enrich_entity(self, entity, relationships=None):
         try:
-            logger.info(f"Start executing _generate_doc() for {entity['entity_type']}"
-                        f" of uuid: {entity['uuid']}"
-                        f" for the {index_group} index group.")
+            logger.info(f"Start executing _enrich_entity() for {entity['entity_type']}"
+                        f" of uuid: {entity['uuid']}")
             entity_id = entity['uuid']
+            # Relatives are retrieved with the fields of INDEX_GROUP_ENTITIES_DOC_FIELDS, which
+            # cover the fields of INDEX_GROUP_PORTAL_DOC_FIELDS too.
             included_fields = ','.join(INDEX_GROUP_ENTITIES_DOC_FIELDS.keys())
             if entity['entity_type'] != 'Upload':
-                ancestors = self.call_entity_api(entity_id=entity_id + f"?include={included_fields}", endpoint_base='ancestors-info')
+                relationship_calls = {}
+                if relationships is None:
+                    relationship_calls = {
+                        endpoint_base: functools.partial(self.call_entity_api
+                                                         , entity_id=entity_id + f"?include={included_fields}"
+                                                         , endpoint_base=endpoint_base)
+                        for endpoint_base in ['ancestors-info', 'descendants-info', 'parents-info', 'children-info']
+                    }
+                if entity['entity_type'] in ['Dataset', 'Publication']:
+                    relationship_calls['sources-info'] = functools.partial(self.call_entity_api
+                                                                           , entity_id=entity_id
+                                                                           , endpoint_base='sources-info')
+                relationships = dict(relationships or {})
+                if relationship_calls:
+                    relationships.update(self._call_concurrently(entity_id=entity_id, calls=relationship_calls))
+
+                ancestors = relationships['ancestors-info']
                 ancestor_ids = [a['uuid'] for a in ancestors]
 
-                descendants = self.call_entity_api(entity_id=entity_id + f"?include={included_fields}", endpoint_base='descendants-info')
+                descendants = relationships['descendants-info']
                 descendant_ids = [d['uuid'] for d in descendants]
 
-                immediate_ancestors = self.call_entity_api(entity_id=entity_id + f"?include={included_fields}", endpoint_base='parents-info')
+                immediate_ancestors = relationships['parents-info']
                 immediate_ancestor_ids = [a['uuid'] for a in immediate_ancestors]
 
-                immediate_descendants = self.call_entity_api(entity_id=entity_id + f"?include={included_fields}", endpoint_base='children-info')
+                immediate_descendants = relationships['children-info']
                 immediate_descendant_ids = [d['uuid'] for d in immediate_descendants]
 
                 entity['ancestor_ids'] = ancestor_ids
@@ -1739,17 +2142,16 @@ class Translator(TranslatorInterface):
                 entity['immediate_descendant_ids'] = immediate_descendant_ids
                 entity['ancestors'] = ancestors
                 entity['descendants'] = descendants
-
-                if index_group in self.TRANSFORMERS:
-                    entity['immediate_ancestors'] = immediate_ancestors
-                    entity['immediate_descendants'] = immediate_descendants
+                # Only kept on the documents of index groups with a transformer, see _generate_doc()
+                entity['immediate_ancestors'] = immediate_ancestors
+                entity['immediate_descendants'] = immediate_descendants
 
             if entity['entity_type'] in ['Sample', 'Dataset', 'Publication']:
                 donor_uuids = [a.get('uuid') for a in ancestors if a.get('entity_type') == 'Donor']
                 donors = []
                 if donor_uuids:
                     for each_donor_uuid in donor_uuids:
-                        donor = self.call_entity_api(entity_id=each_donor_uuid, endpoint_base='documents')
+                        donor = self.get_entity_document(each_donor_uuid)
                         donors.append(donor)
                     for donor in donors:
                         self._entity_keys_rename(donor)
@@ -1763,7 +2165,7 @@ class Translator(TranslatorInterface):
                     for ancestor in ancestors:
                         ancestor_uuid = ancestor.get('uuid')
                         if ('sample_category' in ancestor) and (ancestor['sample_category'].lower() == 'organ') and ('organ' in ancestor) and (ancestor['organ'].strip() != ''):
-                            origin = self.call_entity_api(entity_id=ancestor_uuid, endpoint_base='documents')
+                            origin = self.get_entity_document(ancestor_uuid)
                             origin_samples.append(origin)
                 self.exclude_added_top_level_properties(origin_samples)
                 for origin_sample in origin_samples:
@@ -1772,7 +2174,7 @@ class Translator(TranslatorInterface):
                 entity['origin_samples'] = origin_samples
 
                 if entity['entity_type'] in ['Dataset', 'Publication']:
-                    source_samples = self.call_entity_api(entity_id=entity_id, endpoint_base='sources-info')
+                    source_samples = relationships['sources-info']
                     entity['source_samples'] = source_samples if source_samples else []
                     for source_sample in entity['source_samples']:
                         self._entity_keys_rename(source_sample)
@@ -1786,23 +2188,43 @@ class Translator(TranslatorInterface):
             remove_specific_key_entry(entity, "other_metadata")
             self.add_calculated_fields(entity)
 
+            logger.info(f"Finished executing _enrich_entity() for {entity['entity_type']}"
+                        f" of uuid: {entity['uuid']}")
+            return entity
+
+        except Exception as e:
+            msg = "Exceptions during executing hubmap_translator._enrich_entity()"
+            logger.exception(msg)
+            raise Exception(e)
+
+    # Project the document for an index group from an entity already processed by _enrich_entity().
+    # The enriched entity is not modified. The document is a shallow copy which shares the values it
+    # does not change with the enriched entity, so it must be serialized, or copied by a transformer,
+    # before either is modified.
+    def _generate_doc(self, entity, return_type, index_group: str):
+        try:
+            logger.info(f"Start executing _generate_doc() for {entity['entity_type']}"
+                        f" of uuid: {entity['uuid']}"
+                        f" for the {index_group} index group.")
+
             ig_doc_fields = INDEX_GROUP_PORTAL_DOC_FIELDS if index_group in self.TRANSFORMERS else INDEX_GROUP_ENTITIES_DOC_FIELDS
             unretained_key_list = [k for k, v in ig_doc_fields.items() if v != PropertyRetentionEnum.ES_DOC]
 
-            doc_entity = copy.deepcopy(entity)
+            doc_entity = dict(entity)
+            if index_group not in self.TRANSFORMERS:
+                doc_entity.pop('immediate_ancestors', None)
+                doc_entity.pop('immediate_descendants', None)
+            self._strip_unretained_relative_fields(doc_entity=doc_entity
+                                                   , unretained_key_list=unretained_key_list
+                                                   , for_transformer=index_group in self.TRANSFORMERS)
             for top_level_field in {'ancestors', 'immediate_ancestors', 'descendants', 'immediate_descendants'}:
                 if top_level_field in doc_entity:
-                    for field_of_top_level_field in unretained_key_list:
-                        remove_specific_key_entry(obj=doc_entity[top_level_field],
-                                                key_to_remove=field_of_top_level_field)
-                    for index, value in enumerate(doc_entity[top_level_field]):
-                        if not value:
-                            doc_entity[top_level_field].pop(index)
+                    doc_entity[top_level_field] = [value for value in doc_entity[top_level_field] if value]
 
             logger.info(f"Finished executing _generate_doc() for {doc_entity['entity_type']}"
                         f" of uuid: {doc_entity['uuid']}"
                         f" for the {index_group} index group.")
-            return json.dumps(doc_entity) if return_type == 'json' else doc_entity
+            return json_codec.dumps(doc_entity) if return_type == 'json' else doc_entity
 
         except Exception as e:
             msg = "Exceptions during executing hubmap_translator._generate_doc()"
@@ -1810,14 +2232,36 @@ class Translator(TranslatorInterface):
             raise Exception(e)    
 
 
-    def _generate_public_doc(self, entity, index_group:str):
-        # N.B. This method assumes the state of the 'entity' argument has been processed by the
-        #      _generate_doc() function, so this method should always be called after that one.
-        logger.info(f"Start executing _generate_public_doc() for {entity['entity_type']}"
-                    f" of uuid: {entity['uuid']}"
-                    f" for the {index_group} index group.")
-                    
-        # Only Dataset has this 'next_revision_uuid' property
+    # Because _enrich_entity() left some fields on the relatives of the entity which should not be a part
+    # of the ElasticSearch document, but which were needed for calculations prior to now, replace the
+    # relatives of a shallow copy of the enriched entity with copies of them without those fields.
+    # The relatives only carry the fields of INDEX_GROUP_ENTITIES_DOC_FIELDS, so only their own fields
+    # need checking. For a document handed to a transformer, the TRANSFORM_ONLY_DESCENDANT_FIELDS of its
+    # descendants are left for the transformer, and _strip_transform_only_fields() removes them after.
+    def _strip_unretained_relative_fields(self, doc_entity: dict, unretained_key_list: list, for_transformer: bool=False):
+        for top_level_field in ['ancestors', 'immediate_ancestors', 'descendants', 'immediate_descendants']:
+            if top_level_field in doc_entity:
+                unretained_keys = unretained_key_list
+                if for_transformer and top_level_field == 'descendants':
+                    unretained_keys = [k for k in unretained_key_list if k not in TRANSFORM_ONLY_DESCENDANT_FIELDS]
+                doc_entity[top_level_field] = [
+                    {k: v for k, v in relative.items() if k not in unretained_keys}
+                    if isinstance(relative, dict) else relative
+                    for relative in doc_entity[top_level_field]
+                ]
+
+    # Remove the TRANSFORM_ONLY_DESCENDANT_FIELDS which _strip_unretained_relative_fields() left on the
+    # descendants of a document for its transformer from the transformed document.
+    def _strip_transform_only_fields(self, transformed_doc: dict):
+        if transformed_doc is not None and 'descendants' in transformed_doc:
+            for descendant in transformed_doc['descendants']:
+                if isinstance(descendant, dict):
+                    for field in TRANSFORM_ONLY_DESCENDANT_FIELDS:
+                        descendant.pop(field, None)
+
+    # Only Dataset has this 'next_revision_uuid' property. Remove it from the public document of the
+    # entity unless the next revision is published too.
+    def _remove_unpublished_next_revision(self, entity):
         property_key = 'next_revision_uuid'
         if (entity['entity_type'] in ['Dataset', 'Publication']) and (property_key in entity):
             next_revision_uuid = entity[property_key]
@@ -1825,7 +2269,7 @@ class Translator(TranslatorInterface):
             # Can't reuse call_entity_api() here due to the response data type
             # Making a call against entity-api/entities/<next_revision_uuid>?property=status
             url = self.entity_api_url + "/entities/" + next_revision_uuid + "?property=status"
-            response = requests.get(url, headers=self.request_headers, verify=False)
+            response = self.http_client.get(url, headers=self.request_headers, verify=False)
             
             if response.status_code != 200:
                 logger.error(f"_generate_public_doc() failed to get Dataset/Publication status of next_revision_uuid via entity-api for uuid: {next_revision_uuid}")
@@ -1844,35 +2288,65 @@ class Translator(TranslatorInterface):
                 logger.debug(f"Remove the {property_key} property from {entity['uuid']}")
                 entity.pop(property_key)
 
+    # Make the public document of an entity for an index group with a transformer from its transformed
+    # private document, rather than transforming the public document generated by _generate_public_doc().
+    # This applies the same filtering as _generate_public_doc() to the transformed document, then has the
+    # transformer refresh what it derived from the relatives which were removed.
+    #
+    # The transformed document is modified, and shares the values the exclusions do not change with the
+    # returned document, rather than being copied, so call this once the private document has been handed
+    # to the bulk writer, which serializes it as it is queued.
+    #
+    # The relatives of the transformed document no longer have the fields is_public() needs, so which are
+    # public is decided from those of the enriched entity.
+    def _derive_public_transformed_doc(self, transformed_doc: dict, enriched_entity: dict, transformer):
+        self._remove_unpublished_next_revision(transformed_doc)
+
+        public_descendant_uuids = {d['uuid'] for d in enriched_entity.get('descendants', []) if self.is_public(d)}
+        # The exclusions are looked up by the entity_type of the entity, which the transformer may have changed.
+        # Fields the transformer mapped from an excluded field, e.g. mapped_metadata from metadata, go with it.
+        return derive_public_transformed_doc(transformed_doc=transformed_doc
+                                             , public_descendant_uuids=public_descendant_uuids
+                                             , exclusion_plan=self.public_doc_exclusion_plans_with_mapped.get(enriched_entity['entity_type'])
+                                             , refresh_relative_fields=transformer.refresh_relative_fields)
+
+    # N.B. This method assumes the state of the 'entity' argument has been processed by the
+    #      _enrich_entity() function. The enriched entity is not modified, and the public document
+    #      shares the values it does not change with it, like the document of _generate_doc().
+    def _generate_public_doc(self, entity, index_group:str, return_type='json'):
+        logger.info(f"Start executing _generate_public_doc() for {entity['entity_type']}"
+                    f" of uuid: {entity['uuid']}"
+                    f" for the {index_group} index group.")
+
+        entity = dict(entity)
+        self._remove_unpublished_next_revision(entity)
+
         entity['descendants'] = list(filter(self.is_public, entity['descendants']))
         
         if index_group in self.TRANSFORMERS:
             entity['immediate_descendants'] = list(filter(self.is_public, entity['immediate_descendants']))
+        else:
+            entity.pop('immediate_ancestors', None)
+            entity.pop('immediate_descendants', None)
 
         ig_doc_fields = INDEX_GROUP_PORTAL_DOC_FIELDS if index_group in self.TRANSFORMERS else INDEX_GROUP_ENTITIES_DOC_FIELDS
         unretained_key_list = [k for k, v in ig_doc_fields.items() if v != PropertyRetentionEnum.ES_DOC]
         
         # Remove fields explicitly marked for excluded_properties_from_public_response per entity type in
         # the provenance_schema.yaml of the entity-api.
-        if entity['entity_type'] in self.public_doc_exclusion_dict:
-            self._remove_field_from_dict(a_dict=entity,
-                                         obj_to_remove=self.public_doc_exclusion_dict[entity['entity_type']])
+        if entity['entity_type'] in self.public_doc_exclusion_plans:
+            entity = self.public_doc_exclusion_plans[entity['entity_type']].without(entity)
         
-        # Because _generate_doc() left some fields on the entity which should not be a part of the
-        # ElasticSearch document, but which were needed for calculations prior to now, remove them before
-        # returning the public document contents.
-        for top_level_field in {'ancestors', 'immediate_ancestors', 'descendants', 'immediate_descendants'}:
-            if top_level_field in entity:
-                for field_of_top_level_field in unretained_key_list:
-                    remove_specific_key_entry(obj=entity[top_level_field],
-                                              key_to_remove=field_of_top_level_field)
+        self._strip_unretained_relative_fields(doc_entity=entity
+                                               , unretained_key_list=unretained_key_list
+                                               , for_transformer=index_group in self.TRANSFORMERS)
 
         logger.info(f"Finished executing _generate_public_doc() for {entity['entity_type']} of uuid: {entity['uuid']}")
 
         logger.info(f"Finished executing _generate_public_doc() for {entity['entity_type']}"
                     f" of uuid: {entity['uuid']}"
                     f" for the {index_group} index group.")
-        return json.dumps(entity)
+        return json_codec.dumps(entity) if return_type == 'json' else entity
         
     """
     Retrieves fields designated in the provenance schema yaml under 
@@ -1898,43 +2372,26 @@ class Translator(TranslatorInterface):
             excluded_fields.extend(exclude_list)
         return excluded_fields
 
-    # Remove a string field from a dictionary, or call recursively if
-    # the object passed in is a dict or list rather than a str.
-    def _remove_field_from_dict(self, a_dict:dict, obj_to_remove):
-        # Most of the code of this method is designed to work with a dict, so if
-        # given a list instead, apply obj_to_remove to each element of the list
-        if isinstance(a_dict, list):
-            # a_dict will shift during recursion, which allows assignment. But preserve
-            # pointing at the list passed in, so it can be restored after processing each
-            # element of the list
-            original_a_dict = a_dict
-            for list_entry in a_dict:
-                list_entry = self._remove_field_from_dict(  a_dict=list_entry
-                                                            , obj_to_remove=obj_to_remove)
-            a_dict = original_a_dict
-        elif isinstance(obj_to_remove, str):
-            if obj_to_remove in a_dict:
-                a_dict.pop(obj_to_remove)
-        elif isinstance(obj_to_remove, list):
-            for obj in obj_to_remove:
-                # Recursively remove each element in the list
-                a_dict = self._remove_field_from_dict(  a_dict=a_dict
-                                                        , obj_to_remove=obj)
-        elif isinstance(obj_to_remove, dict):
-            for k, v in obj_to_remove.items():
-                # Recursively process the value for each dictionary key
-                if k in a_dict:
-                    a_dict[k] = self._remove_field_from_dict(  a_dict=a_dict[k]
-                                                            , obj_to_remove=v)
-        else:
-            logger.error(f"Unable to process obj_to_remove.type()={obj_to_remove.type()}")
-            raise Exception('Error generating public document. See logs.')
-        return a_dict
-
     # This method is supposed to only retrieve Dataset|Donor|Sample
     # The Collection and Upload are handled by separate calls
     # The returned data can either be an entity dict or a list of uuids (when `url_property` parameter is specified)
     def call_entity_api(self, entity_id, endpoint_base, endpoint_suffix=None, url_property=None):
+        # The resulting data can be an entity dict or a list (when `url_property` parameter is specified)
+        content = self._get_entity_api_response(entity_id=entity_id
+                                             , endpoint_base=endpoint_base
+                                             , endpoint_suffix=endpoint_suffix
+                                             , url_property=url_property).content
+        return json_codec.loads(content)
+
+    # Retrieve the document of an entity, from the entity document cache of the current reindex run
+    # when it has already been fetched. Each call returns a newly decoded dict the caller may modify.
+    def get_entity_document(self, entity_id):
+        content = self.document_cache.get_or_load(entity_id
+                                                  , lambda: self._get_entity_api_response(entity_id=entity_id
+                                                                                          , endpoint_base='documents').content)
+        return json_codec.loads(content)
+
+    def _get_entity_api_response(self, entity_id, endpoint_base, endpoint_suffix=None, url_property=None):
         logger.info(f"Start executing call_entity_api() on uuid: {entity_id}")
 
         url = f"{self.entity_api_url}/{endpoint_base}/{entity_id}"
@@ -1943,7 +2400,7 @@ class Translator(TranslatorInterface):
         if url_property:
             url = f"{url}?property={url_property}"
 
-        response = requests.get(url, headers=self.request_headers, verify=False)
+        response = self.http_client.get(url, headers=self.request_headers, verify=False)
 
         if response.status_code != 200:
             msg = f"call_entity_api() failed to get entity of uuid {entity_id} via entity-api"
@@ -1967,8 +2424,7 @@ class Translator(TranslatorInterface):
 
         logger.info(f"Finished executing call_entity_api() on uuid: {entity_id}")
 
-        # The resulting data can be an entity dict or a list (when `url_property` parameter is specified)
-        return response.json()
+        return response
 
     def get_collection_doc(self, entity_id):
         logger.info(f"Start executing get_collection_doc() on uuid: {entity_id}")
@@ -1978,7 +2434,7 @@ class Translator(TranslatorInterface):
         # - no token at all
         # Here we do NOT send over the token
         url = self.entity_api_url + "/documents/" + entity_id
-        response = requests.get(url, headers=self.request_headers, verify=False)
+        response = self.http_client.get(url, headers=self.request_headers, verify=False)
 
         if response.status_code != 200:
             msg = f"get_collection_doc() failed to get entity of uuid {entity_id} via entity-api"
@@ -2072,7 +2528,7 @@ class Translator(TranslatorInterface):
         target_url = f"{self._ontology_api_base_url}{self.ONTOLOGY_API_ORGAN_TYPES_ENDPOINT}"
 
         # Disable ssl certificate verification, and use the read-only ontology-api without authentication.
-        response = requests.get(url=target_url, verify=False)
+        response = self.http_client.get(url=target_url, verify=False)
 
         # Invoke .raise_for_status(), an HTTPError will be raised with certain status codes
         response.raise_for_status()
@@ -2097,8 +2553,29 @@ class Translator(TranslatorInterface):
 # This approach is different from the live /reindex-all PUT call
 # It'll delete all the existing indices and recreate then then index everything
 
-def reindex_entity_queued_wrapper(entity_id, token, index_override=None):
-    indices = index_override if index_override else config['INDICES']
+# Translators built for queued reindex jobs, kept for the life of the queue worker process.
+# Building a Translator fetches the organ types from ontology-api, downloads and parses the
+# entity-api provenance_schema.yaml, and imports the transformers, so a job should only pay
+# that cost when no Translator for its (indices, token) pair has been built yet.
+_queued_translators = {}
+_queued_translators_lock = threading.Lock()
+
+def _queued_translator_key(indices, token):
+    # index_override arrives as a dict, so key on its canonical JSON form.
+    return json.dumps(indices, sort_keys=True, default=str), token
+
+def get_queued_translator(indices, token):
+    ttl_seconds = app.config.get('QUEUED_TRANSLATOR_TTL_SECONDS', 3600)
+    max_translators = app.config.get('QUEUED_TRANSLATOR_MAX_ENTRIES', 4)
+    key = _queued_translator_key(indices, token)
+
+    with _queued_translators_lock:
+        translator = _cached_queued_translator(key, ttl_seconds)
+    if translator is not None:
+        return translator
+
+    # Built outside the lock, so jobs for other (indices, token) pairs do not wait on the
+    # ontology-api and provenance_schema.yaml calls of this one.
     translator = Translator(
         indices=indices,
         app_client_id=app.config['APP_CLIENT_ID'],
@@ -2106,7 +2583,90 @@ def reindex_entity_queued_wrapper(entity_id, token, index_override=None):
         token=token,
         ontology_api_base_url=app.config['ONTOLOGY_API_BASE_URL']
     )
-    translator.reindex_entity_queued(entity_id)
+    with _queued_translators_lock:
+        # Another job may have built one for the same pair meanwhile, so keep that one.
+        cached = _cached_queued_translator(key, ttl_seconds)
+        if cached is not None:
+            return cached
+        # Drop the oldest Translators first, e.g. those built with tokens no longer used.
+        while len(_queued_translators) >= max_translators:
+            oldest_key = min(_queued_translators, key=lambda k: _queued_translators[k][1])
+            del _queued_translators[oldest_key]
+        _queued_translators[key] = (translator, time.monotonic())
+        return translator
+
+# Call with _queued_translators_lock held.
+def _cached_queued_translator(key, ttl_seconds):
+    cached = _queued_translators.get(key)
+    if cached is None:
+        return None
+    translator, created_at = cached
+    if time.monotonic() - created_at < ttl_seconds:
+        return translator
+    # Expired, so the organ types and exclusion fields get refreshed too.
+    logger.info("Cached Translator for queued reindex jobs expired, building a new one.")
+    del _queued_translators[key]
+    return None
+
+def invalidate_queued_translators(token=None):
+    # Forget the cached Translators built with token, or all of them if token is None.
+    with _queued_translators_lock:
+        for key in list(_queued_translators.keys()):
+            if token is None or key[1] == token:
+                del _queued_translators[key]
+
+# Entities with a reindex job waiting in the queue, tracked in the Redis of the job queue.
+# None when not running in JOB_QUEUE_MODE.
+_pending_reindex_set = None
+_pending_reindex_set_lock = threading.Lock()
+
+def get_pending_reindex_set():
+    global _pending_reindex_set
+    if not app.config.get('JOB_QUEUE_MODE', False):
+        return None
+    if _pending_reindex_set is None:
+        with _pending_reindex_set_lock:
+            if _pending_reindex_set is None:
+                redis_client = Redis(host=app.config.get('REDIS_HOST', 'localhost')
+                                     , port=int(app.config.get('REDIS_PORT', 6379))
+                                     , db=int(app.config.get('REDIS_DB', 0))
+                                     , password=app.config.get('REDIS_PASSWORD'))
+                _pending_reindex_set = PendingReindexSet(redis_client=redis_client
+                                                         , ttl_seconds=app.config.get('PENDING_REINDEX_TTL_SECONDS', 86400))
+    return _pending_reindex_set
+
+def get_indices_signature(index_override=None):
+    # Identifies the indices a queued job writes to, so reindexes of the same entity into
+    # different indices, e.g. fresh indices being filled, are tracked separately.
+    if not index_override:
+        return 'default'
+    return hashlib.sha1(json.dumps(index_override, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def reindex_entity_queued_wrapper(entity_id, token, index_override=None, pending_generation=None):
+    pending_reindex_set = get_pending_reindex_set()
+    if pending_reindex_set is not None:
+        try:
+            if not pending_reindex_set.release(entity_id=entity_id
+                                               , indices_signature=get_indices_signature(index_override)
+                                               , generation=pending_generation):
+                logger.info(f"Skipping queued reindex of {entity_id}, superseded by a job enqueued with a more urgent priority.")
+                return
+        except RedisError as re:
+            logger.warning(f"Unable to clear the pending reindex of {entity_id}, reindexing anyway. re={str(re)}")
+
+    indices = index_override if index_override else config['INDICES']
+    translator = get_queued_translator(indices=indices, token=token)
+    # Keep only the failures of this job, rather than those of every job the cached Translator has run.
+    translator.failed_entity_api_calls = []
+    translator.failed_entity_ids = []
+    try:
+        translator.reindex_entity_queued(entity_id)
+    except requests.exceptions.HTTPError as he:
+        # A rejected token will be rejected for every later job too, so stop reusing
+        # the Translator built with it.
+        if he.response is not None and he.response.status_code in [401, 403]:
+            invalidate_queued_translators(token=token)
+        raise
 
 if __name__ == "__main__":
     # Specify the absolute path of the instance folder and use the config file relative to the instance path
@@ -2152,38 +2712,42 @@ if __name__ == "__main__":
 
     start = time.time()
 
-    if (len(sys.argv) == 3) and (sys.argv[2] == 'collections'):
-        logger.info("############# Collections reindex via script started #############")
+    try:
+        if (len(sys.argv) == 3) and (sys.argv[2] == 'collections'):
+            logger.info("############# Collections reindex via script started #############")
 
-        # Do NOT erase any indices, just reindex all collections
-        translator.translate_all_collections()
+            # Do NOT erase any indices, just reindex all collections
+            translator.translate_all_collections()
 
-        # Show the failed entity-api calls and the uuids
-        if translator.failed_entity_api_calls:
-            logger.info(f"{len(translator.failed_entity_api_calls)} entity-api calls failed")
-            print(*translator.failed_entity_api_calls, sep = "\n")
-     
-        if translator.failed_entity_ids:
-            logger.info(f"{len(translator.failed_entity_ids)} entity ids failed")
-            print(*translator.failed_entity_ids, sep = "\n")
-
-        end = time.time()
-        logger.info(f"############# ollections reindex via script completed. Total time used: {end - start} seconds. #############")
-    else:
-        logger.info("############# Full index via script started #############")
-
-        # Erase all the indices first then index all
-        translator.delete_and_recreate_indices()
-        translator.translate_all()
-
-        # Show the failed entity-api calls and the uuids
-        if translator.failed_entity_api_calls:
-            logger.info(f"{len(translator.failed_entity_api_calls)} entity-api calls failed")
-            print(*translator.failed_entity_api_calls, sep = "\n")
+            # Show the failed entity-api calls and the uuids
+            if translator.failed_entity_api_calls:
+                logger.info(f"{len(translator.failed_entity_api_calls)} entity-api calls failed")
+                print(*translator.failed_entity_api_calls, sep = "\n")
      
-        if translator.failed_entity_ids:
-            logger.info(f"{len(translator.failed_entity_ids)} entity ids failed")
-            print(*translator.failed_entity_ids, sep = "\n")
+            if translator.failed_entity_ids:
+                logger.info(f"{len(translator.failed_entity_ids)} entity ids failed")
+                print(*translator.failed_entity_ids, sep = "\n")
 
-        end = time.time()
-        logger.info(f"############# Full index via script completed. Total time used: {end - start} seconds. #############")
+            end = time.time()
+            logger.info(f"############# ollections reindex via script completed. Total time used: {end - start} seconds. #############")
+        else:
+            logger.info("############# Full index via script started #############")
+
+            # Erase all the indices first then index all
+            translator.delete_and_recreate_indices()
+            translator.translate_all()
+
+            # Show the failed entity-api calls and the uuids
+            if translator.failed_entity_api_calls:
+                logger.info(f"{len(translator.failed_entity_api_calls)} entity-api calls failed")
+                print(*translator.failed_entity_api_calls, sep = "\n")
+     
+            if translator.failed_entity_ids:
+                logger.info(f"{len(translator.failed_entity_ids)} entity ids failed")
+                print(*translator.failed_entity_ids, sep = "\n")
+
+            end = time.time()
+            logger.info(f"############# Full index via script completed. Total time used: {end - start} seconds. #############")
+    finally:
+        # Write whatever documents are still buffered, even when the reindex failed part way
+        translator.bulk_writer.close()